@@ -0,0 +1,99 @@
+"""End-to-end fetch throughput of ESIOSLoader against the local ESIOS stub server (synthDataGen.common.stubEsios).
+
+For every combination of fetch strategy and number of workers, the same windows are loaded through ESIOSLoader, with the server
+answering after the given latency (and, optionally, with a rate limit and injected errors). The time, the HTTP requests made and
+the values per second are reported and can be written to a JSON file.
+
+Usage: python benchmarks/esiosThroughput.py --years 10 --windows 4 --latency 0.05 --workers 1 4 8 --strategies perYear coalesced
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+rootDir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootDir)
+
+from synthDataGen.controller import ESIOSLoader
+from synthDataGen.common import bibliotecaEsios
+from synthDataGen.common.stubEsios import ServidorEsiosSimulado
+
+def writeParamsFile(fileName: str, endPoint: str, indicador: int | List[int], timeTrunc: str, maxWorkers: int, fetchStrategy: str) -> str:
+    params: Dict = {"ESIOS_params": {"keysFileDir": "settings/", "keysFileName": "ficheroDeClaves.json",
+                                     "indicador": indicador, "time_trunc": timeTrunc, "endPoint": endPoint,
+                                     "maxWorkers": maxWorkers, "requestsPerSecond": None, "cacheDir": None,
+                                     "fetchStrategy": fetchStrategy, "maxPointsPerRequest": 10000}}
+
+    with open(fileName, "w") as jsonFile:
+        json.dump(params, jsonFile, indent = 4)
+
+    return fileName
+
+def measureFetch(loader: ESIOSLoader, server: ServidorEsiosSimulado, initialYear: int, windows: List[Tuple[datetime, int]]) -> Dict:
+    """Loads the windows and returns the seconds spent, the HTTP requests made (retries included) and the values served per second.
+
+    :param ESIOSLoader loader: the loader, pointing to the server.
+    :param ServidorEsiosSimulado server: the stub server.
+    :param int initialYear: first year considered for the request.
+    :param list windows: list of (initDatetime, hoursAhead) tuples.
+    :returns dict:
+    """
+    server.reinicia_estadisticas()
+    bibliotecaEsios.ESTADISTICAS.reinicia()
+
+    start: float = time.perf_counter()
+    frames = loader.getDataForWindows(initialYear, windows)
+    seconds: float = time.perf_counter() - start
+
+    served: Dict = server.estadisticas
+    return {"seconds": seconds, "requests": served["peticiones"], "retries": bibliotecaEsios.ESTADISTICAS.resumen["reintentos"],
+            "valuesServed": served["valores"], "valuesPerSecond": served["valores"] / seconds, "cells": int(sum(frame.size for frame in frames))}
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description = "Measures the fetch throughput of ESIOSLoader against the local ESIOS stub server.")
+    parser.add_argument("--years", type = int, default = 10, help = "years back from the current one")
+    parser.add_argument("--windows", type = int, default = 1, help = "windows loaded at once (one per day from March 1)")
+    parser.add_argument("--hoursAhead", type = int, default = 24 * 7)
+    parser.add_argument("--indicators", type = int, nargs = "+", default = [10211])
+    parser.add_argument("--timeTrunc", default = "hour")
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 4])
+    parser.add_argument("--strategies", nargs = "+", default = ["perYear", "coalesced"])
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds the server waits before answering every request")
+    parser.add_argument("--latencyPerValue", type = float, default = 0.0, help = "extra seconds per value served")
+    parser.add_argument("--requestsPerSecond", type = float, default = None, help = "rate limit of the server")
+    parser.add_argument("--errorRate", type = float, default = 0.0, help = "share of requests answered with a 5xx error")
+    parser.add_argument("--json", dest = "jsonFile", help = "file where the results are written")
+    options = parser.parse_args(args)
+
+    initialYear: int = datetime.now().year - options.years
+    windows: List[Tuple[datetime, int]] = [(datetime(initialYear, 3, 1 + day), options.hoursAhead) for day in range(options.windows)]
+    indicador: int | List[int] = options.indicators if len(options.indicators) > 1 else options.indicators[0]
+
+    # Retries are part of what is measured, but without the production backoff
+    bibliotecaEsios.ESPERA_BASE_SEGUNDOS = 0.01
+
+    results: List[Dict] = []
+    with ServidorEsiosSimulado(latencia_segundos = options.latency, latencia_por_valor = options.latencyPerValue,
+                               peticiones_por_segundo = options.requestsPerSecond, tasa_errores = options.errorRate) as server, \
+         tempfile.TemporaryDirectory() as workDir:
+        for strategy in options.strategies:
+            for workers in options.workers:
+                paramsFile: str = writeParamsFile(os.path.join(workDir, "params.json"), server.end_point, indicador, options.timeTrunc, workers, strategy)
+
+                result: Dict = {"strategy": strategy, "workers": workers, **measureFetch(ESIOSLoader(paramsFile), server, initialYear, windows)}
+                results.append(result)
+
+                print(f"{strategy:<10} {workers:3d} workers  {result['seconds']:8.2f} s  {result['requests']:5d} requests  {result['retries']:4d} retries  {result['valuesPerSecond']:10.0f} values/s", flush = True)
+
+    if options.jsonFile:
+        with open(options.jsonFile, "w") as jsonFile:
+            json.dump({"config": vars(options), "results": results}, jsonFile, indent = 2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Import-time budget of every public module.
+
+Every module is imported in a fresh interpreter, after numpy and pandas (which every module needs anyway), and the time spent on
+its own import is compared with its budget. The heavy optional dependencies (scipy, requests) must not be loaded by the import at all:
+they are loaded on first use.
+
+Usage: python benchmarks/importTime.py [--repeat N] [--json results.json]
+The exit code is 1 if any module exceeds its budget or loads a deferred dependency.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List
+
+# Milliseconds on top of numpy and pandas
+importBudgets: Dict[str, float] = {
+    "synthDataGen.controller": 150,
+    "synthDataGen.adjustments": 100,
+    "synthDataGen.utils": 100,
+    "synthDataGen.pipeline": 250,
+    "synthDataGen.instrumentation": 50,
+    "synthDataGen.common.bibliotecaEsios": 100,
+    "synthDataGen.common.bibliotecaGeneral": 50,
+    "synthDataGen.common.cacheEsios": 50,
+    "synthDataGen.common.almacenEsios": 50,
+    "synthDataGen.common.stubEsios": 50,
+}
+
+deferredModules: List[str] = ["scipy", "requests"]
+
+_measureCode: str = """
+import sys, time, json
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+def measureImport(module: str, repeat: int = 5) -> Dict:
+    """Imports the module in 'repeat' fresh interpreters and returns the best time, in milliseconds, and the deferred modules it loaded.
+
+    :param str module: the dotted name of the module.
+    :param int repeat: the number of fresh interpreters to measure.
+    :returns dict:
+    """
+    rootDir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment: Dict = dict(os.environ, PYTHONPATH = os.pathsep.join(filter(None, [rootDir, os.environ.get("PYTHONPATH")])))
+
+    runs: List[Dict] = []
+    for _ in range(repeat):
+        output: str = subprocess.run([sys.executable, "-c", _measureCode.format(module = module, deferred = deferredModules)],
+                                     env = environment, check = True, capture_output = True, text = True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {"ms": min(run["ms"] for run in runs), "loaded": sorted(set(name for run in runs for name in run["loaded"]))}
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description = "Checks the import time of every public module against its budget.")
+    parser.add_argument("--repeat", type = int, default = 5, help = "fresh interpreters per module (the best time is kept)")
+    parser.add_argument("--json", dest = "jsonFile", help = "file where the results are written")
+    options = parser.parse_args(args)
+
+    results: Dict[str, Dict] = {}
+    failed: bool = False
+    for module, budget in importBudgets.items():
+        result: Dict = measureImport(module, options.repeat)
+        result["budget"] = budget
+        result["ok"] = result["ms"] <= budget and not result["loaded"]
+        results[module] = result
+        failed |= not result["ok"]
+
+        print(f"{module:<40} {result['ms']:8.1f} ms  (budget {budget:6.1f} ms)  {'ok' if result['ok'] else 'FAILED'}" +
+              (f"  loads {', '.join(result['loaded'])}" if result["loaded"] else ""))
+
+    if options.jsonFile:
+        with open(options.jsonFile, "w") as jsonFile:
+            json.dump(results, jsonFile, indent = 2)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
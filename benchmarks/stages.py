@@ -0,0 +1,204 @@
+"""Time and peak memory of every stage of the README workflow on a synthetic dataset.
+
+The stages are the load (LocalDFLoader.getDataFromSource, with and without its cache), the adjustment by year, the upsampling, the
+downsampling and the sampling, plus the whole README workflow and the same workflow as a lazy Pipeline. Every stage is timed
+'repeat' times (the best time is kept) and then run once more under tracemalloc to get its peak memory.
+
+The results are written to a JSON file, and a previous one can be given to compare with, so that regressions between versions show up.
+
+Usage:
+    python benchmarks/stages.py --years 30 --columns 2 --frequency H --output results.json
+    python benchmarks/stages.py --years 30 --columns 2 --frequency H --compare results.json
+The exit code is 1 if, when comparing, any stage is slower than the given tolerance.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+rootDir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootDir)
+
+import numpy as np
+import pandas as pd
+
+from syntheticData import generateCSV, writeParamsFile, getColumnNames
+from synthDataGen.controller import LocalDFLoader
+from synthDataGen.adjustments import FactorByYear, ChangeResolution
+from synthDataGen.utils import Sampling
+from synthDataGen.pipeline import Pipeline
+
+# The options defining the dataset and the work done, which must match for two runs to be comparable
+workloadOptions: List[str] = ["years", "columns", "frequency", "allColumns", "initialYear", "hoursAhead", "upsample", "downsample", "samples", "seed"]
+
+def measure(function: Callable, setup: Callable = None, repeat: int = 3) -> Dict:
+    """Runs 'function(*setup())' 'repeat' times and returns the best and every time, in seconds, and the peak memory of one more run, in MB.
+    The setup is neither timed nor traced.
+
+    :param callable function: the stage to be measured.
+    :param callable setup: returns the tuple of arguments of the function.
+    :param int repeat: the number of timed runs.
+    :returns dict:
+    """
+    setup = setup or tuple
+
+    runs: List[float] = []
+    for _ in range(repeat):
+        args: Tuple = setup()
+        start: float = time.perf_counter()
+        function(*args)
+        runs.append(time.perf_counter() - start)
+
+    # tracemalloc slows allocations down, so the peak memory comes from a separate run
+    args = setup()
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak: int = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(runs), "runs": runs, "peakMB": peak / 2**20}
+
+def getMetadata() -> Dict:
+    try:
+        commit: str = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = rootDir, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"date": datetime.now().isoformat(timespec = "seconds"), "commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "machine": platform.machine(), "processor": platform.processor()}
+
+def runStages(options: argparse.Namespace, workDir: str) -> Dict[str, Dict]:
+    csvFile: str = generateCSV(os.path.join(workDir, "data.csv"), options.years, options.columns, options.frequency, options.initialYear, options.seed)
+    columnToAnalyze: str | List[str] = getColumnNames(options.columns) if options.allColumns else "var0"
+
+    paramsFile: str = writeParamsFile(os.path.join(workDir, "params.json"), csvFile, columnToAnalyze, useCache = False)
+    cachedParamsFile: str = writeParamsFile(os.path.join(workDir, "cachedParams.json"), csvFile, columnToAnalyze, useCache = True, cacheDir = os.path.join(workDir, "cache"))
+
+    initDatetime: datetime = datetime(options.initialYear + options.years - 1, 3, 1)
+    window: Tuple = (options.initialYear, initDatetime, options.hoursAhead)
+    adjustmentsDict: Dict[int, int] = {year: 2 for year in range(options.initialYear, options.initialYear + options.years)}
+
+    def load(paramsFileName: str) -> pd.DataFrame:
+        return LocalDFLoader(paramsFileName).getDataFromSource(*window)
+
+    def adjust(df: pd.DataFrame) -> pd.DataFrame:
+        with contextlib.redirect_stdout(None):
+            return FactorByYear.run(df, adjustmentsDict)
+
+    def upsample(df: pd.DataFrame) -> pd.DataFrame:
+        return ChangeResolution.upsample(df, options.upsample, "polynomial", order = 2)
+
+    def downsample(df: pd.DataFrame) -> pd.DataFrame:
+        return ChangeResolution.downsample(df, options.downsample, "mean")
+
+    def sample(df: pd.DataFrame) -> pd.DataFrame:
+        return Sampling.getSamples(df, options.samples, "truncnorm", seed = options.seed)
+
+    def readmeWorkflow() -> pd.DataFrame:
+        return sample(downsample(upsample(adjust(load(paramsFile)))))
+
+    def lazyPipeline() -> pd.DataFrame:
+        pipeline: Pipeline = Pipeline(LocalDFLoader(paramsFile), options.initialYear).window(initDatetime, options.hoursAhead)
+        pipeline = pipeline.adjustByYear(adjustmentsDict).upsample(options.upsample, "polynomial", order = 2).downsample(options.downsample, "mean")
+
+        return pipeline.sample(options.samples, "truncnorm", seed = options.seed).collect()
+
+    # Every stage gets the output of the previous one, computed once outside the measures
+    loaded: pd.DataFrame = load(paramsFile)
+    load(cachedParamsFile)
+    upsampled: pd.DataFrame = upsample(loaded)
+    downsampled: pd.DataFrame = downsample(upsampled)
+
+    stages: Dict[str, Tuple[Callable, Callable]] = {
+        "load": (load, lambda: (paramsFile,)),
+        "loadCached": (load, lambda: (cachedParamsFile,)),
+        "adjustByYear": (adjust, lambda: (loaded.copy(),)),
+        "upsample": (upsample, lambda: (loaded,)),
+        "downsample": (downsample, lambda: (upsampled,)),
+        "sample": (sample, lambda: (downsampled,)),
+        "readmeWorkflow": (readmeWorkflow, None),
+        "lazyPipeline": (lazyPipeline, None),
+    }
+
+    results: Dict[str, Dict] = {}
+    for name, (function, setup) in stages.items():
+        if options.stages and name not in options.stages:
+            continue
+
+        results[name] = measure(function, setup, options.repeat)
+        print(f"{name:<16} {results[name]['seconds']:10.4f} s  {results[name]['peakMB']:10.1f} MB", flush = True)
+
+    return results
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> bool:
+    """Prints the ratio between every stage and the same one in 'baseline'. Returns whether any of them is slower than 1 + 'tolerance' times.
+
+    :param dict results: the stages of the current run.
+    :param dict baseline: the stages of a previous run.
+    :param float tolerance: the relative slowdown allowed, e.g. 0.2 for a 20%.
+    :returns bool:
+    """
+    regressed: bool = False
+
+    print(f"\n{'stage':<16} {'baseline s':>12} {'current s':>12} {'ratio':>8} {'baseline MB':>12} {'current MB':>12}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        ratio: float = result["seconds"] / baseline[name]["seconds"] if baseline[name]["seconds"] else float("inf")
+        slower: bool = ratio > 1 + tolerance
+        regressed |= slower
+
+        print(f"{name:<16} {baseline[name]['seconds']:12.4f} {result['seconds']:12.4f} {ratio:8.2f} {baseline[name]['peakMB']:12.1f} {result['peakMB']:12.1f}" + ("  SLOWER" if slower else ""))
+
+    return regressed
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description = "Times every stage of the README workflow on a synthetic dataset.")
+    parser.add_argument("--years", type = int, default = 20, help = "years of data of the synthetic CSV file")
+    parser.add_argument("--columns", type = int, default = 1, help = "variables (columns) of the synthetic CSV file")
+    parser.add_argument("--frequency", default = "H", help = "resolution of the synthetic CSV file, e.g. H or 15T")
+    parser.add_argument("--allColumns", action = "store_true", help = "load every column at once instead of only the first one")
+    parser.add_argument("--initialYear", type = int, default = 2000)
+    parser.add_argument("--hoursAhead", type = int, default = 24 * 30, help = "length of the loaded window")
+    parser.add_argument("--upsample", default = "5T", help = "frequency of the upsampling stage")
+    parser.add_argument("--downsample", default = "2H", help = "frequency of the downsampling stage")
+    parser.add_argument("--samples", type = int, default = 5000, help = "number of samples of the sampling stage")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--repeat", type = int, default = 3, help = "timed runs per stage (the best time is kept)")
+    parser.add_argument("--stages", nargs = "*", help = "stages to run. All of them by default")
+    parser.add_argument("--output", help = "JSON file where the results are written")
+    parser.add_argument("--compare", help = "JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.2, help = "relative slowdown allowed when comparing")
+    options = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as workDir:
+        results: Dict[str, Dict] = runStages(options, workDir)
+
+    if options.output:
+        with open(options.output, "w") as jsonFile:
+            json.dump({"metadata": getMetadata(), "config": vars(options), "stages": results}, jsonFile, indent = 2)
+
+    if options.compare:
+        with open(options.compare) as jsonFile:
+            baseline: Dict = json.load(jsonFile)
+
+        if any(baseline["config"].get(key) != getattr(options, key) for key in workloadOptions):
+            print("\nWarning: the baseline was run with a different configuration.")
+
+        return 1 if compare(results, baseline["stages"], options.tolerance) else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
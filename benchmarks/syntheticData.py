@@ -0,0 +1,98 @@
+"""Synthetic datasets for the benchmarks.
+
+Writes CSV files with the layout LocalDFLoader expects (an unnamed index column, a datetime column and one column per variable) of
+any number of years, variables and resolution, together with the matching input parameters file.
+
+Usage: python benchmarks/syntheticData.py out.csv --years 30 --columns 4 --frequency 15T
+"""
+import os
+import sys
+import json
+import argparse
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+datetimeColumnName: str = "datetime"
+datetimeFormat: str = "%Y-%m-%dT%H:%M:%S"
+
+def getColumnNames(columns: int) -> List[str]:
+    return ["var" + str(column) for column in range(columns)]
+
+def generateCSV(fileName: str, years: int = 10, columns: int = 1, frequency: str = "H", initialYear: int = 2000, seed: int = 0) -> str:
+    """Writes a CSV file of 'years' years of data from January 1 of 'initialYear' on, one year at a time so that memory does not grow with the size of the file.
+    Every column is a daily and yearly seasonal profile with its own level plus gaussian noise, so that the values look like a meteorological series.
+
+    :param str fileName: the path of the CSV file to be written. It is overwritten if it already exists.
+    :param int years: the number of years of data.
+    :param int columns: the number of variables (columns), named var0, var1...
+    :param str frequency: the resolution of the data, as a pandas frequency. For instance "H" or "15T".
+    :param int initialYear: the first year of data.
+    :param int seed: the seed of the noise.
+    :returns str: the name of the written file.
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    names: List[str] = getColumnNames(columns)
+    levels: np.ndarray = 10 + 5 * np.arange(columns)
+
+    rowOffset: int = 0
+    for year in range(initialYear, initialYear + years):
+        index: pd.DatetimeIndex = pd.date_range(str(year), str(year + 1), freq = frequency, inclusive = "left")
+
+        dayFraction: np.ndarray = ((index.hour * 60 + index.minute) / 1440).to_numpy()
+        yearFraction: np.ndarray = ((index.dayofyear - 1) / 365).to_numpy()
+        profile: np.ndarray = 1 + 0.3 * np.sin(2 * np.pi * dayFraction) + 0.2 * np.cos(2 * np.pi * yearFraction)
+
+        values: np.ndarray = levels * profile[:, np.newaxis] + rng.normal(0, 1, (len(index), columns))
+
+        df: pd.DataFrame = pd.DataFrame(values, columns = names, index = pd.RangeIndex(rowOffset, rowOffset + len(index)))
+        df.insert(0, datetimeColumnName, index.strftime(datetimeFormat))
+
+        first: bool = year == initialYear
+        df.to_csv(fileName, mode = "w" if first else "a", header = first)
+        rowOffset += len(index)
+
+    return fileName
+
+def writeParamsFile(fileName: str, csvFileName: str, columnToAnalyze: str | List[str] = "var0", useCache: bool = False, cacheDir: str = None) -> str:
+    """Writes the input parameters file of a LocalDFLoader reading 'csvFileName'.
+
+    :param str fileName: the path of the JSON file to be written.
+    :param str csvFileName: the path of the CSV file, as written by generateCSV(...).
+    :param str|list columnToAnalyze: the variable, or list of variables, to load.
+    :param bool useCache: whether the loader keeps a cache of the pivoted data.
+    :param str cacheDir: the directory of that cache. By default, next to the CSV file.
+    :returns str: the name of the written file.
+    """
+    params: dict = {"localDF_params": {"dataFrameDir": os.path.dirname(os.path.abspath(csvFileName)),
+                                       "dataframeFileName": os.path.basename(csvFileName),
+                                       "columnToAnalyze": columnToAnalyze,
+                                       "skipFirstColumn": True,
+                                       "datetimeColumnName": datetimeColumnName,
+                                       "datetimeFormat": datetimeFormat,
+                                       "useCache": useCache,
+                                       "cacheDir": cacheDir}}
+
+    with open(fileName, "w") as jsonFile:
+        json.dump(params, jsonFile, indent = 4)
+
+    return fileName
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description = "Writes a synthetic CSV file for LocalDFLoader.")
+    parser.add_argument("fileName")
+    parser.add_argument("--years", type = int, default = 10)
+    parser.add_argument("--columns", type = int, default = 1)
+    parser.add_argument("--frequency", default = "H")
+    parser.add_argument("--initialYear", type = int, default = 2000)
+    parser.add_argument("--seed", type = int, default = 0)
+    options = parser.parse_args(args)
+
+    generateCSV(options.fileName, options.years, options.columns, options.frequency, options.initialYear, options.seed)
+    print(options.fileName, str(os.path.getsize(options.fileName) // 2**20) + " MB")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
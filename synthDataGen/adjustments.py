@@ -1,9 +1,12 @@
 import re
-from typing import Dict, List, Set
+import weakref
+from typing import Callable, Dict, List, Tuple
 
 import pandas as pd
 import numpy as np
 
+from synthDataGen.instrumentation import instrumented
+
 class FactorByYear():
 
     @staticmethod
@@ -16,17 +19,13 @@ class FactorByYear():
             raise Exception("Unable to extract year from literal '" + literal + "'.")
 
     @staticmethod
-    def _getListOfYears(df: pd.DataFrame) -> List[str]:
-        columnNames: List = list(df.columns)
-        
-        years: List = []
-        for columnName in columnNames:
-            year = FactorByYear._extractYearFromStr(columnName)
+    def _getColumnYear(columnName) -> int:
+        # With several variables, the columns are (variable, year) tuples
+        return FactorByYear._extractYearFromStr(columnName[-1] if isinstance(columnName, tuple) else columnName)
 
-            if year not in years:
-                years.append(year)
-            
-        return years
+    @staticmethod
+    def _getListOfYears(df: pd.DataFrame) -> List[str]:
+        return list(dict.fromkeys(int(year) for year in FactorTable._getColumnYears(df.columns)))
 
     @staticmethod
     def _checkDataFrameContiguity(years: List[int]):
@@ -46,6 +45,7 @@ class FactorByYear():
         print("Adjusting years: " + ','.join(map(str, providedAdjustments)))
 
     @staticmethod
+    @instrumented()
     def run(df: pd.DataFrame, adjustmentsDict: Dict = None) -> pd.DataFrame:
         """Performs an anual adjustments on the current dataframe with the provided dictionary.
         If some parameter is not provided, the one from the input file is used by default.
@@ -60,36 +60,148 @@ class FactorByYear():
         FactorByYear._checkDataFrameContiguity(years)
         FactorByYear._checkAdjustmentsDict(years, adjustmentsDict)
 
-        for element in df.columns:
-            year = FactorByYear._extractYearFromStr(element)
+        return FactorTable.apply(df, yearFactors = FactorTable.fromPercentages(adjustmentsDict), inplace = True)
+
+class _IndexCache():
+    """Values derived from the labels of a pandas Index, computed once per Index object and dropped along with it.
+    Indices are immutable, so the cached values never go stale."""
+
+    def __init__(self):
+        self._entries: Dict[int, Tuple[weakref.ref, Dict[str, np.ndarray]]] = {}
+
+    def _drop(self, key: int, reference: weakref.ref):
+        if key in self._entries and self._entries[key][0] is reference:
+            del self._entries[key]
+
+    def get(self, index: pd.Index, name: str, compute: Callable[[pd.Index], np.ndarray]) -> np.ndarray:
+        key: int = id(index)
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0]() is not index:
+            entry = (weakref.ref(index, lambda reference, key = key: self._drop(key, reference)), {})
+            self._entries[key] = entry
+
+        if name not in entry[1]:
+            entry[1][name] = compute(index)
+
+        return entry[1][name]
+
+class FactorTable():
+
+    _labelsCache: _IndexCache = _IndexCache()
+
+    @staticmethod
+    def _getColumnYears(columns: pd.Index) -> np.ndarray:
+        return FactorTable._labelsCache.get(columns, "year", lambda index: np.array([FactorByYear._getColumnYear(label) for label in index], dtype = int))
+
+    @staticmethod
+    def _getRowLabels(index: pd.Index, name: str) -> np.ndarray:
+        if not isinstance(index, pd.DatetimeIndex):
+            raise ValueError("Factors by month or hour need a DatetimeIndex (row names), not a '" + type(index).__name__ + "'.")
+
+        return FactorTable._labelsCache.get(index, name, lambda index: getattr(index, name).to_numpy())
+
+    @staticmethod
+    def _lookup(labels: np.ndarray, factors: Dict[int, float]) -> np.ndarray:
+        """Returns the factor of every label, or 1 for the labels not in the table."""
+        keys: np.ndarray = np.fromiter(factors.keys(), dtype = int, count = len(factors))
+        values: np.ndarray = np.fromiter(factors.values(), dtype = float, count = len(factors))
+
+        order: np.ndarray = np.argsort(keys)
+        keys, values = keys[order], values[order]
+
+        positions: np.ndarray = np.minimum(np.searchsorted(keys, labels), len(keys) - 1)
+
+        return np.where(keys[positions] == labels, values[positions], 1.0)
+
+    @staticmethod
+    def fromPercentages(percentagesDict: Dict[int, float]) -> Dict[int, float]:
+        """Converts a dictionary of percentages (e.g. {2022: 10}, a 10% increase) into one of factors ({2022: 1.1}).
+
+        :param dict percentagesDict: dictionary of percentages by key.
+        :returns dict:
+        """
+        return {key: 1 + percentage / 100 for key, percentage in percentagesDict.items()}
+
+    @staticmethod
+    @instrumented()
+    def apply(df: pd.DataFrame, yearFactors: Dict[int, float] = None, monthFactors: Dict[int, float] = None, hourFactors: Dict[int, float] = None, inplace: bool = False) -> pd.DataFrame:
+        """Multiplies the DataFrame by tables of factors by year (columns), by month and by hour of the day (rows), in a single broadcast multiplication.
+        The factors are multipliers, such as the ones returned by bibliotecaGeneral.calculaCorrecionDePreciosPorIPC(...). FactorTable.fromPercentages(...) converts percentages into factors.
+        The years of the columns, and the months and hours of the rows, are parsed only once per pandas Index and reused by every later call on the same labels.
+
+        :param pandas.DataFrame df: the DataFrame to which the factors should be applied.
+        :param dict yearFactors: dictionary of factors by year. The columns of the years not in it are left as they are.
+        :param dict monthFactors: dictionary of factors by month (1 to 12).
+        :param dict hourFactors: dictionary of factors by hour of the day (0 to 23).
+        :param bool inplace: whether to modify 'df' itself or to return an adjusted copy.
+        :returns pandas.DataFrame:
+        """
+
+        columnFactors: np.ndarray = FactorTable._lookup(FactorTable._getColumnYears(df.columns), yearFactors) if yearFactors else np.ones(len(df.columns))
+
+        rowFactors: np.ndarray = None
+        for name, factors in [("month", monthFactors), ("hour", hourFactors)]:
+            if factors:
+                labelFactors: np.ndarray = FactorTable._lookup(FactorTable._getRowLabels(df.index, name), factors)
+                rowFactors = labelFactors if rowFactors is None else rowFactors * labelFactors
+
+        values: np.ndarray = df.to_numpy(dtype = float) * columnFactors
+
+        if rowFactors is not None:
+            values *= rowFactors[:, np.newaxis]
+
+        if inplace:
+            df.iloc[:, :] = values
+            return df
+
+        # Sharing the Index objects keeps their parsed labels for the next call
+        return pd.DataFrame(values, index = df.index, columns = df.columns)
 
-            if year in adjustmentsDict:
-                df[element] = df[element] * (1 + adjustmentsDict[year] / 100)
-        
-        return df
-    
 class ChangeResolution():
 
     from synthDataGen.common import bibliotecaGeneral
+
+    _indexCache: _IndexCache = _IndexCache()
+
+    # Aggregations computed by downsampleMany(...) with fixed-bin reductions. Any float in (0, 1) is also accepted, as a quantile
+    _binnedAggregations: List[str] = ["count", "sum", "mean", "min", "max", "std", "var", "median"]
     
     @staticmethod
     def _checkFrequencyFormatIsValid(frequency: str):
         if not re.match("\d+(\.\d+)?[DHTS]", frequency):
             raise ValueError("Frequency '" + frequency + "' not valid. It should be an integer followed by a unit ('D': daily, 'H': hourly, 'T': minutely, 'S': secondly). E.g. \"2T\" == and entry for every 2 minutes.")
-        
+
+    @staticmethod
+    def _getIndexSteps(dfIndex) -> Tuple[int, bool]:
+        """Returns the smallest positive step (nanoseconds) between consecutive rows, 0 if there is none, and whether all the steps are equal to it."""
+        def compute(index) -> Tuple[int, bool]:
+            steps: np.ndarray = np.diff(index.asi8)
+            positiveSteps: np.ndarray = steps[steps > 0]
+            step: int = int(positiveSteps.min()) if len(positiveSteps) else 0
+
+            return (step, bool(step) and bool(np.all(steps == step)))
+
+        return ChangeResolution._indexCache.get(dfIndex, "steps", compute)
+
     @staticmethod
     def _getFreqNormalized(dfIndex) -> str:
+        # Inferring the frequency scans the whole index, so it is done once per index
+        return ChangeResolution._indexCache.get(dfIndex, "frequency", ChangeResolution._inferFreqNormalized)
+
+    @staticmethod
+    def _inferFreqNormalized(dfIndex) -> str:
         frequency = pd.infer_freq(dfIndex)
         if not frequency:
-            possibleFreqs: Set = set(np.diff(dfIndex))
-            for freq in possibleFreqs:
-                if freq > 0: frequency = pd.tseries.frequencies.to_offset(pd.Timedelta(freq)).freqstr
+            step, _ = ChangeResolution._getIndexSteps(dfIndex)
+            if step > 0: frequency = pd.tseries.frequencies.to_offset(pd.Timedelta(step)).freqstr
 
         reSult = re.match("([DHTS])", frequency)
         if reSult:
             return "1" + str(reSult.group(1))
 
         return frequency
+
     @staticmethod
     def _checkCoarserDFResolution(df: pd.DataFrame, frequency: str):
         dfFreq: str = ChangeResolution._getFreqNormalized(df.index)
@@ -101,14 +213,17 @@ class ChangeResolution():
             raise ValueError("The provided frequency '" + frequency + "' is of a coarser resolution than the one of the DataFrame ('" + dfFreq + "'). Please, choose a finer one for the data to be upsampled.")
 
     @staticmethod
-    def upsample(df: pd.DataFrame, frequency: str = None, method: str = None, **kwargs) -> pd.DataFrame:
+    @instrumented()
+    def upsample(df: pd.DataFrame, frequency: str = None, method: str = None, engine: str = "direct", **kwargs) -> pd.DataFrame:
         """Interpolates the DataFrame by rows, considering the upsampling frequency (which must be finer-grained), method and spline order for interpolation.
-        It uses the pandas.DataFrame.interpolate(method, splineOrder) method.
+        The "pandas" engine uses the pandas.DataFrame.interpolate(method, splineOrder) method over the reindexed DataFrame. The "direct" one fits the same
+        polynomial or spline once (for all the columns at once with 'polynomial') and evaluates it only on the new rows, giving the same result with far less time and memory.
         If some parameter is not provided, the one from the input file is used by default.
 
         :param pandas.DataFrame df: the DataFrame to which the upsampling should be applied.
         :param int frequency: the required output frequency.
         :param int method: the method by means of which the upsampling will be performed. For 'polynomial' and 'spline' an 'order' must be specified in \*\*kwargs.
+        :param str engine: "direct" (default) or "pandas".
         :param *optional* ``kwargs``: keyword arguments to pass on to the interpolation function.
         :returns pandas.DataFrame:
         """
@@ -121,9 +236,14 @@ class ChangeResolution():
 
         if method in polynomialMethods:
             if "order" in kwargs:
-                order = kwargs["order"]
+                order = kwargs.pop("order")
 
-            return ChangeResolution.bibliotecaGeneral.resampleaDataFrame(df, frequency, method, order)
+            if engine == "direct":
+                return ChangeResolution.bibliotecaGeneral.resampleaDataFrameDirecto(df, frequency, method, order, **kwargs)
+            elif engine == "pandas":
+                return ChangeResolution.bibliotecaGeneral.resampleaDataFrame(df, frequency, method, order)
+            else:
+                raise ValueError("Upsampling engine '" + str(engine) + "' not available. Please choose some: direct, pandas.")
         else:
             raise ValueError("Interpolation method '" + method + "' not implemented. Please choose some: " + ', '.join(acceptedInterpolationMethods) + ".")
     
@@ -138,6 +258,7 @@ class ChangeResolution():
             raise ValueError("The provided frequency '" + frequency + "' is of a finer resolution than the one of the DataFrame ('" + dfFreq + "'). Please, choose a coarser one for the data to be aggregated into.")
 
     @staticmethod
+    @instrumented()
     def downsample(df: pd.DataFrame, frequency: str = None, aggregationFunc = None) -> pd.DataFrame:
         """Aggregates the DataFrame by means of an aggregation function, getting a new DataFrame with the specified frequency (which must be coarser-grained).
         It uses the pandas.Dataframe.resample(rule) & the pandas.core.resample.Resampler.aggregate(func) methods.
@@ -152,4 +273,144 @@ class ChangeResolution():
         ChangeResolution._checkFrequencyFormatIsValid(frequency)
         ChangeResolution._checkFinerDFResolution(df, frequency)
 
-        return df.resample(frequency).agg(aggregationFunc)
\ No newline at end of file
+        return df.resample(frequency).agg(aggregationFunc)
+
+    @staticmethod
+    def _getAggregationLabel(aggregation) -> str:
+        return "q" + str(aggregation) if isinstance(aggregation, float) else aggregation
+
+    @staticmethod
+    def _toBins(values: np.ndarray, padFront: int, binSize: int, numberOfBins: int, fill: float) -> np.ndarray:
+        """Reshapes the rows into (bins x binSize x columns), padding the first and last bins with 'fill'."""
+        padBack: int = numberOfBins * binSize - padFront - len(values)
+
+        if padFront or padBack:
+            values = np.concatenate([np.full((padFront, *values.shape[1:]), fill), values, np.full((padBack, *values.shape[1:]), fill)])
+
+        return values.reshape(numberOfBins, binSize, *values.shape[1:])
+
+    @staticmethod
+    def _getMoments(bins: np.ndarray) -> Dict[str, np.ndarray]:
+        """Mergeable statistics of every bin of rows: count, sum, mean, sum of squared deviations (M2), min and max. NaN values are skipped."""
+        count: np.ndarray = np.count_nonzero(~np.isnan(bins), axis = 1)
+        total: np.ndarray = np.nansum(bins, axis = 1)
+
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            mean: np.ndarray = total / count
+
+        return {"count": count, "sum": total, "mean": mean, "M2": np.nansum((bins - mean[:, np.newaxis]) ** 2, axis = 1),
+                "min": np.fmin.reduce(bins, axis = 1), "max": np.fmax.reduce(bins, axis = 1)}
+
+    @staticmethod
+    def _mergeMoments(moments: Dict[str, np.ndarray], padFront: int, binSize: int, numberOfBins: int) -> Dict[str, np.ndarray]:
+        """Merges the moments of every 'binSize' consecutive finer bins into the ones of a coarser bin."""
+        count: np.ndarray = ChangeResolution._toBins(moments["count"], padFront, binSize, numberOfBins, 0)
+        total: np.ndarray = ChangeResolution._toBins(moments["sum"], padFront, binSize, numberOfBins, 0).sum(axis = 1)
+        means: np.ndarray = np.nan_to_num(ChangeResolution._toBins(moments["mean"], padFront, binSize, numberOfBins, 0))
+        M2: np.ndarray = ChangeResolution._toBins(moments["M2"], padFront, binSize, numberOfBins, 0).sum(axis = 1)
+
+        mergedCount: np.ndarray = count.sum(axis = 1)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            mean: np.ndarray = total / mergedCount
+
+        # Parallel variance: the spread of the finer means around the coarser one adds to their M2
+        M2 = M2 + np.sum(count * (means - np.nan_to_num(mean)[:, np.newaxis]) ** 2, axis = 1)
+
+        return {"count": mergedCount, "sum": total, "mean": mean, "M2": M2,
+                "min": np.fmin.reduce(ChangeResolution._toBins(moments["min"], padFront, binSize, numberOfBins, np.nan), axis = 1),
+                "max": np.fmax.reduce(ChangeResolution._toBins(moments["max"], padFront, binSize, numberOfBins, np.nan), axis = 1)}
+
+    @staticmethod
+    def _getBinnedAggregation(moments: Dict[str, np.ndarray], bins: np.ndarray, aggregation) -> np.ndarray:
+        if aggregation in ["count", "sum", "mean", "min", "max"]:
+            return moments[aggregation]
+
+        if aggregation in ["std", "var"]:
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                variance: np.ndarray = np.where(moments["count"] > 1, moments["M2"] / (moments["count"] - 1), np.nan)
+
+            return np.sqrt(variance) if aggregation == "std" else variance
+
+        # Median and quantiles can not be merged, so they are computed on the rows of every bin
+        return ChangeResolution._getBinQuantile(bins(), 0.5 if aggregation == "median" else aggregation)
+
+    @staticmethod
+    def _getBinQuantile(bins: np.ndarray, quantile: float) -> np.ndarray:
+        """Linear-interpolated quantile of every bin skipping NaN values, as numpy.nanquantile(bins, quantile, axis = 1) but vectorized."""
+        sortedBins: np.ndarray = np.sort(bins, axis = 1)     # NaN values go last
+        count: np.ndarray = np.count_nonzero(~np.isnan(bins), axis = 1)
+
+        position: np.ndarray = quantile * np.maximum(count - 1, 0)
+        lower: np.ndarray = np.floor(position).astype(int)
+        upper: np.ndarray = np.minimum(lower + 1, np.maximum(count - 1, 0))
+
+        lowerValues: np.ndarray = np.take_along_axis(sortedBins, lower[:, np.newaxis], axis = 1)[:, 0]
+        upperValues: np.ndarray = np.take_along_axis(sortedBins, upper[:, np.newaxis], axis = 1)[:, 0]
+
+        return np.where(count > 0, lowerValues + (upperValues - lowerValues) * (position - lower), np.nan)
+
+    @staticmethod
+    @instrumented()
+    def downsampleMany(df: pd.DataFrame, frequencies: List[str], aggregations: List) -> Dict[str, pd.DataFrame]:
+        """Same as downsample(...) for several frequencies and aggregation functions at once, as in df.resample(frequency).agg(aggregations) for every frequency.
+        On regular (and timezone-naive) indices, the rows are reduced in fixed-size bins: count, sum, mean, min, max, std and var are computed once for the finest frequency
+        and merged into the coarser ones, so the data is traversed a single time (plus once per frequency for median and quantiles). Otherwise pandas is used.
+
+        :param pandas.DataFrame df: the DataFrame to which the downsampling should be applied.
+        :param list frequencies: the resulting frequencies under which the DataFrame should be aggregated.
+        :param list aggregations: "count", "sum", "mean", "min", "max", "std", "var", "median" or a float in (0, 1) for a quantile, labelled as e.g. "q0.95".
+        :returns dict: a DataFrame for every frequency, whose columns are (column, aggregation) pairs.
+        """
+
+        for frequency in frequencies:
+            ChangeResolution._checkFrequencyFormatIsValid(frequency)
+            ChangeResolution._checkFinerDFResolution(df, frequency)
+
+        for aggregation in aggregations:
+            if not (aggregation in ChangeResolution._binnedAggregations or (isinstance(aggregation, float) and 0 < aggregation < 1)):
+                raise ValueError("Aggregation '" + str(aggregation) + "' not available. Please choose some: " + ', '.join(ChangeResolution._binnedAggregations) + " or a quantile in (0, 1).")
+
+        labels: List[str] = [ChangeResolution._getAggregationLabel(aggregation) for aggregation in aggregations]
+        columns = pd.MultiIndex.from_tuples([(*(column if isinstance(column, tuple) else (column,)), label) for column in df.columns for label in labels])
+
+        step, regular = ChangeResolution._getIndexSteps(df.index)
+        values: np.ndarray = df.to_numpy(dtype = float)
+
+        # Origin of the bins, as in pandas: the midnight of the first day
+        origin: int = df.index[0].normalize().value if len(df) else 0
+        finerLevel: Tuple[int, int, Dict[str, np.ndarray]] = None      # (frequency, first bin, moments)
+
+        results: Dict[str, pd.DataFrame] = {}
+        for frequency in sorted(frequencies, key = pd.Timedelta):
+            frequencyNs: int = pd.Timedelta(frequency).value
+
+            if not (regular and len(df) and df.index.tz is None and frequencyNs % step == 0):
+                resampler = df.resample(frequency)
+                frames: List[pd.DataFrame] = [resampler.quantile(aggregation) if isinstance(aggregation, float) else resampler.agg(aggregation) for aggregation in aggregations]
+
+                results[frequency] = pd.DataFrame(np.stack([frame.to_numpy(dtype = float) for frame in frames], axis = 2).reshape(len(frames[0]), -1), index = frames[0].index, columns = columns)
+                continue
+
+            firstBin: int = (df.index.asi8[0] - origin) // frequencyNs
+            binSize: int = frequencyNs // step
+            padFront: int = (df.index.asi8[0] - origin - firstBin * frequencyNs) // step
+            numberOfBins: int = -(-(padFront + len(df)) // binSize)
+
+            rowBins = lambda: ChangeResolution._toBins(values, padFront, binSize, numberOfBins, np.nan)
+
+            if finerLevel is not None and frequencyNs % finerLevel[0] == 0:
+                finerFrequencyNs, finerFirstBin, finerMoments = finerLevel
+                finerPerBin: int = frequencyNs // finerFrequencyNs
+
+                moments = ChangeResolution._mergeMoments(finerMoments, finerFirstBin - firstBin * finerPerBin, finerPerBin, numberOfBins)
+            else:
+                moments = ChangeResolution._getMoments(rowBins())
+
+            finerLevel = (frequencyNs, firstBin, moments)
+
+            index = pd.DatetimeIndex(origin + (firstBin + np.arange(numberOfBins)) * frequencyNs, name = df.index.name)
+            aggregated: List[np.ndarray] = [ChangeResolution._getBinnedAggregation(moments, rowBins, aggregation) for aggregation in aggregations]
+
+            results[frequency] = pd.DataFrame(np.stack(aggregated, axis = 2).reshape(numberOfBins, -1), index = index, columns = columns)
+
+        return {frequency: results[frequency] for frequency in frequencies}
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""Almacén local, columnar y de solo adición, del histórico de ESIOS
+
+Clase: AlmacenEsios
+Cada indicador y time_trunc tiene su carpeta con:
+ - partes (parte_000000.npz, parte_000001.npz...): arrays de instantes (ns UTC), valores y geo_id, que nunca se reescriben
+ - meta.json: lista de partes, primer y último instante almacenados y fecha de la última sincronización
+
+La sincronización solo pide a ESIOS lo posterior al último instante almacenado, más una ventana de solape en la que ESIOS puede
+haber revisado los valores. Al leer, si un instante está en varias partes, prevalece la más reciente.
+
+Uso como comando:
+    python -m synthDataGen.common.almacenEsios DIRECTORIO --indicadores 10211 600 --time-trunc hour --desde 2007-01-01
+(el token se toma de --token o de la variable de entorno ESIOS_KEY)
+"""
+import os
+import json
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+
+PASOS_TIME_TRUNC = {'five_minutes': timedelta(minutes=5), 'ten_minutes': timedelta(minutes=10), 'fifteen_minutes': timedelta(minutes=15),
+                    'hour': timedelta(hours=1), 'hours': timedelta(hours=1), 'day': timedelta(days=1)}
+VERSION_FORMATO = 1
+
+
+class AlmacenEsios:
+    """ Almacén local del histórico de ESIOS, por indicador y time_trunc
+
+    :param directorio: Directorio raíz del almacén (se crea si no existe)
+    :type  cadena: Es una cadena de caracteres
+    """
+    _META = 'meta.json'
+    _COLUMNAS = ('instante', 'value', 'geo_id')
+
+    def __init__(self, directorio):
+        self.__directorio = os.path.expanduser(directorio)
+        self.__cerrojo = threading.Lock()
+        self.__cargados = {}
+
+        os.makedirs(self.__directorio, exist_ok=True)
+
+    @property
+    def directorio(self):
+        """ Devuelve el directorio raíz del almacén
+        """
+        return self.__directorio
+
+    def __carpeta(self, indicador, time_trunc):
+        return os.path.join(self.__directorio, f'{indicador}_{time_trunc}')
+
+    def __escribe_atomico(self, carpeta, nombre, escribe):
+        descriptor, temporal = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as fichero:
+                escribe(fichero)
+            os.replace(temporal, os.path.join(carpeta, nombre))
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    def meta(self, indicador, time_trunc):
+        """ Devuelve el diccionario meta del indicador y time_trunc, o None si aún no hay nada almacenado
+        """
+        try:
+            with open(os.path.join(self.__carpeta(indicador, time_trunc), self._META)) as fichero:
+                meta = json.load(fichero)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return meta if meta.get('version') == VERSION_FORMATO else None
+
+    def ultimo_instante(self, indicador, time_trunc):
+        """ Devuelve el último instante (datetime en UTC, sin huso) almacenado, o None si no hay nada almacenado
+        """
+        meta = self.meta(indicador, time_trunc)
+        return datetime.fromisoformat(meta['ultimo']) if meta and meta['ultimo'] else None
+
+    def cobertura(self, indicador, time_trunc):
+        """ Devuelve el rango (desde, hasta) de fechas en UTC que el almacén cubre por completo, o None si no hay nada almacenado
+
+        'desde' es la fecha desde la que se sincronizó, que puede ser anterior al primer valor (si ESIOS no tiene datos más antiguos)
+        """
+        meta = self.meta(indicador, time_trunc)
+        if not meta or not meta['ultimo']:
+            return None
+
+        return (datetime.fromisoformat(meta['desde']), datetime.fromisoformat(meta['ultimo']))
+
+    def __siguiente_parte(self, meta):
+        # Los números de parte no se reutilizan, ni siquiera tras compactar
+        return f'parte_{int(meta["partes"][-1][6:12]) + 1 if meta["partes"] else 0:06d}.npz'
+
+    def __guarda_meta(self, carpeta, meta):
+        self.__escribe_atomico(carpeta, self._META, lambda fichero: fichero.write(json.dumps(meta, indent=1).encode()))
+
+    def agnade(self, indicador, time_trunc, df, desde=None):
+        """ Añade una parte con los valores de un dataframe como los de BajadaDatosESIOS (columnas value, datetime_utc y geo_id)
+
+        :param desde: datetime en UTC desde el que se pidieron los valores (ver cobertura). None == el primero de ellos
+        :returns: Número de valores añadidos
+        """
+        if len(df) == 0:
+            return 0
+
+        carpeta = self.__carpeta(indicador, time_trunc)
+        os.makedirs(carpeta, exist_ok=True)
+
+        instantes = df['datetime_utc'].to_numpy().astype('datetime64[ns]').view(np.int64)
+        columnas = {'instante': instantes,
+                    'value': df['value'].to_numpy(dtype=np.float64),
+                    'geo_id': df['geo_id'].to_numpy(dtype=np.int64) if 'geo_id' in df.columns else np.full(len(df), -1, dtype=np.int64)}
+
+        with self.__cerrojo:
+            meta = self.meta(indicador, time_trunc) or {'version': VERSION_FORMATO, 'indicador': indicador, 'time_trunc': time_trunc,
+                                                        'partes': [], 'desde': None, 'primero': None, 'ultimo': None}
+            nombre = self.__siguiente_parte(meta)
+            self.__escribe_atomico(carpeta, nombre, lambda fichero: np.savez(fichero, **columnas))
+
+            # La parte solo cuenta una vez registrada en meta.json: una sincronización interrumpida no deja el almacén a medias
+            primero, ultimo = pd.Timestamp(instantes.min()).to_pydatetime(), pd.Timestamp(instantes.max()).to_pydatetime()
+            meta['partes'].append(nombre)
+            desde = min(desde or primero, primero)
+            meta['desde'] = min(desde, datetime.fromisoformat(meta['desde'])).isoformat() if meta['desde'] else desde.isoformat()
+            meta['primero'] = min(primero, datetime.fromisoformat(meta['primero'])).isoformat() if meta['primero'] else primero.isoformat()
+            meta['ultimo'] = max(ultimo, datetime.fromisoformat(meta['ultimo'])).isoformat() if meta['ultimo'] else ultimo.isoformat()
+            meta['sincronizado'] = datetime.now().isoformat(timespec='seconds')
+            self.__guarda_meta(carpeta, meta)
+
+        return len(df)
+
+    def __carga(self, indicador, time_trunc):
+        """ Devuelve los arrays (instantes, valores, geo_ids) del indicador, sin duplicados y ordenados, o None si no hay nada almacenado
+
+        Se guardan en memoria mientras no cambie la lista de partes
+        """
+        meta = self.meta(indicador, time_trunc)
+        if meta is None or not meta['partes']:
+            return None
+
+        clave = (indicador, time_trunc)
+        partes = tuple(meta['partes'])
+        cargado = self.__cargados.get(clave)
+        if cargado is not None and cargado[0] == partes:
+            return cargado[1]
+
+        carpeta = self.__carpeta(indicador, time_trunc)
+        columnas = {columna: [] for columna in self._COLUMNAS}
+        for parte in partes:
+            with np.load(os.path.join(carpeta, parte), allow_pickle=False) as contenido:
+                for columna in self._COLUMNAS:
+                    columnas[columna].append(contenido[columna])
+
+        instantes, valores, geo_ids = (np.concatenate(columnas[columna]) for columna in self._COLUMNAS)
+
+        # Orden estable por (geo_id, instante): entre repetidos, el último es el de la parte más reciente
+        orden = np.lexsort((instantes, geo_ids))
+        instantes, valores, geo_ids = instantes[orden], valores[orden], geo_ids[orden]
+        ultimos = np.ones(len(instantes), dtype=bool)
+        ultimos[:-1] = (instantes[1:] != instantes[:-1]) | (geo_ids[1:] != geo_ids[:-1])
+        instantes, valores, geo_ids = instantes[ultimos], valores[ultimos], geo_ids[ultimos]
+
+        orden = np.argsort(instantes, kind='stable')
+        arrays = (instantes[orden], valores[orden], geo_ids[orden])
+
+        self.__cargados[clave] = (partes, arrays)
+        return arrays
+
+    def lee(self, indicador, time_trunc, fecha_inicio=None, fecha_fin=None, incluye29DeFebrero=True):
+        """ Devuelve los valores almacenados entre dos fechas (UTC, ambas incluidas) con la forma de BajadaDatosESIOS:
+        columnas value, datetime_utc, geo_id e id, e índice datetime_utc
+
+        :param fecha_inicio: datetime en UTC. None == desde el primero
+        :param fecha_fin: datetime en UTC. None == hasta el último
+        :param incluye29DeFebrero: Si es False, se descartan los 29 de febrero
+        """
+        arrays = self.__carga(indicador, time_trunc)
+        instantes, valores, geo_ids = arrays if arrays is not None else (np.empty(0, np.int64), np.empty(0), np.empty(0, np.int64))
+
+        desde = 0 if fecha_inicio is None else np.searchsorted(instantes, np.datetime64(fecha_inicio, 'ns').astype(np.int64), 'left')
+        hasta = len(instantes) if fecha_fin is None else np.searchsorted(instantes, np.datetime64(fecha_fin, 'ns').astype(np.int64), 'right')
+
+        indice = pd.DatetimeIndex(instantes[desde:hasta].view('datetime64[ns]'), name='datetime_utc')
+        seleccion = slice(None) if incluye29DeFebrero else ~((indice.month == 2) & (indice.day == 29))
+        indice = indice[seleccion]
+
+        return pd.DataFrame({'value': valores[desde:hasta][seleccion],
+                             'datetime_utc': indice.to_numpy(),
+                             'geo_id': geo_ids[desde:hasta][seleccion],
+                             'id': np.full(len(indice), indicador, dtype=np.int64)}, index=indice)
+
+    def compacta(self, indicador, time_trunc):
+        """ Reúne todas las partes en una sola, sin los valores repetidos por los solapes
+        """
+        df = self.lee(indicador, time_trunc)
+        if len(df) == 0:
+            return
+
+        carpeta = self.__carpeta(indicador, time_trunc)
+        with self.__cerrojo:
+            meta = self.meta(indicador, time_trunc)
+            antiguas = meta['partes']
+            nombre = self.__siguiente_parte(meta)
+            columnas = {'instante': df['datetime_utc'].to_numpy().view(np.int64), 'value': df['value'].to_numpy(), 'geo_id': df['geo_id'].to_numpy()}
+            self.__escribe_atomico(carpeta, nombre, lambda fichero: np.savez(fichero, **columnas))
+
+            meta['partes'] = [nombre]
+            self.__guarda_meta(carpeta, meta)
+
+        for parte in antiguas:
+            try:
+                os.remove(os.path.join(carpeta, parte))
+            except OSError:
+                pass
+
+    def sincroniza(self, bajada, indicador, time_trunc, desde=datetime(2007, 1, 1), hasta=None, solape_horas=48,
+                   valores_por_peticion=10000, valores_por_parte=500000):
+        """ Descarga de ESIOS lo posterior al último instante almacenado (menos el solape) y lo añade al almacén
+
+        La primera vez descarga desde 'desde'. Las peticiones son de como mucho 'valores_por_peticion' valores, y lo descargado se
+        añade en partes de unos 'valores_por_parte' valores, de forma que una sincronización interrumpida conserva lo ya añadido
+
+        :param bajada: BajadaDatosESIOS con la que descargar (sin almacén, para que todo venga de ESIOS)
+        :param desde: datetime en UTC desde el que descargar si no hay nada almacenado
+        :param hasta: datetime en UTC hasta el que descargar. None == ahora
+        :param solape_horas: Horas antes del último instante almacenado que se vuelven a descargar, por si ESIOS las ha revisado
+        :returns: Número de valores añadidos (incluidos los del solape)
+        """
+        if time_trunc not in PASOS_TIME_TRUNC:
+            raise ValueError("time_trunc '" + str(time_trunc) + "' no soportado. Opciones: " + ', '.join(PASOS_TIME_TRUNC))
+
+        paso = PASOS_TIME_TRUNC[time_trunc]
+        hasta = hasta or datetime.now(timezone.utc).replace(tzinfo=None)
+        ultimo = self.ultimo_instante(indicador, time_trunc)
+        inicio = desde if ultimo is None else max(desde, ultimo - timedelta(hours=solape_horas))
+
+        agnadidos = 0
+        pendientes = []
+        desde_pendientes = inicio
+        while inicio <= hasta:
+            fin = min(inicio + paso * (valores_por_peticion - 1), hasta)
+            df = bajada.dataframe_lista_de_indicadores_de_esios_por_fechas([indicador], inicio, fin, True, time_trunc=time_trunc)
+            if len(df):
+                pendientes.append(df)
+
+            if sum(len(pendiente) for pendiente in pendientes) >= valores_por_parte:
+                agnadidos += self.agnade(indicador, time_trunc, pd.concat(pendientes, ignore_index=True), desde_pendientes)
+                pendientes = []
+                desde_pendientes = fin + timedelta(minutes=1)
+
+            # Los instantes de ESIOS van por minutos enteros: empezar un minuto después no deja huecos
+            inicio = fin + timedelta(minutes=1)
+
+        if pendientes:
+            agnadidos += self.agnade(indicador, time_trunc, pd.concat(pendientes, ignore_index=True), desde_pendientes)
+
+        return agnadidos
+
+
+if __name__ == '__main__':
+    from synthDataGen.common.bibliotecaEsios import BajadaDatosESIOS
+
+    analizador = argparse.ArgumentParser(description='Sincroniza el almacén local con lo nuevo de ESIOS')
+    analizador.add_argument('directorio')
+    analizador.add_argument('--indicadores', type=int, nargs='+', required=True)
+    analizador.add_argument('--time-trunc', default='hour')
+    analizador.add_argument('--desde', type=datetime.fromisoformat, default=datetime(2007, 1, 1), help='UTC; solo si no hay nada almacenado')
+    analizador.add_argument('--hasta', type=datetime.fromisoformat, default=None, help='UTC; por defecto, ahora')
+    analizador.add_argument('--solape-horas', type=float, default=48)
+    analizador.add_argument('--token', default=os.environ.get('ESIOS_KEY'))
+    analizador.add_argument('--end-point', default='https://api.esios.ree.es/indicators')
+    analizador.add_argument('--compacta', action='store_true', help='reúne las partes en una sola tras sincronizar')
+    opciones = analizador.parse_args()
+
+    if not opciones.token:
+        raise SystemExit('Falta el token de ESIOS: --token o variable de entorno ESIOS_KEY')
+
+    almacen = AlmacenEsios(opciones.directorio)
+    bajada = BajadaDatosESIOS(opciones.token, opciones.end_point, valida_token=False)
+
+    for indicador in opciones.indicadores:
+        agnadidos = almacen.sincroniza(bajada, indicador, opciones.time_trunc, opciones.desde, opciones.hasta, opciones.solape_horas)
+        if opciones.compacta:
+            almacen.compacta(indicador, opciones.time_trunc)
+        print(f'{indicador} {opciones.time_trunc}: {agnadidos} valores añadidos; último instante {almacen.ultimo_instante(indicador, opciones.time_trunc)}')
@@ -13,13 +13,197 @@ https://github.com/mharias/mercado_electrico/blob/main/code/notebook_uso_apis.ip
 from __future__ import division
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from dateutil import tz
-import requests    # Posiblemente, tengamos que instalar previamente con pip
+from datetime import datetime, timedelta, timezone
 import html
+import time
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 
-from dateutil import parser
+# requests y dateutil se importan en el primer uso: quien solo usa datos locales no paga su tiempo de importación
 
+# Conexiones HTTP: una única sesión (keep-alive, con pool de conexiones) compartida por todas las llamadas e instancias
+TAMAGNO_POOL_CONEXIONES = 32
+REINTENTOS_MAXIMOS = 5
+ESPERA_BASE_SEGUNDOS = 0.5       # Espera antes del primer reintento; se duplica en cada reintento (backoff exponencial)
+ESPERA_MAXIMA_SEGUNDOS = 60
+TIMEOUT_SEGUNDOS = (10, 120)     # (conexión, lectura)
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+_sesion = None
+_cerrojo_sesion = threading.Lock()
+
+
+def sesion_compartida():
+    """ Devuelve la sesión HTTP compartida, creándola la primera vez
+    """
+    global _sesion
+    with _cerrojo_sesion:
+        if _sesion is None:
+            import requests    # Posiblemente, tengamos que instalar previamente con pip
+            from requests.adapters import HTTPAdapter
+
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=TAMAGNO_POOL_CONEXIONES, pool_maxsize=TAMAGNO_POOL_CONEXIONES)
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            _sesion = sesion
+
+    return _sesion
+
+
+class EstadisticasPeticiones:
+    """ Contadores de las peticiones HTTP realizadas (thread-safe)
+
+    Guarda los totales y el detalle (url, estado, segundos, intento) de las últimas peticiones
+    """
+    def __init__(self, tamagno_detalle=1000):
+        self.__cerrojo = threading.Lock()
+        self.__tamagno_detalle = tamagno_detalle
+        self.reinicia()
+
+    def reinicia(self):
+        """ Pone a cero los contadores
+        """
+        with self.__cerrojo:
+            self.__peticiones = 0
+            self.__reintentos = 0
+            self.__errores = 0
+            self.__segundos = 0.0
+            self.__detalle = deque(maxlen=self.__tamagno_detalle)
+
+    def registra(self, url, estado, segundos, intento):
+        """ Anota una petición. estado == None indica un error de conexión
+        """
+        with self.__cerrojo:
+            self.__peticiones += 1
+            self.__reintentos += intento > 0
+            self.__errores += estado is None or estado >= 400
+            self.__segundos += segundos
+            self.__detalle.append({'url': url, 'estado': estado, 'segundos': segundos, 'intento': intento})
+
+    @property
+    def resumen(self):
+        """ Devuelve un diccionario con los totales: peticiones, reintentos, errores, segundos y segundos_medios
+        """
+        with self.__cerrojo:
+            return {'peticiones': self.__peticiones,
+                    'reintentos': self.__reintentos,
+                    'errores': self.__errores,
+                    'segundos': self.__segundos,
+                    'segundos_medios': self.__segundos / self.__peticiones if self.__peticiones else 0.0}
+
+    @property
+    def detalle(self):
+        """ Devuelve la lista de las últimas peticiones (diccionarios url, estado, segundos, intento)
+        """
+        with self.__cerrojo:
+            return list(self.__detalle)
+
+
+ESTADISTICAS = EstadisticasPeticiones()
+
+
+# Forma de los valores en la caché: al cambiar la de decodifica_valores, se incrementa para no leer entradas antiguas
+VERSION_FORMATO_CACHE = 4
+
+# Campos de cada valor en las respuestas de ESIOS; a ellos decodifica_valores añade id, name y short_name del indicador
+COLUMNAS_VALORES = ['value', 'datetime', 'datetime_utc', 'tz_time', 'geo_id', 'geo_name']
+COLUMNAS_DECODIFICADAS = ['value', 'datetime', 'datetime_utc', 'tz_time', 'geo_id', 'geo_name', 'id', 'name', 'short_name']
+
+# Indicador (precio del mercado diario) del que se pide una sola hora para verificar el token, sin descargar el catálogo
+INDICADOR_VALIDACION = 600
+
+
+def fechas_peninsulares(fecha_inicio, fecha_fin):
+    """ Convierte dos datetime en UTC en las cadenas de hora peninsular con las que se pide un rango a ESIOS
+    """
+    # Los valores de tiempo origen/destino de selección entran en este método en UTC
+    # el snippet (fusilado de internet) que toma datos desde ESIOS, selecciona huso horario peninsular
+    from dateutil import tz
+
+    HUSO_PENINSULA = tz.gettz("Europe/Madrid")  
+    HUSO_UTC = tz.gettz("UTC")   
+
+    fecha_inicio_PENINSULAR = fecha_inicio.replace(tzinfo=HUSO_UTC).astimezone(HUSO_PENINSULA)
+    fecha_fin_PENINSULAR = fecha_fin.replace(tzinfo=HUSO_UTC).astimezone(HUSO_PENINSULA)
+
+    return fecha_inicio_PENINSULAR.strftime('%Y-%m-%dT%H:%M'), fecha_fin_PENINSULAR.strftime('%Y-%m-%dT%H:%M')
+
+
+def decodifica_valores(indicador_json):
+    """ Convierte el json de un indicador ('indicator' en la respuesta de ESIOS) en un dataframe de columnas tipadas
+
+    Columnas, en el orden en que las daba json_normalize: value (float64, NaN si falta), datetime y tz_time (texto, tal cual vienen),
+    datetime_utc (datetime64[ns] en UTC sin huso, truncado a segundos), geo_id (int64, -1 si falta o es null), geo_name (texto),
+    id (int64), name y short_name (texto, los del indicador)
+    Los registros se vuelcan de una vez con DataFrame.from_records y cada columna se tipa en bloque: del instante, numpy toma los
+    19 primeros caracteres (AAAA-MM-DDTHH:MM:SS) de todas las cadenas, sin bucles por fila sobre fechas
+    """
+    registros = pd.DataFrame.from_records(indicador_json.get('values', []), columns=COLUMNAS_VALORES)
+    numero = len(registros)
+
+    instantes = registros['datetime_utc'].to_numpy(dtype='U19').astype('datetime64[s]').astype('datetime64[ns]')
+
+    return pd.DataFrame({'value': registros['value'].to_numpy(dtype=np.float64, na_value=np.nan),
+                         'datetime': registros['datetime'].to_numpy(dtype=object),
+                         'datetime_utc': instantes,
+                         'tz_time': registros['tz_time'].to_numpy(dtype=object),
+                         'geo_id': registros['geo_id'].fillna(-1).to_numpy(dtype=np.int64),
+                         'geo_name': registros['geo_name'].to_numpy(dtype=object),
+                         'id': np.full(numero, indicador_json.get('id', -1), dtype=np.int64),
+                         'name': np.full(numero, indicador_json.get('name'), dtype=object),
+                         'short_name': np.full(numero, indicador_json.get('short_name'), dtype=object)})
+
+
+def _segundos_de_espera(respuesta, intento):
+    """ Respeta la cabecera Retry-After (en segundos o como fecha HTTP); si no viene, backoff exponencial
+    """
+    retry_after = respuesta.headers.get('Retry-After') if respuesta is not None else None
+    if retry_after:
+        try:
+            espera = float(retry_after)
+        except ValueError:
+            try:
+                espera = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                espera = None
+        if espera is not None:
+            return min(max(espera, 0.0), ESPERA_MAXIMA_SEGUNDOS)
+
+    return min(ESPERA_BASE_SEGUNDOS * 2 ** intento, ESPERA_MAXIMA_SEGUNDOS)
+
+
+def peticion_json(url, headers):
+    """ GET con la sesión compartida; reintenta ante 429, 5xx y errores de conexión. Devuelve el json de la respuesta
+
+    :raises: :class: ` Runtime Error `: Si el token no es válido (401/403) o se agotan los reintentos
+    """
+    import requests
+
+    for intento in range(REINTENTOS_MAXIMOS + 1):
+        inicio = time.perf_counter()
+        try:
+            respuesta = sesion_compartida().get(url, headers=headers, timeout=TIMEOUT_SEGUNDOS)
+            estado = respuesta.status_code
+        except (requests.ConnectionError, requests.Timeout) as error:
+            respuesta, estado, ultimo_error = None, None, error
+        ESTADISTICAS.registra(url, estado, time.perf_counter() - inicio, intento)
+
+        if estado is not None and estado not in ESTADOS_REINTENTABLES:
+            break
+        if intento < REINTENTOS_MAXIMOS:
+            time.sleep(_segundos_de_espera(respuesta, intento))
+
+    if estado is None:
+        raise RuntimeError("No se ha podido conectar con '" + url + "': " + str(ultimo_error))
+    if estado in (401, 403):
+        raise RuntimeError("ESIOS ha rechazado el token (HTTP " + str(estado) + ").")
+    if estado >= 400:
+        raise RuntimeError("Error HTTP " + str(estado) + " al consultar '" + url + "'.")
+
+    return respuesta.json()
 
 
 class BajadaDatosESIOS:
@@ -34,14 +218,30 @@ class BajadaDatosESIOS:
     
 
     """
-    def __init__(self, token):
+    def __init__(self, token, end_point='https://api.esios.ree.es/indicators', cache=None, valida_token=False, horas_refresco_catalogo=24, almacen=None):
         """ Creación de una instancia
         
-        Esencialmente, aprovecha la llamada a exios que solicita la lista de items que pone a disposición
-        para crear el objeto y verificar que el token con el que se llama, es un token valido
+        El catálogo de items que ESIOS pone a disposición ya no se descarga al crear el objeto, sino la primera vez
+        que se consulta (data_frame_catalogo_items). Si hay caché, el catálogo se guarda en ella y solo se vuelve a
+        descargar pasado el intervalo de refresco.
+        Por defecto, el token se verifica implícitamente con la primera petición (ver valida_token)
         
         :param token:  Es el token del usuario de ESIOS (se solicita en la propia web)
         :type  cadena: Es una cadena de caracteres         
+
+        :param end_point: URL del recurso de indicadores. Por defecto el de ESIOS; útil para apuntar a un servidor local de pruebas
+        :type  cadena: Es una cadena de caracteres
+
+        :param cache: Caché en disco de las respuestas (ver cacheEsios.CacheEsios). None == sin caché
+                      Si la caché está en modo fuera de línea, nunca se accede a la red
+
+        :param valida_token: Si es True, se verifica el token al crear la instancia, con una petición mínima (ver valida_token).
+                             Si es False (por defecto), el token se verifica implícitamente con la primera petición
+
+        :param horas_refresco_catalogo: Horas tras las que el catálogo guardado en caché se vuelve a descargar
+
+        :param almacen: Almacén local del histórico (ver almacenEsios.AlmacenEsios). None == sin almacén
+                        Lo que ya está en él se lee de disco, y a ESIOS solo se piden los instantes posteriores al último almacenado
         
         :raises: :class: ` Runtime Error `: No mucho esfuerzo: Error genérico por no poder haber hecho conexión
         
@@ -50,36 +250,72 @@ class BajadaDatosESIOS:
         self.__token = token
         self.__headers = {'Accept':'application/json; application/vnd.esios-api-v2+json',           
                           'Content-Type':'application/json',
-                          'Host':'api.esios.ree.es',
+                          'Host': urlparse(end_point).netloc,
                           'x-api-key': self.__token,     # Cambio respecto a fuente de inspiración
                           'Cache-Control': 'no-cache',
                           'Pragma': 'no-cache'          
                           }
-        self.__end_point = 'https://api.esios.ree.es/indicators'
-        self.__response = requests.get(self.__end_point, headers=self.__headers).json()
+        self.__end_point = end_point
+        self.__cache = cache
+        self.__horas_refresco_catalogo = horas_refresco_catalogo
+        self.__almacen = almacen
         self.__df = pd.DataFrame()
         self.__volteado = None
-        
+        self.__lista_de_items = None
+
+        if valida_token and not (cache is not None and cache.fuera_de_linea):
+            self.valida_token()
+
+    def valida_token(self):
+        """ Verifica el token pidiendo a ESIOS una sola hora de un indicador (INDICADOR_VALIDACION), sin descargar el catálogo
+
+        :raises: :class: ` Runtime Error `: Si el token no es válido o no hay conexión
+        """
+        peticion_json(f'{self.__end_point}/{INDICADOR_VALIDACION}?start_date=2020-01-01T00:00&end_date=2020-01-01T00:00&time_trunc=hour',
+                      self.__headers)
+
+    def __descarga_catalogo(self):
+        """ Descarga el catálogo de items de ESIOS
+        """
+        response = peticion_json(self.__end_point, self.__headers)
+
     #del resultado en json bruto se convierte a pandas dataframe, y se eliminan los tags del campo description
+        catalogo = pd.json_normalize(data=response['indicators'], errors='ignore')
+        catalogo['description'] = catalogo['description'].str.replace(r'</?[pb]>', '', regex=True) \
+                                                         .map(html.unescape, na_action='ignore')
+        return catalogo
+
+    def __carga_catalogo(self):
+        """ Lee el catálogo de la caché o, si no está o hay que refrescarlo, lo descarga y lo guarda en ella
+        """
+        if self.__cache is None:
+            return self.__descarga_catalogo()
+
+        clave = self.__cache.clave('catalogo', datetime.min, datetime.min, '', origen=f'{self.__end_point}|v{VERSION_FORMATO_CACHE}')
+        catalogo = self.__cache.lee(clave, ttl_horas=self.__horas_refresco_catalogo)
+        if catalogo is None:
+            catalogo = self.__descarga_catalogo()
+            self.__cache.guarda(clave, catalogo)
+
+        return catalogo
 
-        self.__lista_de_items = pd.json_normalize(data=self.__response['indicators'], errors='ignore') \
-            .assign(description = lambda df_: df_.apply(lambda df__: html.unescape(df__['description']
-                                                                  .replace('<p>','')
-                                                                  .replace('</p>','')
-                                                                  .replace('<b>','')
-                                                                  .replace('</b>','')), 
-                                                        axis=1) 
-                   )
-             
-                                          
-          
     @property    
     def data_frame_catalogo_items(self):
         """ Devuelve un dataframe con los indicadores que ESIOS pone a disposición para consulta  
+            Se carga la primera vez que se consulta
 
         """  
+        if self.__lista_de_items is None:
+            self.__lista_de_items = self.__carga_catalogo()
+
         return self.__lista_de_items 
     
+    @property
+    def estadisticas_peticiones(self):
+        """ Devuelve los contadores de tiempos de las peticiones HTTP (compartidos por todas las instancias)
+        """
+        return ESTADISTICAS
+
     @property
     def df(self):
         """Devuelve el full dataframe
@@ -101,6 +337,47 @@ class BajadaDatosESIOS:
     
     
     
+    def __descarga_indicador(self, indicador, time_trunc, fecha_inicio, fecha_fin):
+        """ Devuelve los valores de un indicador entre dos fechas en UTC, decodificados en columnas tipadas (ver decodifica_valores)
+
+        Si hay almacén, lo ya almacenado se lee de él y solo lo posterior se descarga. El almacén solo guarda value, datetime_utc
+        y geo_id: en sus filas, las columnas de texto (datetime, tz_time, geo_name, name y short_name) quedan vacías (NaN)
+        """
+        if self.__almacen is not None:
+            cobertura = self.__almacen.cobertura(indicador, time_trunc)
+            desde, ultimo = cobertura if cobertura is not None else (None, None)
+            if cobertura is not None and desde <= fecha_inicio <= ultimo:
+                almacenado = self.__almacen.lee(indicador, time_trunc, fecha_inicio, min(fecha_fin, ultimo))
+                almacenado = almacenado.reset_index(drop=True).reindex(columns=COLUMNAS_DECODIFICADAS)
+                if fecha_fin <= ultimo:
+                    return almacenado
+
+                # Los instantes de ESIOS van por minutos enteros: empezar un minuto después del último no deja huecos
+                nuevo = self.__descarga_de_esios(indicador, time_trunc, ultimo + timedelta(minutes=1), fecha_fin)
+                return pd.concat([almacenado, nuevo], ignore_index=True)
+
+        return self.__descarga_de_esios(indicador, time_trunc, fecha_inicio, fecha_fin)
+
+    def __descarga_de_esios(self, indicador, time_trunc, fecha_inicio, fecha_fin):
+        """ Descarga (o lee de la caché, si la hay) los valores de un indicador, decodificados en columnas tipadas (ver decodifica_valores)
+        """
+        inicio, fin = fechas_peninsulares(fecha_inicio, fecha_fin)
+
+        if self.__cache is not None:
+            clave = self.__cache.clave(indicador, fecha_inicio, fecha_fin, time_trunc,
+                                       origen=f'{self.__end_point}|v{VERSION_FORMATO_CACHE}')
+            df = self.__cache.lee(clave, fecha_fin)
+            if df is not None:
+                return df
+
+        url = f'{self.__end_point}/{indicador}?start_date={inicio}&end_date={fin}&time_trunc={time_trunc}'            
+        response = peticion_json(url, self.__headers)
+        df = decodifica_valores(response['indicator'])
+
+        if self.__cache is not None:
+            self.__cache.guarda(clave, df)
+        return df
+
     def dataframe_lista_de_indicadores_de_esios_por_fechas(self, indicadores,
                                                            fecha_inicio,
                                                            fecha_fin,
@@ -161,22 +438,8 @@ class BajadaDatosESIOS:
             fin = fecha_fin.strftime('%Y-%m-%dT%H:%M')
     '''
     
-        # NEW-CODE: Más elegente, jugando con funcionalida datetime
-        # Los valores de tiempo origen/destino de selección entran en este método en UTC
-        # el snippet (fusilado de internet) que toma datos desde ESIOS, selecciona huso horario peninsular
-
-        HUSO_PENINSULA = tz.gettz("Europe/Madrid")  
-        HUSO_UTC = tz.gettz("UTC")   
-
-        fecha_inicio_UTC =  fecha_inicio.replace(tzinfo=HUSO_UTC)   
-        fecha_fin_UTC = fecha_fin.replace(tzinfo=HUSO_UTC) 
-
-        fecha_inicio_PENINSULAR = fecha_inicio_UTC.astimezone(HUSO_PENINSULA)
-        fecha_fin_PENINSULAR = fecha_fin_UTC.astimezone(HUSO_PENINSULA)
-
-     
-        inicio = fecha_inicio_PENINSULAR.strftime('%Y-%m-%dT%H:%M')
-        fin = fecha_fin_PENINSULAR.strftime('%Y-%m-%dT%H:%M')        
+        # NEW-CODE: Más elegente, jugando con funcionalida datetime (ver fechas_peninsulares)
+        # Las fechas en UTC se convierten a hora peninsular en cada descarga, dentro de __descarga_indicador
         # FIN NEW-CODE
            
     # El procedimiento es sencillo: 
@@ -184,10 +447,9 @@ class BajadaDatosESIOS:
     # b) Hacemos la llamada y recogemos los datos en formato json.
     # c) Añadimos la información a una lista   
         lista=[]
+    # d) Si hay caché, las respuestas se sirven desde ella y las descargadas se guardan en ella
         for indicador in indicadores:
-            url = f'{self.__end_point}/{indicador}?start_date={inicio}&end_date={fin}&time_trunc={time_trunc}'            
-            response = requests.get(url, headers=self.__headers).json()
-            lista.append(pd.json_normalize(data=response['indicator'], record_path=['values'], meta=['name','short_name'], errors='ignore'))
+            lista.append(self.__descarga_indicador(indicador, time_trunc, fecha_inicio, fecha_fin))
     # DE LA FUENTE QUE SE FUSILÓ:
     # Devolvemos como salida de la función un df fruto de la concatenación de los elemenos de la lista
     # Este procedimiento, con una sola concatenación al final, es mucho más eficiente que hacer múltiples 
@@ -198,26 +460,18 @@ class BajadaDatosESIOS:
     # A FINES PRACTICOS: TRABAJAR CON UTC
     #  1) El indice se determina a partir de la columa "datetime_utc"
         df = pd.concat(lista, ignore_index=True)
-          # La línea siguiente, se realiza en tres pasos:
-          # columna_aux = df['datetime_utc']
-          # neoColumna = np.array( datetime.strptime(a, '%Y-%m-%dT%H:%M:%SZ') for a in columna_aux)
-          # df['datetime_utc'] = neoColumna
-          # que puedes condensarse:
-
-        df["datetime_utc_norm"] = pd.to_datetime(df["datetime_utc"], format='ISO8601')
-        df['datetime_utc'] = np.array([date.replace(microsecond = 0).tz_localize(None) for date in df["datetime_utc_norm"]])
-        # df['datetime_utc'] = np.array( datetime.strptime(a, '%Y-%m-%dT%H:%M:%SZ') for a in df['datetime_utc'])  
-
-        
-        df.index = pd.to_datetime(df.datetime_utc)
-
-        df = df[(df.index >= fecha_inicio) & (df.index <= fecha_fin)]
+    #     La columna "datetime_utc" ya viene decodificada (datetime64 en UTC, sin huso ni microsegundos): el filtrado
+    #     se hace sobre el array de instantes y el índice se construye directamente desde él
+        instantes = df['datetime_utc'].to_numpy()
+        seleccion = (instantes >= np.datetime64(fecha_inicio, 'ns')) & (instantes <= np.datetime64(fecha_fin, 'ns'))
     #  2) Eliminamos el 29 de febrero, en caso de ser así requerido 
         # if inlcuye29DeFebrero.strip() != '':                        # Old code                  
         #    df = df[(df.index.day != 29) & (df.index.month != 2) ]   # Old code
+        indice = pd.DatetimeIndex(instantes, name='datetime_utc')
         if not incluye29DeFebrero:
-        # if not(incluye29DeFebrero.strip() != ''):                     # Neo code
-            df = df[~((df.index.day == 29) & (df.index.month == 2))]  # Neo code
+            seleccion &= ~((indice.month == 2) & (indice.day == 29))
+        df = df[seleccion]
+        df.index = indice[seleccion]
         self.__df = df
         return self.__df    
     
@@ -319,19 +573,17 @@ if __name__ == '__main__':
         AGNOHASTA = 2023 # 2023
         FICHERO_SALIDA = 'Datos_ESIOS_2007_2023_SIN_29s_DE_FEBRERO.csv'
                              
+        DIRECTORIO_ALMACEN = 'almacenEsios'   # Las siguientes ejecuciones solo descargan lo nuevo
+                             
         # Comienza Código
-        listaDeAgnos = range(AGNODESDE, AGNOHASTA + 1)
-        dataFrameSalida = pd.DataFrame()
-        
-        for agnoEnCurso in listaDeAgnos:
-            print(' ')
-            print('---------- Procesando año ', agnoEnCurso)
-            a =  BajadaDatosESIOS(CLAVEdeESIOS)
-            inicio = datetime(agnoEnCurso, 1, 1, 0, 0)      # comienzo del año
-            fin =  datetime(agnoEnCurso, 12, 31, 23, 0)    # fin del año
-            a.dataframe_lista_de_indicadores_de_esios_por_fechas([10211], inicio, fin, time_trunc='five_minutes')
-            dataFrameSalida = pd.concat([dataFrameSalida, a.df[['value']]], axis=0)
-              
-        dataFrameSalida.to_csv(FICHERO_SALIDA, sep=';')
+        from synthDataGen.common.almacenEsios import AlmacenEsios
+
+        almacen = AlmacenEsios(DIRECTORIO_ALMACEN)
+        a = BajadaDatosESIOS(CLAVEdeESIOS, valida_token=False)
+        agnadidos = almacen.sincroniza(a, 10211, 'five_minutes', desde=datetime(AGNODESDE, 1, 1, 0, 0), hasta=datetime(AGNOHASTA, 12, 31, 23, 0))
+        print('Valores añadidos al almacén: ', agnadidos)
+
+        dataFrameSalida = almacen.lee(10211, 'five_minutes', datetime(AGNODESDE, 1, 1, 0, 0), datetime(AGNOHASTA, 12, 31, 23, 0), incluye29DeFebrero=False)
+        dataFrameSalida[['value']].to_csv(FICHERO_SALIDA, sep=';')
         print('Terminado Proceso')
           
\ No newline at end of file
@@ -4,8 +4,8 @@
  Tras main: algunos ejemplos de utilización
 
 """
+import numpy as np
 import pandas as pd
-from scipy.stats import truncnorm
 from collections import OrderedDict
 
 
@@ -127,6 +127,90 @@ def resampleaDataFrame(df, frecuenciaSampleo, method='polynomial', order=2):
     return df
 
 
+def resampleaDataFrameDirecto(df, frecuenciaSampleo, method='polynomial', order=2, tamagnoBloque=2**20, **kwargs):
+    """ Igual que resampleaDataFrame, pero sin reindexar ni pasar por DataFrame.interpolate
+
+    El polinomio (method='polynomial', mismo interp1d de scipy que usa pandas) se ajusta una sola vez para todas las
+    columnas a la vez, y el spline (method='spline', UnivariateSpline) una vez por columna. Ambos se evalúan solo en los
+    puntos nuevos, por bloques, escribiendo directamente sobre la matriz de salida. Los puntos originales se copian tal cual.
+    El resultado coincide con el de resampleaDataFrame (salvo error de redondeo).
+
+    :param df: Un dataframe con index un datetimeIndex
+    :param frecuenciaSampleo: un string con la frecuencia de sampleo que se desea (ej. "2T" === 2 minutos)
+    :param method: 'polynomial' o 'spline'
+    :param order: Orden del polinomio o del spline
+    :param tamagnoBloque: Número máximo de valores evaluados de una vez (acota la memoria temporal)
+    :param kwargs: Parámetros adicionales para UnivariateSpline (solo con method='spline', como en df.interpolate)
+
+    :returns: df resampleado
+    :rtype: DataFrame
+    """
+    from scipy import interpolate
+
+    if method not in ('polynomial', 'spline'):
+        raise ValueError("Método de interpolación '" + str(method) + "' no soportado. Opciones: 'polynomial', 'spline'")
+
+    sampleoDeseado = pd.date_range(df.index[0], df.index[-1], freq=frecuenciaSampleo)
+    indice = df.index.union(sampleoDeseado)
+
+    # Posiciones (en el índice final) de los puntos originales y de los nuevos, que son los únicos a evaluar
+    posicionesOriginales = indice.get_indexer(df.index)
+    nuevos = np.ones(len(indice), dtype=bool)
+    nuevos[posicionesOriginales] = False
+
+    valores = df.to_numpy(dtype=float)
+    salida = np.empty((len(indice), valores.shape[1]))
+    salida[posicionesOriginales] = valores
+
+    x = df.index.asi8
+    xFinal = indice.asi8
+
+    def ajusta(xValidos, yValidos):
+        if method == 'polynomial':
+            return interpolate.interp1d(xValidos, yValidos, kind=order, axis=0, bounds_error=False)
+        return interpolate.UnivariateSpline(xValidos, yValidos, k=order, **kwargs)
+
+    def evalua(funcion, posiciones, columnas):
+        porBloque = max(1, tamagnoBloque // max(1, len(columnas)))
+        for inicio in range(0, len(posiciones), porBloque):
+            bloque = posiciones[inicio:inicio + porBloque]
+            resultado = funcion(xFinal[bloque])
+            if resultado.ndim == 1:
+                salida[bloque, columnas[0]] = resultado
+            elif len(columnas) == valores.shape[1]:
+                salida[bloque] = resultado
+            else:
+                salida[np.ix_(bloque, columnas)] = resultado
+
+    posicionesNuevas = np.flatnonzero(nuevos)
+    conHuecos = np.isnan(valores).any(axis=0)
+    completas = np.flatnonzero(~conHuecos)
+
+    # a) Columnas sin huecos: con 'polynomial' un único ajuste para todas ellas
+    if len(posicionesNuevas) and len(completas):
+        if method == 'polynomial':
+            evalua(ajusta(x, valores[:, completas]), posicionesNuevas, completas)
+        else:
+            for columna in completas:
+                evalua(ajusta(x, valores[:, columna]), posicionesNuevas, [columna])
+
+    # b) Columnas con huecos: como pandas, se ajustan solo con sus valores válidos y se rellenan también sus huecos,
+    #    salvo los anteriores al primer valor válido
+    for columna in np.flatnonzero(conHuecos):
+        validos = np.zeros(len(indice), dtype=bool)
+        validos[posicionesOriginales] = ~np.isnan(valores[:, columna])
+        aRellenar = np.flatnonzero(~validos)
+        salida[aRellenar, columna] = np.nan
+        if not validos.any():
+            continue
+        aRellenar = aRellenar[aRellenar > np.argmax(validos)]
+        if len(aRellenar):
+            evalua(ajusta(xFinal[validos], salida[validos, columna]), aRellenar, [columna])
+
+    return pd.DataFrame(salida, index=indice, columns=df.columns)
+
+
+
         
 if __name__ == "__main__":
      
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""Caché persistente en disco para las respuestas de ESIOS
+
+Clase: CacheEsios
+Cada respuesta (un indicador para un rango de fechas y un time_trunc) se guarda como un fichero .npz comprimido,
+con un array por columna, de forma que leerla de nuevo no requiere ninguna llamada a ESIOS.
+
+ - Los rangos ya cerrados (pasados) no caducan nunca: ESIOS no los modifica.
+ - Los rangos recientes o aún abiertos caducan tras un tiempo de vida (TTL) configurable.
+ - El tamaño total está acotado: al superarlo se eliminan las entradas usadas hace más tiempo (LRU).
+ - En modo fuera de línea solo se sirve desde la caché (incluso entradas caducadas) y nunca se accede a la red.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+class CacheEsios:
+    """ Caché en disco de las respuestas de ESIOS, indexada por indicador, rango de fechas y time_trunc
+
+    :param directorio: Directorio donde se guardan las entradas (se crea si no existe)
+    :type  cadena: Es una cadena de caracteres
+
+    :param ttl_horas: Tiempo de vida, en horas, de las entradas cuyo rango es reciente
+    :param dias_recientes: Un rango se considera reciente si acaba hace menos de estos días (ESIOS aún puede revisarlo)
+    :param tamagno_maximo_mb: Tamaño máximo de la caché en MB. None == sin límite
+    :param fuera_de_linea: Si es True, solo se sirve desde la caché
+    """
+    _EXTENSION = '.npz'
+    _COLUMNAS = '__columnas__'
+    _GUARDADO = '__guardado__'
+    _FECHAS = '__fechas__'
+    _TEXTOS = '__textos__'
+    _NULOS = '__nulos__'
+    _NINGUNO, _NAN = 1, 2
+
+    def __init__(self, directorio, ttl_horas=1, dias_recientes=7, tamagno_maximo_mb=None, fuera_de_linea=False):
+        self.__directorio = os.path.expanduser(directorio)
+        self.__ttl = timedelta(hours=ttl_horas)
+        self.__margen_reciente = timedelta(days=dias_recientes)
+        self.__tamagno_maximo = None if tamagno_maximo_mb is None else tamagno_maximo_mb * 1024 * 1024
+        self.__fuera_de_linea = fuera_de_linea
+        self.__cerrojo = threading.Lock()
+
+        os.makedirs(self.__directorio, exist_ok=True)
+
+    @property
+    def directorio(self):
+        """ Devuelve el directorio de la caché
+        """
+        return self.__directorio
+
+    @property
+    def fuera_de_linea(self):
+        """ Indica si la caché trabaja en modo fuera de línea (sin acceso a la red)
+        """
+        return self.__fuera_de_linea
+
+    def clave(self, indicador, fecha_inicio, fecha_fin, time_trunc, origen=''):
+        """ Devuelve la clave (nombre de fichero) de una petición
+
+        :param origen: Cualquier cadena que distinga la fuente de datos (p.ej. el end point), para no mezclar entradas
+        """
+        firma = f'{origen}|{indicador}|{fecha_inicio.isoformat()}|{fecha_fin.isoformat()}|{time_trunc}'
+        return f'{indicador}_{time_trunc}_{hashlib.sha256(firma.encode()).hexdigest()[:24]}'
+
+    def __ruta(self, clave):
+        return os.path.join(self.__directorio, clave + self._EXTENSION)
+
+    def __es_reciente(self, fecha_fin):
+        return fecha_fin >= datetime.now() - self.__margen_reciente
+
+    def lee(self, clave, fecha_fin=None, ttl_horas=None):
+        """ Devuelve el dataframe guardado bajo la clave, o None si no existe o ha caducado
+
+        :param fecha_fin: Fin del rango de fechas de la petición: si es reciente, la entrada caduca tras el TTL de la caché
+        :param ttl_horas: Tiempo de vida propio de la entrada, que prevalece sobre el criterio anterior (p.ej. para el catálogo)
+
+        :raises: :class: ` Runtime Error `: En modo fuera de línea, si la entrada no existe
+        """
+        ruta = self.__ruta(clave)
+        try:
+            with np.load(ruta, allow_pickle=False) as contenido:
+                guardado = datetime.fromisoformat(str(contenido[self._GUARDADO]))
+                if ttl_horas is not None:
+                    caducado = datetime.now() - guardado > timedelta(hours=ttl_horas)
+                else:
+                    caducado = fecha_fin is not None and self.__es_reciente(fecha_fin) and datetime.now() - guardado > self.__ttl
+
+                if caducado and not self.__fuera_de_linea:
+                    return None
+
+                columnas = list(contenido[self._COLUMNAS])
+                fechas = set(contenido[self._FECHAS]) if self._FECHAS in contenido.files else set()
+                textos = list(contenido[self._TEXTOS]) if self._TEXTOS in contenido.files else []
+                df = pd.DataFrame({columna: contenido[columna].view('datetime64[ns]') if columna in fechas else
+                                            self.__restaura_texto(contenido[columna], contenido[f'{self._NULOS}{textos.index(columna)}']) if columna in textos else
+                                            contenido[columna]
+                                   for columna in columnas}, columns=columnas)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            if self.__fuera_de_linea:
+                raise RuntimeError("Modo fuera de línea: la petición '" + clave + "' no está en la caché.")
+            return None
+
+        self.__marca_uso(ruta)
+        return df
+
+    def guarda(self, clave, df):
+        """ Guarda el dataframe bajo la clave, en formato columnar comprimido. Escritura atómica
+
+        Las columnas numéricas se guardan tal cual, las de fechas (datetime64 sin huso) como enteros de nanosegundos y el resto como cadenas,
+        junto con una marca de los valores nulos (None o NaN), que al leer vuelven a ser None o NaN. Los demás valores vuelven como cadenas
+        """
+        fechas = [columna for columna in df.columns if df[columna].dtype.kind == 'M' and getattr(df[columna].dtype, 'tz', None) is None]
+        textos = [columna for columna in df.columns if columna not in fechas and df[columna].dtype.kind not in 'biuf']
+        columnas = {columna: df[columna].to_numpy().astype('datetime64[ns]').view(np.int64) if columna in fechas else
+                             df[columna].to_numpy() if columna not in textos else df[columna].to_numpy().astype(str)
+                    for columna in df.columns}
+        for posicion, columna in enumerate(textos):
+            columnas[f'{self._NULOS}{posicion}'] = self.__marca_nulos(df[columna].to_numpy())
+        columnas[self._COLUMNAS] = np.array(list(df.columns), dtype=str)
+        columnas[self._FECHAS] = np.array(fechas, dtype=str)
+        columnas[self._TEXTOS] = np.array(textos, dtype=str)
+        columnas[self._GUARDADO] = np.array(datetime.now().isoformat())
+
+        descriptor, temporal = tempfile.mkstemp(dir=self.__directorio, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as fichero:
+                np.savez_compressed(fichero, **columnas)
+            os.replace(temporal, self.__ruta(clave))
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        self.__aplica_limite_de_tamagno()
+
+    def __marca_nulos(self, valores):
+        nulos = np.zeros(len(valores), dtype=np.int8)
+        nulos[[valor is None for valor in valores]] = self._NINGUNO
+        nulos[[isinstance(valor, float) and valor != valor for valor in valores]] = self._NAN
+        return nulos
+
+    def __restaura_texto(self, valores, nulos):
+        if not nulos.any():
+            return valores
+
+        valores = valores.astype(object)
+        valores[nulos == self._NINGUNO] = None
+        valores[nulos == self._NAN] = np.nan
+        return valores
+
+    def __marca_uso(self, ruta):
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+
+    def __aplica_limite_de_tamagno(self):
+        """ Elimina las entradas usadas hace más tiempo hasta que la caché cabe en el tamaño máximo (LRU)
+        """
+        if self.__tamagno_maximo is None:
+            return
+
+        with self.__cerrojo:
+            entradas = []
+            for entrada in os.scandir(self.__directorio):
+                if entrada.name.endswith(self._EXTENSION):
+                    try:
+                        informacion = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    entradas.append((informacion.st_mtime, informacion.st_size, entrada.path))
+
+            total = sum(tamagno for _, tamagno, _ in entradas)
+            for _, tamagno, ruta in sorted(entradas):
+                if total <= self.__tamagno_maximo:
+                    break
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+                total -= tamagno
+
+    def vacia(self):
+        """ Elimina todas las entradas de la caché
+        """
+        for entrada in os.scandir(self.__directorio):
+            if entrada.name.endswith(self._EXTENSION):
+                os.remove(entrada.path)
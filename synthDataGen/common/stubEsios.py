@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""Servidor local que imita el API de ESIOS, para pruebas y medidas de rendimiento sin acceso a la red
+
+Clase: ServidorEsiosSimulado
+Sirve '/indicators' (catálogo) y '/indicators/{id}' (valores) con la misma forma json que ESIOS, a partir de series sintéticas
+deterministas: la misma petición devuelve siempre los mismos valores, y cada valor depende solo del indicador y del instante.
+
+ - Latencia configurable por petición y por valor devuelto.
+ - Límite de peticiones por segundo: por encima, responde 429 con la cabecera Retry-After.
+ - Inyección de errores: una tasa aleatoria (con semilla) de errores 5xx y de conexiones cortadas, o una lista de códigos para las siguientes peticiones.
+ - Si se le da un token, rechaza con 403 las peticiones que traigan otro.
+
+Uso:
+    with ServidorEsiosSimulado(latencia_segundos=0.05) as servidor:
+        a = BajadaDatosESIOS(token, end_point=servidor.end_point)
+
+o como proceso aparte:  python -m synthDataGen.common.stubEsios --puerto 8080 --latencia 0.05
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+
+HUSO_PENINSULA = 'Europe/Madrid'
+PASOS_TIME_TRUNC = {'five_minutes': '5min', 'ten_minutes': '10min', 'fifteen_minutes': '15min', 'hour': 'H', 'hours': 'H', 'day': 'D'}
+CATALOGO_POR_DEFECTO = {10211: 'Precio medio horario componente mercado diario',
+                        600: 'Precio mercado SPOT Diario',
+                        1001: 'Término de facturación de energía activa del PVPC 2.0TD'}
+ZONA_POR_DEFECTO = (8741, 'Península')
+
+
+def serie_sintetica(indicador, instantes_utc):
+    """ Devuelve los valores deterministas del indicador en los instantes dados
+
+    Un perfil diario y anual con un nivel propio de cada indicador, más un ruido pseudoaleatorio que solo depende del instante y del indicador
+
+    :param indicador: id del indicador
+    :param instantes_utc: pandas.DatetimeIndex de los instantes (en UTC o sin huso horario, interpretado como UTC)
+    """
+    nanosegundos = instantes_utc.asi8
+    horas = nanosegundos / 3.6e12
+
+    mezcla = (nanosegundos // 10**9).astype(np.uint64) * np.uint64(2654435761) + np.uint64(indicador * 40503)
+    ruido = (mezcla % np.uint64(10007)).astype(float) / 10007 * 4 - 2
+
+    valores = 50 + (indicador % 7) * 5 + 20 * np.sin(2 * np.pi * horas / 24) + 10 * np.sin(2 * np.pi * horas / 8766) + ruido
+    return np.round(valores, 2)
+
+
+class _ManejadorEsios(BaseHTTPRequestHandler):
+    """ Atiende las peticiones GET del servidor simulado (ver ServidorEsiosSimulado)
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def __responde(self, estado, cuerpo=None, cabeceras=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+        self.send_response(estado)
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+        self.server.simulador._anota_respuesta(estado)
+
+    def do_GET(self):
+        simulador = self.server.simulador
+        ruta = urlparse(self.path)
+
+        decision = simulador._decide_fallo(self.headers.get('x-api-key'))
+        time.sleep(simulador.latencia_segundos)
+
+        if decision == 'desconexion':
+            simulador._anota_respuesta(None)
+            self.close_connection = True
+            return
+        if decision is not None:
+            estado, cabeceras = decision
+            return self.__responde(estado, {'message': 'Error simulado'}, cabeceras)
+
+        partes = [parte for parte in ruta.path.split('/') if parte]
+        if partes == ['indicators']:
+            return self.__responde(200, simulador.catalogo())
+
+        if len(partes) != 2 or partes[0] != 'indicators' or not partes[1].isdigit():
+            return self.__responde(404, {'message': 'Recurso no encontrado'})
+
+        try:
+            consulta = parse_qs(ruta.query)
+            cuerpo, numero_de_valores = simulador.valores(int(partes[1]),
+                                                          consulta['start_date'][0],
+                                                          consulta['end_date'][0],
+                                                          consulta.get('time_trunc', ['hour'])[0])
+        except (KeyError, ValueError) as error:
+            return self.__responde(400, {'message': 'Petición no válida: ' + str(error)})
+
+        time.sleep(simulador.latencia_por_valor * numero_de_valores)
+        self.__responde(200, cuerpo)
+
+
+class ServidorEsiosSimulado:
+    """ Servidor HTTP local con la forma del API de ESIOS y series sintéticas deterministas
+
+    :param puerto: Puerto en el que escucha. 0 == uno libre cualquiera (ver end_point)
+    :param latencia_segundos: Espera antes de responder cada petición
+    :param latencia_por_valor: Espera adicional por cada valor devuelto (simula el coste de las respuestas grandes)
+    :param peticiones_por_segundo: Límite de peticiones en cualquier ventana de un segundo. None == sin límite
+    :param tasa_errores: Probabilidad de responder una petición con un error 5xx (ver codigos_error)
+    :param tasa_desconexiones: Probabilidad de cortar la conexión sin responder
+    :param codigos_error: Códigos entre los que se elige el error de tasa_errores
+    :param token: Si no es None, las peticiones con otro x-api-key se rechazan con 403
+    :param catalogo: Diccionario id: nombre de los indicadores del catálogo. Se sirven valores de cualquier id, esté o no en él
+    :param semilla: Semilla de la elección de los errores y desconexiones
+    :param zonas: Diccionario id: lista de (geo_id, geo_name) de los indicadores que se sirven para varias zonas, como p.ej. el 600
+                  (España, Portugal...). Los demás se sirven para una sola (ZONA_POR_DEFECTO). Cada zona desplaza la serie una unidad
+    """
+    def __init__(self, puerto=0, latencia_segundos=0.0, latencia_por_valor=0.0, peticiones_por_segundo=None,
+                 tasa_errores=0.0, tasa_desconexiones=0.0, codigos_error=(500, 502, 503), token=None,
+                 catalogo=None, semilla=0, zonas=None):
+        self.latencia_segundos = latencia_segundos
+        self.latencia_por_valor = latencia_por_valor
+        self.peticiones_por_segundo = peticiones_por_segundo
+        self.tasa_errores = tasa_errores
+        self.tasa_desconexiones = tasa_desconexiones
+        self.codigos_error = tuple(codigos_error)
+        self.token = token
+        self.__catalogo = dict(CATALOGO_POR_DEFECTO if catalogo is None else catalogo)
+        self.__zonas = dict(zonas or {})
+
+        self.__cerrojo = threading.Lock()
+        self.__azar = random.Random(semilla)
+        self.__errores_pendientes = deque()
+        self.__instantes_recientes = deque()
+        self.reinicia_estadisticas()
+
+        self.__servidor = ThreadingHTTPServer(('127.0.0.1', puerto), _ManejadorEsios)
+        self.__servidor.daemon_threads = True
+        self.__servidor.simulador = self
+        self.__hilo = None
+
+    @property
+    def end_point(self):
+        """ Devuelve la URL del recurso de indicadores, para BajadaDatosESIOS o el endPoint de ESIOSLoader
+        """
+        return f'http://127.0.0.1:{self.__servidor.server_address[1]}/indicators'
+
+    @property
+    def estadisticas(self):
+        """ Devuelve un diccionario con el número de peticiones, los valores servidos y las respuestas por código (None == desconexión)
+        """
+        with self.__cerrojo:
+            return {'peticiones': self.__peticiones, 'valores': self.__valores, 'respuestas': dict(self.__respuestas)}
+
+    def reinicia_estadisticas(self):
+        """ Pone a cero los contadores
+        """
+        with self.__cerrojo:
+            self.__peticiones = 0
+            self.__valores = 0
+            self.__respuestas = {}
+
+    def inyecta_errores(self, codigos, retry_after=None):
+        """ Las siguientes peticiones, una por código, se responden con esos códigos (o se cortan, con el código None)
+
+        :param codigos: Lista de códigos HTTP
+        :param retry_after: Valor de la cabecera Retry-After de esas respuestas. None == sin cabecera
+        """
+        with self.__cerrojo:
+            self.__errores_pendientes.extend((codigo, retry_after) for codigo in codigos)
+
+    def arranca(self):
+        """ Atiende las peticiones en un hilo aparte. Devuelve el propio servidor
+        """
+        self.__hilo = threading.Thread(target=self.__servidor.serve_forever, daemon=True)
+        self.__hilo.start()
+        return self
+
+    def para(self):
+        """ Deja de atender peticiones y libera el puerto
+        """
+        if self.__hilo is not None:
+            self.__servidor.shutdown()
+            self.__hilo.join()
+            self.__hilo = None
+        self.__servidor.server_close()
+
+    def __enter__(self):
+        return self.arranca()
+
+    def __exit__(self, *args):
+        self.para()
+
+    def _anota_respuesta(self, estado):
+        with self.__cerrojo:
+            self.__respuestas[estado] = self.__respuestas.get(estado, 0) + 1
+
+    def _decide_fallo(self, token):
+        """ Devuelve None si la petición debe atenderse, 'desconexion', o el (código, cabeceras) del error con el que responder
+        """
+        with self.__cerrojo:
+            self.__peticiones += 1
+
+            if self.token is not None and token != self.token:
+                return (403, {})
+
+            if self.__errores_pendientes:
+                codigo, retry_after = self.__errores_pendientes.popleft()
+                if codigo is None:
+                    return 'desconexion'
+                return (codigo, {} if retry_after is None else {'Retry-After': str(retry_after)})
+
+            if self.peticiones_por_segundo is not None:
+                ahora = time.monotonic()
+                while self.__instantes_recientes and ahora - self.__instantes_recientes[0] >= 1:
+                    self.__instantes_recientes.popleft()
+                if len(self.__instantes_recientes) >= self.peticiones_por_segundo:
+                    espera = 1 - (ahora - self.__instantes_recientes[0])
+                    return (429, {'Retry-After': f'{espera:.3f}'})
+                self.__instantes_recientes.append(ahora)
+
+            sorteo = self.__azar.random()
+            if sorteo < self.tasa_desconexiones:
+                return 'desconexion'
+            if sorteo < self.tasa_desconexiones + self.tasa_errores:
+                return (self.__azar.choice(self.codigos_error), {})
+
+        return None
+
+    def catalogo(self):
+        """ Devuelve el json del catálogo de indicadores
+        """
+        return {'indicators': [{'id': indicador, 'name': nombre, 'short_name': nombre,
+                                'description': '<p>' + nombre + ' (serie sintética)</p>'}
+                               for indicador, nombre in self.__catalogo.items()]}
+
+    def valores(self, indicador, inicio, fin, time_trunc):
+        """ Devuelve el json de los valores de un indicador entre dos fechas (hora peninsular, como las envía BajadaDatosESIOS) y su número de valores
+        """
+        if time_trunc not in PASOS_TIME_TRUNC:
+            raise ValueError("time_trunc '" + time_trunc + "' no soportado")
+
+        paso = PASOS_TIME_TRUNC[time_trunc]
+        inicio = pd.Timestamp(inicio).tz_localize(HUSO_PENINSULA, ambiguous=True, nonexistent='shift_forward')
+        fin = pd.Timestamp(fin).tz_localize(HUSO_PENINSULA, ambiguous=True, nonexistent='shift_forward')
+
+        if paso == 'D':
+            instantes = pd.date_range(inicio.ceil('D', ambiguous=True, nonexistent='shift_forward'), fin, freq='D')
+        else:
+            instantes = pd.date_range(inicio.tz_convert('UTC').ceil(paso), fin.tz_convert('UTC'), freq=paso).tz_convert(HUSO_PENINSULA)
+
+        instantes_utc = instantes.tz_convert('UTC')
+        locales = instantes.strftime('%Y-%m-%dT%H:%M:%S.000%z')
+        utc = instantes_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+        nombre = self.__catalogo.get(indicador, 'Indicador sintético ' + str(indicador))
+
+        zonas = self.__zonas.get(indicador, [ZONA_POR_DEFECTO])
+
+        # Como en ESIOS, los valores de las distintas zonas van intercalados por instante
+        valores = [{'value': valor + desplazamiento,
+                    'datetime': local[:-2] + ':' + local[-2:],
+                    'datetime_utc': instante_utc,
+                    'tz_time': instante_utc[:-1] + '.000Z',
+                    'geo_id': geo_id,
+                    'geo_name': geo_name}
+                   for valor, local, instante_utc in zip(serie_sintetica(indicador, instantes_utc).tolist(), locales, utc)
+                   for desplazamiento, (geo_id, geo_name) in enumerate(zonas)]
+
+        with self.__cerrojo:
+            self.__valores += len(valores)
+
+        return {'indicator': {'id': indicador, 'name': nombre, 'short_name': nombre, 'values': valores}}, len(valores)
+
+
+if __name__ == '__main__':
+    analizador = argparse.ArgumentParser(description='Servidor local que imita el API de ESIOS con series sintéticas deterministas')
+    analizador.add_argument('--puerto', type=int, default=8080)
+    analizador.add_argument('--latencia', type=float, default=0.0, help='segundos de espera por petición')
+    analizador.add_argument('--latencia-por-valor', type=float, default=0.0, help='segundos de espera por valor devuelto')
+    analizador.add_argument('--peticiones-por-segundo', type=float, default=None)
+    analizador.add_argument('--tasa-errores', type=float, default=0.0)
+    analizador.add_argument('--tasa-desconexiones', type=float, default=0.0)
+    analizador.add_argument('--token', default=None)
+    analizador.add_argument('--semilla', type=int, default=0)
+    opciones = analizador.parse_args()
+
+    servidor = ServidorEsiosSimulado(opciones.puerto, opciones.latencia, opciones.latencia_por_valor, opciones.peticiones_por_segundo,
+                                     opciones.tasa_errores, opciones.tasa_desconexiones, token=opciones.token, semilla=opciones.semilla)
+    print('Sirviendo ESIOS simulado en ' + servidor.end_point + ' (Ctrl+C para terminar)')
+    try:
+        servidor.arranca()
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.para()
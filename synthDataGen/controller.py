@@ -1,17 +1,28 @@
 import os
+import glob
 import json
+import time
+import hashlib
 import inspect
+import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from importlib.resources import files
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+from synthDataGen.instrumentation import instrumented
+
 
 class LoaderInterface:
 
     indexName = "datetime"
+    variableLevelName = "variable"  # Column levels when several variables are loaded at once: (variable, year)
+    yearLevelName = "year"
 
     def __init__(self, paramsFileName: str):
         """Loads the main parameters from the specified input JSON.
@@ -57,9 +68,59 @@ class LoaderInterface:
         """
         raise NotImplementedError
 
+    def _getFramesForWindows(self, initialYear: int, windows: List[Tuple[datetime, int]], include29February: bool) -> List[pd.DataFrame]:
+        # Loaders able to prepare their source once for every window override this
+        return [self.getDataFromSource(initialYear, initDatetime, hoursAhead, include29February) for initDatetime, hoursAhead in windows]
+
+    @instrumented()
+    def getDataForWindows(self, initialYear: int, windows: List[Tuple[datetime, int]], include29February: bool = False, asArray: bool = False) -> List[pd.DataFrame] | np.ndarray:
+        """Same as getDataFromSource(...) for many windows at once. The source is loaded and prepared only once for all of them.
+
+        :param int initialYear: first year considered for the request.
+        :param list windows: list of (initDatetime, hoursAhead) tuples, each one defining a window as in getDataFromSource(...).
+        :param bool include29February: indicates whether or not to include the February 29 in the returned DataFrames.
+        :param bool asArray: if True, the DataFrames are stacked into a single (windows x rows x years) array. All of them must have the same shape.
+        :returns list[pandas.DataFrame] | numpy.ndarray:
+        """
+        frames: List[pd.DataFrame] = self._getFramesForWindows(initialYear, list(windows), include29February)
+
+        if not asArray:
+            return frames
+
+        if len(set(frame.shape for frame in frames)) > 1:
+            raise ValueError("All the windows must have the same number of rows and years to be stacked into an array. Please, use asArray = False instead.")
+
+        return np.stack([frame.to_numpy(dtype = float) for frame in frames]) if frames else np.empty((0, 0, 0))
+
+class _RateLimiter:
+    """Spaces out the calls to wait() so that no more than 'requestsPerSecond' of them are let through per second. Thread-safe."""
+
+    def __init__(self, requestsPerSecond: float = None):
+        self._interval: float = 1 / requestsPerSecond if requestsPerSecond else 0
+        self._nextSlot: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self._interval:
+            return
+
+        with self._lock:
+            now: float = time.monotonic()
+            slot: float = max(self._nextSlot, now)
+            self._nextSlot = slot + self._interval
+
+        time.sleep(slot - now)
+
 class ESIOSLoader(LoaderInterface):
 
-    from synthDataGen.common import bibliotecaEsios
+    from synthDataGen.common import bibliotecaEsios, cacheEsios, almacenEsios
+
+    # Rough cost model used by the fetch planner: fixed cost of every request plus a cost per requested point
+    _requestOverheadSeconds: float = 0.5
+    _secondsPerPoint: float = 1.5e-4
+
+    _timeTruncSteps: Dict[str, timedelta] = {"five_minutes": timedelta(minutes = 5), "ten_minutes": timedelta(minutes = 10), "fifteen_minutes": timedelta(minutes = 15),
+                                             "hour": timedelta(hours = 1), "hours": timedelta(hours = 1), "day": timedelta(days = 1)}
 
     def __init__(self, paramsFileName: str):
         data = self._getJSON(paramsFileName)
@@ -73,9 +134,25 @@ class ESIOSLoader(LoaderInterface):
 
         self.__esiosKey = json.loads(keysJSONFile)["ESIOS_KEY"]
 
-        self._indicador: List[int] = data["ESIOS_params"]["indicador"]
+        self._indicador: int | List[int] = data["ESIOS_params"]["indicador"]
         self._time_trunc: str = data["ESIOS_params"]["time_trunc"]
 
+        self._endPoint: str = data["ESIOS_params"].get("endPoint", "https://api.esios.ree.es/indicators")
+        self._maxWorkers: int = data["ESIOS_params"].get("maxWorkers", 1)
+        self._requestsPerSecond: float = data["ESIOS_params"].get("requestsPerSecond", None)
+
+        self._cacheDir: str = data["ESIOS_params"].get("cacheDir", None)
+        self._cacheTTLHours: float = data["ESIOS_params"].get("cacheTTLHours", 1)
+        self._cacheMaxMB: float = data["ESIOS_params"].get("cacheMaxMB", None)
+        self._offline: bool = data["ESIOS_params"].get("offline", False)
+        self._storeDir: str = data["ESIOS_params"].get("storeDir", None)
+        self._store = None
+
+        self._geoId: int = data["ESIOS_params"].get("geoId", None)
+
+        self._fetchStrategy: str = data["ESIOS_params"].get("fetchStrategy", "auto")
+        self._maxPointsPerRequest: int = data["ESIOS_params"].get("maxPointsPerRequest", 10000)
+
     @property
     def keysFileDir(self):
         return self._keysFileDir
@@ -92,6 +169,55 @@ class ESIOSLoader(LoaderInterface):
     def time_trunc(self):
         return self._time_trunc
 
+    @property
+    def endPoint(self):
+        return self._endPoint
+
+    @property
+    def maxWorkers(self):
+        return self._maxWorkers
+
+    @property
+    def requestsPerSecond(self):
+        return self._requestsPerSecond
+
+    @property
+    def cacheDir(self):
+        return self._cacheDir
+
+    @property
+    def cacheTTLHours(self):
+        return self._cacheTTLHours
+
+    @property
+    def cacheMaxMB(self):
+        return self._cacheMaxMB
+
+    @property
+    def offline(self):
+        return self._offline
+
+    @property
+    def storeDir(self):
+        return self._storeDir
+
+    @property
+    def geoId(self):
+        return self._geoId
+
+    @property
+    def fetchStrategy(self):
+        return self._fetchStrategy
+
+    @property
+    def maxPointsPerRequest(self):
+        return self._maxPointsPerRequest
+
+    @property
+    def requestStats(self):
+        """Timing counters of the HTTP requests made to ESIOS, shared by every loader instance."""
+        return self.bibliotecaEsios.ESTADISTICAS
+
     @keysFileDir.setter
     def keysFileDir(self, new_keysFileDir: str):
         self._keysFileDir = new_keysFileDir
@@ -101,13 +227,57 @@ class ESIOSLoader(LoaderInterface):
         self._keysFileName = new_keysFileName
 
     @indicador.setter
-    def indicador(self, new_indicador: str):
+    def indicador(self, new_indicador: int | List[int]):
         self._indicador = new_indicador
 
     @time_trunc.setter
     def time_trunc(self, new_time_trunc: str):
         self._time_trunc = new_time_trunc
 
+    @endPoint.setter
+    def endPoint(self, new_endPoint: str):
+        self._endPoint = new_endPoint
+
+    @maxWorkers.setter
+    def maxWorkers(self, new_maxWorkers: int):
+        self._maxWorkers = new_maxWorkers
+
+    @requestsPerSecond.setter
+    def requestsPerSecond(self, new_requestsPerSecond: float):
+        self._requestsPerSecond = new_requestsPerSecond
+
+    @cacheDir.setter
+    def cacheDir(self, new_cacheDir: str):
+        self._cacheDir = new_cacheDir
+
+    @cacheTTLHours.setter
+    def cacheTTLHours(self, new_cacheTTLHours: float):
+        self._cacheTTLHours = new_cacheTTLHours
+
+    @cacheMaxMB.setter
+    def cacheMaxMB(self, new_cacheMaxMB: float):
+        self._cacheMaxMB = new_cacheMaxMB
+
+    @offline.setter
+    def offline(self, new_offline: bool):
+        self._offline = new_offline
+
+    @storeDir.setter
+    def storeDir(self, new_storeDir: str):
+        self._storeDir = new_storeDir
+
+    @geoId.setter
+    def geoId(self, new_geoId: int):
+        self._geoId = new_geoId
+
+    @fetchStrategy.setter
+    def fetchStrategy(self, new_fetchStrategy: str):
+        self._fetchStrategy = new_fetchStrategy
+
+    @maxPointsPerRequest.setter
+    def maxPointsPerRequest(self, new_maxPointsPerRequest: int):
+        self._maxPointsPerRequest = new_maxPointsPerRequest
+
     def _getPackageName(self):
         if __package__:
             return __package__
@@ -116,11 +286,29 @@ class ESIOSLoader(LoaderInterface):
         else:
             return __name__.split('.')[0]
 
+    def _getCache(self):
+        if not self.cacheDir:
+            if self.offline:
+                raise Exception("The offline mode requires a 'cacheDir' to serve the data from.")
+            return None
+
+        return self.cacheEsios.CacheEsios(self.cacheDir, ttl_horas = self.cacheTTLHours, tamagno_maximo_mb = self.cacheMaxMB, fuera_de_linea = self.offline)
+
+    def _getStore(self):
+        if not self.storeDir:
+            return None
+
+        # Kept across loads, so that the stored history is read from disk only once
+        if self._store is None or self._store.directorio != os.path.expanduser(self.storeDir):
+            self._store = self.almacenEsios.AlmacenEsios(self.storeDir)
+
+        return self._store
+
     def _isLeapYear(self, year: int):
         return ((year % 400 == 0) or (year % 100 != 0) and
                                      (year % 4 == 0))
 
-    def _getDataForYear(self, year: int, initDatetime: datetime, hoursAhead: int, include29February: bool, esios) -> pd.DataFrame:
+    def _getYearWindow(self, year: int, initDatetime: datetime, hoursAhead: int, include29February: bool) -> Tuple[datetime, datetime]:
         initialDate: datetime = datetime(year, 
                                         initDatetime.month, initDatetime.day, initDatetime.hour, initDatetime.minute)
         endDate: datetime = initialDate + timedelta(hours = hoursAhead)
@@ -130,24 +318,161 @@ class ESIOSLoader(LoaderInterface):
            endDate.date() != initialDate.date():
             endDate = endDate + timedelta(hours=24)
 
-        return esios.dataframe_lista_de_indicadores_de_esios_por_fechas([self.indicador], 
-                                                                        initialDate, endDate, include29February,
-                                                                        time_trunc = self.time_trunc).filter(["value"], axis = 1)
+        return (initialDate, endDate)
 
-    def _getDataForFirstYear(self, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool, esios) -> pd.DataFrame:
-        return self._getDataForYear(initialYear, initDatetime, hoursAhead, include29February, esios).rename(columns = {"value": initialYear})
+    def _getTimeTruncStep(self) -> timedelta:
+        return self._timeTruncSteps.get(self.time_trunc, None)
 
-    def _getDataForTheRestOfYears(self, df: pd.DataFrame, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool, esios) -> pd.DataFrame:
-        for year in range(initialYear + 1, datetime.now().year):
-            df[year] = list(self._getDataForYear(year, initDatetime, hoursAhead, include29February, esios)["value"])
+    def _getNumberOfPoints(self, dateRange: Tuple[datetime, datetime], step: timedelta) -> int:
+        return int((dateRange[1] - dateRange[0]) / step) + 1
 
-        return df
+    def _groupWindows(self, windows: List[Tuple[datetime, datetime]], step: timedelta) -> List[Tuple[datetime, datetime]]:
+        """Merges consecutive windows into a single range as long as the range fits in one request. Windows must be sorted."""
+        groups: List[List[datetime]] = []
 
-    def getDataFromSource(self, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool = False) -> pd.DataFrame:
-        esiosInstance = self.bibliotecaEsios.BajadaDatosESIOS(self.__esiosKey)
+        for start, end in windows:
+            if groups and self._getNumberOfPoints((groups[-1][0], end), step) <= self.maxPointsPerRequest:
+                groups[-1][1] = max(groups[-1][1], end)
+            else:
+                groups.append([start, end])
+
+        return [(start, end) for start, end in groups]
+
+    def _splitRanges(self, ranges: List[Tuple[datetime, datetime]], step: timedelta) -> List[Tuple[datetime, datetime]]:
+        """Splits every range that exceeds the size limit of the API into contiguous, non-overlapping chunks."""
+        chunks: List[Tuple[datetime, datetime]] = []
+
+        for start, end in ranges:
+            while self._getNumberOfPoints((start, end), step) > self.maxPointsPerRequest:
+                chunkEnd: datetime = start + (self.maxPointsPerRequest - 1) * step
+                chunks.append((start, chunkEnd))
+                # ESIOS instants are whole minutes: starting one minute later leaves no gap, even off the time_trunc grid
+                start = chunkEnd + timedelta(minutes = 1)
+
+            chunks.append((start, end))
+
+        return chunks
+
+    def _estimateFetchSeconds(self, ranges: List[Tuple[datetime, datetime]], step: timedelta) -> float:
+        # maxWorkers = None means the default size of ThreadPoolExecutor
+        workers: int = self.maxWorkers or min(32, (os.cpu_count() or 1) + 4)
+        rounds: int = -(-len(ranges) // workers)
+        points: int = sum(self._getNumberOfPoints(dateRange, step) for dateRange in ranges)
+
+        return rounds * self._requestOverheadSeconds + points * self._secondsPerPoint
+
+    def _planFetch(self, windows: List[Tuple[datetime, datetime]]) -> str:
+        """Chooses between one request per window ("perYear") and a few wide requests sliced locally afterwards ("coalesced")."""
+        if self.fetchStrategy not in ["auto", "perYear", "coalesced"]:
+            raise ValueError("Fetch strategy '" + str(self.fetchStrategy) + "' not valid. Please choose one of the following: 'auto', 'perYear', 'coalesced'.")
+
+        step: timedelta = self._getTimeTruncStep()
+
+        if self.fetchStrategy != "auto":
+            if self.fetchStrategy == "coalesced" and step is None:
+                raise ValueError("The 'coalesced' fetch strategy is not available for time_trunc '" + str(self.time_trunc) + "'.")
+            return self.fetchStrategy
+
+        if step is None:
+            return "perYear"
+
+        perYearSeconds: float = self._estimateFetchSeconds(windows, step)
+        coalescedSeconds: float = self._estimateFetchSeconds(self._splitRanges(self._groupWindows(windows, step), step), step)
+
+        return "coalesced" if coalescedSeconds < perYearSeconds else "perYear"
+
+    def _selectGeo(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Keeps the values of the requested geo_id for the indicators that come for several geo_ids. The rest are kept as they are."""
+        geosByIndicator: pd.Series = df.groupby("id")["geo_id"].nunique()
+        severalGeos: pd.Index = geosByIndicator.index[geosByIndicator > 1]
+
+        if len(severalGeos) == 0:
+            return df
+
+        if self.geoId is None or not (df.loc[df["id"].isin(severalGeos), "geo_id"] == self.geoId).any():
+            raise Exception("Indicator(s) " + ", ".join(map(str, severalGeos)) + " come for several geo_ids (" +
+                            ", ".join(map(str, sorted(df.loc[df["id"].isin(severalGeos), "geo_id"].unique()))) + "). Please choose one of them with 'geoId'.")
+
+        return df[~df["id"].isin(severalGeos) | (df["geo_id"] == self.geoId)]
+
+    def _fetchRanges(self, ranges: List[Tuple[datetime, datetime]], include29February: bool, esios) -> Iterator[pd.DataFrame]:
+        """Yields the data of every range, in the same order. With more than one worker, the requests are issued concurrently."""
+        rateLimiter = _RateLimiter(self.requestsPerSecond)
+
+        def fetchRange(dateRange: Tuple[datetime, datetime]) -> pd.DataFrame:
+            rateLimiter.wait()
+            df = esios.dataframe_lista_de_indicadores_de_esios_por_fechas(self._getIndicators(), 
+                                                                          dateRange[0], dateRange[1], include29February,
+                                                                          time_trunc = self.time_trunc)
+            df = self._selectGeo(df)
+
+            if not isinstance(self.indicador, list):
+                return df.filter(["value"], axis = 1)
+
+            # One column per indicator, in the requested order
+            return df.pivot(columns = "id", values = "value").reindex(columns = self.indicador).rename_axis(columns = None)
+
+        if self.maxWorkers == 1:
+            yield from map(fetchRange, ranges)
+        else:
+            with ThreadPoolExecutor(max_workers = self.maxWorkers) as executor:
+                yield from executor.map(fetchRange, ranges)
+
+    def _getDataForWindows(self, windows: List[Tuple[datetime, datetime]], include29February: bool, esios) -> Iterator[pd.DataFrame]:
+        """Yields the data of every window, in the same order, following the fetch plan."""
+        if self._planFetch(windows) == "perYear":
+            yield from self._fetchRanges(windows, include29February, esios)
+            return
+
+        step: timedelta = self._getTimeTruncStep()
+        ranges: List[Tuple[datetime, datetime]] = self._splitRanges(self._groupWindows(sorted(windows), step), step)
+
+        data: pd.DataFrame = pd.concat(list(self._fetchRanges(ranges, include29February, esios)))
+        data = data[~data.index.duplicated()]
+
+        for start, end in windows:
+            yield data.iloc[data.index.searchsorted(start, "left"):data.index.searchsorted(end, "right")]
+
+    def _getDataForYears(self, years: List[int], initDatetime: datetime, hoursAhead: int, include29February: bool, esios) -> Iterator[pd.DataFrame]:
+        """Yields the data of every year in 'years', in the same order."""
+        windows: List[Tuple[datetime, datetime]] = [self._getYearWindow(year, initDatetime, hoursAhead, include29February) for year in years]
+
+        yield from self._getDataForWindows(windows, include29February, esios)
+
+    def _getIndicators(self) -> List[int]:
+        return self.indicador if isinstance(self.indicador, list) else [self.indicador]
+
+    def _getDataForFirstYear(self, initialYear: int, yearDF: pd.DataFrame) -> pd.DataFrame:
+        if not isinstance(self.indicador, list):
+            return yearDF.rename(columns = {"value": initialYear})
+
+        return yearDF.set_axis(pd.MultiIndex.from_product([self.indicador, [initialYear]], names = [self.variableLevelName, self.yearLevelName]), axis = 1)
+
+    def _getDataForTheRestOfYears(self, df: pd.DataFrame, initialYear: int, yearDFs: Iterable[pd.DataFrame]) -> pd.DataFrame:
+        if not isinstance(self.indicador, list):
+            for year, yearDF in zip(range(initialYear + 1, datetime.now().year), yearDFs):
+                df[year] = list(yearDF["value"])
+
+            return df
+
+        columns: Dict[Tuple[int, int], np.ndarray] = {(indicator, initialYear): df[(indicator, initialYear)].to_numpy() for indicator in self.indicador}
+        years: List[int] = [initialYear]
+
+        for year, yearDF in zip(range(initialYear + 1, datetime.now().year), yearDFs):
+            if len(yearDF) != len(df):
+                raise ValueError("Length of values (" + str(len(yearDF)) + ") does not match length of index (" + str(len(df)) + ")")
 
-        df: pd.DataFrame = self._getDataForFirstYear(initialYear, initDatetime, hoursAhead, include29February, esiosInstance)
-        df = self._getDataForTheRestOfYears(df, initialYear, initDatetime, hoursAhead, include29February, esiosInstance)
+            columns.update({(indicator, year): yearDF[indicator].to_numpy() for indicator in self.indicador})
+            years.append(year)
+
+        # Columns grouped by indicator: (indicator, year)
+        columnIndex = pd.MultiIndex.from_product([self.indicador, years], names = [self.variableLevelName, self.yearLevelName])
+
+        return pd.DataFrame({column: columns[column] for column in columnIndex}, index = df.index, columns = columnIndex)
+
+    def _assembleYears(self, initialYear: int, initDatetime: datetime, yearDFs: Iterator[pd.DataFrame]) -> pd.DataFrame:
+        df: pd.DataFrame = self._getDataForFirstYear(initialYear, next(yearDFs))
+        df = self._getDataForTheRestOfYears(df, initialYear, yearDFs)
 
         # Shift the index (row names) to the current date
         df.index = df.index + pd.offsets.DateOffset(years = initDatetime.year - initialYear)
@@ -155,9 +480,33 @@ class ESIOSLoader(LoaderInterface):
         df.rename_axis(self.indexName, inplace=True)
 
         return df
+
+    def _getFramesForWindows(self, initialYear: int, windows: List[Tuple[datetime, int]], include29February: bool) -> List[pd.DataFrame]:
+        # The token gets validated by the first data request, so the catalog of indicators is not needed here
+        esiosInstance = self.bibliotecaEsios.BajadaDatosESIOS(self.__esiosKey, self.endPoint, self._getCache(), valida_token = False, almacen = self._getStore())
+
+        # The year windows of every requested window are fetched under a single plan, so overlapping ones share their requests
+        years: List[int] = [initialYear, *range(initialYear + 1, datetime.now().year)]
+        yearWindows: List[Tuple[datetime, datetime]] = [self._getYearWindow(year, initDatetime, hoursAhead, include29February) for initDatetime, hoursAhead in windows for year in years]
+
+        yearDFs: Iterator[pd.DataFrame] = self._getDataForWindows(yearWindows, include29February, esiosInstance)
+
+        return [self._assembleYears(initialYear, initDatetime, yearDFs) for initDatetime, _ in windows]
+
+    @instrumented()
+    def getDataFromSource(self, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool = False) -> pd.DataFrame:
+        return self._getFramesForWindows(initialYear, [(initDatetime, hoursAhead)], include29February)[0]
     
 class LocalDFLoader(LoaderInterface):
 
+    _nanosecondsPerSecond: int = 10**9
+    _nanosecondsPerHour: int = 3600 * 10**9
+    _nanosecondsPerDay: int = 86400 * 10**9
+    _leapYearStart: np.datetime64 = np.datetime64("2024-01-01", "ns")
+
+    _defaultCacheDir: str = os.path.join("~", ".cache", "synthDataGen", "localDF")
+    _cacheFormatVersion: int = 3
+
     def __init__(self, paramsFileName: str):
         data = self._getJSON(paramsFileName)
 
@@ -166,12 +515,21 @@ class LocalDFLoader(LoaderInterface):
 
         self._dataFrameFile: str = os.path.join(self.dataFrameDir, self.dataframeFileName)
 
-        self._columnToAnalyze: str = data["localDF_params"]["columnToAnalyze"]
+        self._columnToAnalyze: str | List[str] = data["localDF_params"]["columnToAnalyze"]
         self._skipFirstColumn: bool = data["localDF_params"]["skipFirstColumn"]
 
         self._datetimeColumnName: str = data["localDF_params"]["datetimeColumnName"]
         self._datetimeFormat: str = data["localDF_params"]["datetimeFormat"]
 
+        self._useCache: bool = data["localDF_params"].get("useCache", False)
+        self._cacheDir: str = data["localDF_params"].get("cacheDir", None)
+
+        self._chunkSize: int = data["localDF_params"].get("chunkSize", 200000)
+        self._valueDtype: str = data["localDF_params"].get("valueDtype", "float64")
+
+        self._yearMatrix: _TimeOfYearMatrix = None
+        self._yearMatrixFile: str = None
+
     @property
     def dataFrameDir(self):
         return self._dataFrameDir
@@ -200,6 +558,25 @@ class LocalDFLoader(LoaderInterface):
     def datetimeFormat(self):
         return self._datetimeFormat 
 
+    @property
+    def useCache(self):
+        return self._useCache
+
+    @property
+    def cacheDir(self):
+        """Directory of the cache of already pivoted year matrices. By default, a per-user one (~/.cache/synthDataGen/localDF), shared by every source file."""
+        return os.path.expanduser(self._cacheDir or self._defaultCacheDir)
+
+    @property
+    def chunkSize(self):
+        """Number of rows of the source file read at once."""
+        return self._chunkSize
+
+    @property
+    def valueDtype(self):
+        """Type of the loaded values, e.g. "float32" to halve the memory of the year matrix."""
+        return self._valueDtype
+
     @dataFrameDir.setter
     def dataFrameDir(self, new_dataFrameDir: str):
         self._dataFrameDir = new_dataFrameDir
@@ -213,7 +590,7 @@ class LocalDFLoader(LoaderInterface):
         self._dataFrameFile = new_dataFrameFile
 
     @columnToAnalyze.setter
-    def columnToAnalyze(self, new_columnToAnalyze: str):
+    def columnToAnalyze(self, new_columnToAnalyze: str | List[str]):
         self._columnToAnalyze = new_columnToAnalyze
 
     @skipFirstColumn.setter
@@ -228,64 +605,395 @@ class LocalDFLoader(LoaderInterface):
     def datetimeFormat(self, new_datetimeFormat: str):
         self._datetimeFormat = new_datetimeFormat
 
-    def __createDateColumns(self, df: pd.DataFrame):
-        df[self.datetimeColumnName] = pd.to_datetime(df[self.datetimeColumnName], format = self.datetimeFormat)
-        df.drop_duplicates(subset = [self.datetimeColumnName], inplace = True)
+    @useCache.setter
+    def useCache(self, new_useCache: bool):
+        self._useCache = new_useCache
 
-        df["dateNoYear"] = df[self.datetimeColumnName].dt.strftime("%m-%d %H:%M:%S")
-        df["year"] = df[self.datetimeColumnName].dt.year
+    @cacheDir.setter
+    def cacheDir(self, new_cacheDir: str):
+        self._cacheDir = new_cacheDir
 
-        df.set_index("dateNoYear", inplace = True)
+    @chunkSize.setter
+    def chunkSize(self, new_chunkSize: int):
+        self._chunkSize = new_chunkSize
 
-    def __rearrangeDFByYear(self, df: pd.DataFrame) -> pd.DataFrame:
-        years = list(set(df["year"]));  years.sort()
+    @valueDtype.setter
+    def valueDtype(self, new_valueDtype: str):
+        self._valueDtype = new_valueDtype
 
-        resultDF = pd.DataFrame()
-        for year in years:
-            dataframe = pd.Series.to_frame(df[df["year"] == year][self.columnToAnalyze])
-            dataframe = dataframe.rename(columns = {str(self.columnToAnalyze):str(year)})
+    def __getTimeOfYear(self, dates: pd.Series) -> np.ndarray:
+        """Maps every timestamp to the same time of year in the (leap) year 2024, operating on integer nanoseconds only."""
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
 
-            resultDF = pd.merge(resultDF, dataframe, left_index = True, right_index = True, how = "outer")
+        nanoseconds: np.ndarray = dates.to_numpy("datetime64[ns]").view("i8")
+        nanoseconds = nanoseconds - nanoseconds % self._nanosecondsPerSecond
 
-        return resultDF
+        years: np.ndarray = dates.dt.year.to_numpy()
+        yearStarts: np.ndarray = (years - 1970).astype("datetime64[Y]").astype("datetime64[ns]").view("i8")
+        offsets: np.ndarray = nanoseconds - yearStarts
 
-    def __setIndexAndFilter29February(self, df: pd.DataFrame, include29February: bool) -> pd.DataFrame:
-        df = df.rename({str(entry):"2024" + "-" + str(entry) for entry in df.index})      # This mental retardation is for pandas to not check the February 29th when parsing the index to datetime
-        df.index = pd.to_datetime(df.index)
+        # From March 1st on, non-leap years are one day behind the leap year
+        nonLeapYears: np.ndarray = ~((years % 400 == 0) | ((years % 100 != 0) & (years % 4 == 0)))
+        offsets += np.where(nonLeapYears & (offsets >= 59 * self._nanosecondsPerDay), self._nanosecondsPerDay, 0)
 
-        if not include29February:
-            df = df[~((df.index.month == 2) & (df.index.day == 29))]
+        return (self._leapYearStart.view("i8") + offsets).view("datetime64[ns]")
 
-        if len(set(df.index.year)) == 1:
-            df.index = df.index + pd.offsets.DateOffset(years = 2023 - df.index.year[1])
+    def __getVariables(self) -> List[str]:
+        return self.columnToAnalyze if isinstance(self.columnToAnalyze, list) else [self.columnToAnalyze]
 
-        df.rename_axis(self.indexName, inplace=True)
+    def __readChunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Streams the source file in chunks of 'chunkSize' rows, reading just the datetime column and the analysed ones.
+        Yields the time of year (nanoseconds within 2024), the year and the values (one column per variable) of every row."""
+        columnNames: List[str] = list(pd.read_csv(self.dataFrameFile, nrows = 0).columns)
 
-        return df
+        if self.skipFirstColumn:
+            columnNames = columnNames[1:]
 
-    def __filterInNeededData(self, df: pd.DataFrame, initialYear: int, initDatetime: datetime, hoursAhead: int) -> pd.DataFrame:
-        minYear: int = int(min(list(df.columns)))
+        variables: List[str] = self.__getVariables()
 
-        if initialYear > minYear:
-            df.drop(columns = [str(year) for year in range(minYear, initialYear)], inplace = True)
-        
-        listOfHoursAhead = [initDatetime + timedelta(hours=hour) for hour in range(0, hoursAhead + 1)]
-        df1 = df.filter(items = listOfHoursAhead, axis = 0)
+        for columnName in [self.datetimeColumnName, *variables]:
+            if columnName not in columnNames:
+                raise Exception("Column '" + columnName + "' not found in the file '" + self.dataFrameFile + "'.")
 
-        if len(df) == 0:
+        chunks = pd.read_csv(self.dataFrameFile, usecols = [self.datetimeColumnName, *variables], chunksize = self.chunkSize,
+                             dtype = {self.datetimeColumnName: str, **{variable: self.valueDtype for variable in variables}})
+
+        for chunk in chunks:
+            dates: pd.Series = pd.to_datetime(chunk[self.datetimeColumnName], format = self.datetimeFormat)
+
+            # Offsets changing along the file (daylight saving time) give plain datetime objects: their wall-clock time is kept, as with a single offset
+            if dates.dtype == object:
+                dates = pd.to_datetime(dates.map(lambda date: date.replace(tzinfo = None)))
+
+            keys: np.ndarray = self.__getTimeOfYear(dates).view("i8")
+            years: np.ndarray = dates.dt.year.to_numpy(dtype = np.int16)
+
+            yield (keys, years, chunk[variables].to_numpy())
+
+    def __getRequestedKeys(self, initDatetime: datetime, hoursAhead: int, include29February: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Walks 'hoursAhead' hours on from the time of year of 'initDatetime'. Returns the times of year (within 2024) and
+        how many year boundaries were crossed to reach each of them. February 29th is skipped if not included, and also in the
+        years of the window that are not leap, so that every time of year maps onto a single calendar hour."""
+        startKey: int = self.__getTimeOfYear(pd.Series([pd.Timestamp(initDatetime)]))[0].view("i8")
+        leapYearStart: int = self._leapYearStart.view("i8")
+
+        # Each year crossed may hold a February 29th to be skipped
+        numberOfHours: int = hoursAhead + 1 + 24 * (hoursAhead // (365 * 24) + 1)
+        keys: np.ndarray = startKey + np.arange(numberOfHours, dtype = np.int64) * self._nanosecondsPerHour
+
+        yearsCrossed: np.ndarray = (keys - leapYearStart) // (366 * self._nanosecondsPerDay)
+        keys -= yearsCrossed * 366 * self._nanosecondsPerDay
+
+        labelYears: np.ndarray = initDatetime.year + yearsCrossed
+        leapYears: np.ndarray = (labelYears % 400 == 0) | ((labelYears % 100 != 0) & (labelYears % 4 == 0))
+        dayOfYear: np.ndarray = (keys - leapYearStart) // self._nanosecondsPerDay
+        skipped: np.ndarray = (dayOfYear == 59) & (~leapYears if include29February else True)
+
+        keys, yearsCrossed = keys[~skipped][:hoursAhead + 1], yearsCrossed[~skipped][:hoursAhead + 1]
+
+        return (keys, yearsCrossed)
+
+    def __filterInNeededData(self, matrix: "_TimeOfYearMatrix", initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool) -> pd.DataFrame:
+        years: List[int] = [int(column) for column in matrix.columns]
+        selectedYears: List[int] = [position for position, year in enumerate(years) if year >= initialYear]
+
+        # The values hold the years of every variable one after the other
+        variableOffsets: np.ndarray = np.repeat(np.arange(len(matrix.variables)) * len(years), len(selectedYears))
+        selectedColumns: np.ndarray = np.tile(selectedYears, len(matrix.variables)) + variableOffsets
+
+        keys, yearsCrossed = self.__getRequestedKeys(initDatetime, hoursAhead, include29February)
+
+        rows: np.ndarray = matrix.getRows(keys)
+        found: np.ndarray = rows >= 0
+        keys, yearsCrossed, rows = keys[found], yearsCrossed[found], rows[found]
+
+        if len(rows) == 0:
             raise Exception("initDateTime '" + str(initDatetime) + "'is not a valid row for the current DataFrame.")
-        
-        return df1
 
+        values: np.ndarray = np.full((len(rows), len(selectedColumns)), np.nan)
+        labels: List[pd.DatetimeIndex] = []
+
+        # Once a window crosses the end of the year, the data of every column continues in the column of the following year
+        for crossed in np.unique(yearsCrossed):
+            sameYear: np.ndarray = yearsCrossed == crossed
+
+            sourceYears: np.ndarray = np.array([years.index(years[position] + crossed) if years[position] + crossed in years else -1 for position in selectedYears])
+            available: np.ndarray = np.tile(sourceYears >= 0, len(matrix.variables))
+            sourceColumns: np.ndarray = np.tile(sourceYears, len(matrix.variables)) + variableOffsets
+
+            values[np.ix_(sameYear, available)] = matrix.values[rows[sameYear]][:, sourceColumns[available]]
+            labels.append(pd.DatetimeIndex(keys[sameYear].view("datetime64[ns]")) + pd.offsets.DateOffset(years = initDatetime.year + int(crossed) - 2024))
+
+        index = pd.DatetimeIndex(np.concatenate([label.asi8 for label in labels]).view("datetime64[ns]"), name = self.indexName)
+
+        if not (index.is_unique and index.is_monotonic_increasing):
+            raise Exception("The window starting at '" + str(initDatetime) + "' does not map onto increasing, unique datetimes.")
+
+        columns: List[str] = [matrix.columns[position] for position in selectedYears]
+
+        if isinstance(self.columnToAnalyze, list):
+            columns = pd.MultiIndex.from_product([matrix.variables, columns], names = [self.variableLevelName, self.yearLevelName])
+
+        return pd.DataFrame(values, index = index, columns = columns)
+
+    def __getCacheFiles(self) -> Tuple[str, str, str]:
+        """Returns the cache files (values and metadata) for the current source file and parameters, and the prefix shared by every cached version of the source file."""
+        sourceFile: str = os.path.abspath(self.dataFrameFile)
+        fileStat = os.stat(sourceFile)
+
+        fileSignature: str = "|".join(map(str, [sourceFile, fileStat.st_mtime_ns, fileStat.st_size]))
+        paramsSignature: str = "|".join(map(str, [self.columnToAnalyze, self.datetimeColumnName, self.datetimeFormat, self.skipFirstColumn, self.valueDtype, self._cacheFormatVersion]))
+
+        prefix: str = os.path.join(self.cacheDir, os.path.basename(sourceFile) + "." + hashlib.sha256(sourceFile.encode()).hexdigest()[:8])
+        baseName: str = prefix + "." + hashlib.sha256(fileSignature.encode()).hexdigest()[:12] + "." + hashlib.sha256(paramsSignature.encode()).hexdigest()[:12]
+
+        return (baseName + ".npy", baseName + ".meta.npz", prefix)
+
+    def __removeStaleCacheFiles(self, valuesFile: str, prefix: str):
+        # Versions cached for a previous state of the source file are stale from now on
+        fileSignature: str = valuesFile[len(prefix) + 1:].split(".")[0]
+
+        for staleFile in glob.glob(glob.escape(prefix) + ".*"):
+            if staleFile[len(prefix) + 1:].split(".")[0] != fileSignature:
+                try:
+                    os.remove(staleFile)
+                except OSError:
+                    pass    # E.g. still mapped by another process on Windows
+
+    @instrumented("LocalDFLoader.loadYearMatrix")
+    def __loadYearMatrix(self) -> "_TimeOfYearMatrix":
+        """Returns the (time of year x year) matrix of the source file. It is kept across calls and, if the cache is enabled,
+        memory-mapped from the cache file, for as long as the source file does not change."""
+        valuesFile, metaFile, prefix = self.__getCacheFiles()
+
+        if self._yearMatrix is not None and self._yearMatrixFile == valuesFile:
+            return self._yearMatrix
+
+        matrix = _TimeOfYearMatrix.load(valuesFile, metaFile) if self.useCache else None
+
+        if matrix is None:
+            # The matrix is built chunk by chunk, so the memory needed is that of the matrix and not that of the source file
+            builder = _TimeOfYearMatrixBuilder(self.__getVariables(), self.valueDtype)
+
+            for keys, years, values in self.__readChunks():
+                builder.add(keys, years, values)
+
+            matrix = builder.build()
+
+            if self.useCache:
+                try:
+                    os.makedirs(self.cacheDir, exist_ok = True)
+                    self.__removeStaleCacheFiles(valuesFile, prefix)
+
+                    matrix.save(valuesFile, metaFile)
+                    matrix = _TimeOfYearMatrix.load(valuesFile, metaFile) or matrix
+                except OSError:
+                    pass        # The cache is just an optimization: a read-only location must not break the load
+
+        self._yearMatrix, self._yearMatrixFile = matrix, valuesFile
+
+        return matrix
+
+    def _getFramesForWindows(self, initialYear: int, windows: List[Tuple[datetime, int]], include29February: bool) -> List[pd.DataFrame]:
+        matrix = self.__loadYearMatrix()
+
+        return [self.__filterInNeededData(matrix, initialYear, initDatetime, hoursAhead, include29February) for initDatetime, hoursAhead in windows]
+
+    @instrumented()
     def getDataFromSource(self, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool = False) -> pd.DataFrame:
-        df = pd.read_csv(self.dataFrameFile)
+        matrix = self.__loadYearMatrix()
+
+        return self.__filterInNeededData(matrix, initialYear, initDatetime, hoursAhead, include29February)
+
+class _TimeOfYearMatrix:
+    """(time of year x year) matrix whose rows lie on a fixed grid over the leap year 2024, so that row r holds the time of year 'start + r * step'.
+    The row of any time of year is thus computed arithmetically, and the values can be a read-only memory map shared by many processes.
+    Sources too irregular for a grid keep one row per time of year found (step == 0), located by binary search.
+    With several variables, the columns hold every year of the first variable, then every year of the second one and so on."""
+
+    _maxGridFactor: int = 4     # Maximum ratio between the rows of the grid and the times of year found in the source
+
+    def __init__(self, values: np.ndarray, columns: List[str], start: int, step: int, present: np.ndarray = None, keys: np.ndarray = None, variables: List[str] = None):
+        self.values = values
+        self.columns = columns
+        self.variables = variables or [None]
+        self.start = start
+        self.step = step
+        self.present = present
+        self.keys = keys
+
+    def getRows(self, keys: np.ndarray) -> np.ndarray:
+        """Returns the row of every time of year (nanoseconds within 2024), or -1 where the source has no such time of year."""
+        if self.step:
+            offsets: np.ndarray = keys - self.start
+            rows: np.ndarray = offsets // self.step
+
+            valid: np.ndarray = (offsets % self.step == 0) & (rows >= 0) & (rows < len(self.present))
+            valid[valid] = self.present[rows[valid]]
+        else:
+            rows = np.searchsorted(self.keys, keys)
+
+            valid = rows < len(self.keys)
+            valid[valid] = self.keys[rows[valid]] == keys[valid]
+
+        return np.where(valid, rows, -1)
+
+    def save(self, valuesFile: str, metaFile: str):
+        """Writes the values as a plain .npy file, to be memory-mapped, and the rest in a small .npz file. Both writes are atomic, metadata last."""
+        for fileName, write in [(valuesFile, lambda file: np.save(file, self.values)),
+                                (metaFile, lambda file: np.savez(file, columns = np.array(self.columns, dtype = str), variables = np.array(self.variables, dtype = str), start = self.start, step = self.step,
+                                                                 present = self.present if self.present is not None else np.zeros(0, dtype = bool),
+                                                                 keys = self.keys if self.keys is not None else np.zeros(0, dtype = np.int64)))]:
+            descriptor, temporaryFile = tempfile.mkstemp(dir = os.path.dirname(fileName), suffix = ".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                write(file)
+            os.replace(temporaryFile, fileName)
+
+    @staticmethod
+    def load(valuesFile: str, metaFile: str) -> "_TimeOfYearMatrix":
+        if not (os.path.isfile(metaFile) and os.path.isfile(valuesFile)):
+            return None
+
+        with np.load(metaFile, allow_pickle = False) as meta:
+            step: int = int(meta["step"])
+
+            return _TimeOfYearMatrix(np.load(valuesFile, mmap_mode = "r"), list(meta["columns"]), int(meta["start"]), step,
+                                     present = meta["present"] if step else None, keys = None if step else meta["keys"],
+                                     variables = [str(variable) for variable in meta["variables"]])
+
+class _TimeOfYearMatrixBuilder:
+    """Builds a _TimeOfYearMatrix chunk by chunk from (time of year, year, value) triples, without holding the source in memory.
+    The grid spans the times of year found so far and is refined whenever a chunk reveals a finer step. The first value of every cell wins,
+    as when dropping duplicated datetimes. While the data seen is too irregular for a grid, the triples are kept and pivoted at the end."""
+
+    def __init__(self, variables: List[str], dtype: str = "float64"):
+        self.variables = variables
+        self.dtype = np.dtype(dtype)
+
+        self.start: int = None
+        self.step: int = 0
+        self.present: np.ndarray = np.zeros(0, dtype = bool)
+        self.columns: Dict[int, np.ndarray] = {}
+        self.filled: Dict[int, np.ndarray] = {}
+
+        self.triples: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.pendingRows: int = 0
+        self.nextCheck: int = 0
+
+    def add(self, keys: np.ndarray, years: np.ndarray, values: np.ndarray):
+        if len(keys) == 0:
+            return
+
+        if not self.triples:
+            if self.__addToGrid(keys, years, values):
+                return
+
+            self.__toTriples()
+
+        self.triples.append((keys, years, values))
+        self.pendingRows += len(keys)
+
+        # Whether the triples kept fit in a grid is checked again every time they double
+        if self.pendingRows >= self.nextCheck:
+            self.__retryGrid()
+            self.nextCheck = 2 * self.pendingRows
+
+    def __retryGrid(self):
+        keys, years, values = (np.concatenate(arrays) for arrays in zip(*self.triples))
+
+        if self.__addToGrid(keys, years, values):
+            self.triples, self.pendingRows = [], 0
+        else:
+            self.triples = [(keys, years, values)]
 
-        if self.skipFirstColumn:
-            df = df.iloc[:, 1:]
+    def __addToGrid(self, keys: np.ndarray, years: np.ndarray, values: np.ndarray) -> bool:
+        if self.start is None and keys.min() == keys.max():
+            return False    # A grid needs two different times of year to find its step
+
+        reference: int = keys[0] if self.start is None else self.start
+        step: int = int(np.gcd(np.gcd.reduce(np.abs(keys - reference)), self.step))
+
+        start: int = int(keys.min()) if self.start is None else min(self.start, int(keys.min()))
+        end: int = int(keys.max()) if self.start is None else max(self.start + (len(self.present) - 1) * self.step, int(keys.max()))
+        numberOfRows: int = (end - start) // step + 1
+
+        if numberOfRows > _TimeOfYearMatrix._maxGridFactor * (np.count_nonzero(self.present) + len(np.unique(keys))):
+            return False
+
+        if (start, step, numberOfRows) != (self.start, self.step, len(self.present)):
+            self.__regrid(start, step, numberOfRows)
+
+        rows: np.ndarray = (keys - start) // step
+
+        for year in np.unique(years):
+            sameYear: np.ndarray = years == year
+
+            # The first occurrence of every row in the chunk, and only if the cell was not filled by a previous chunk
+            yearRows, first = np.unique(rows[sameYear], return_index = True)
+            yearValues: np.ndarray = values[sameYear][first]
+
+            if year not in self.columns:
+                self.columns[year] = np.full((numberOfRows, len(self.variables)), np.nan, dtype = self.dtype)
+                self.filled[year] = np.zeros(numberOfRows, dtype = bool)
+
+            empty: np.ndarray = ~self.filled[year][yearRows]
+
+            self.columns[year][yearRows[empty]] = yearValues[empty]
+            self.filled[year][yearRows[empty]] = True
+            self.present[yearRows] = True
+
+        return True
+
+    def __regrid(self, start: int, step: int, numberOfRows: int):
+        rows: np.ndarray = np.zeros(0, dtype = np.int64)
+
+        if self.start is not None:
+            rows = (self.start - start) // step + np.arange(len(self.present)) * (self.step // step)
+
+        for grids, fill in [(self.columns, np.nan), (self.filled, False)]:
+            for year, grid in grids.items():
+                newGrid: np.ndarray = np.full((numberOfRows, *grid.shape[1:]), fill, dtype = grid.dtype)
+                newGrid[rows] = grid
+                grids[year] = newGrid
+
+        present: np.ndarray = np.zeros(numberOfRows, dtype = bool)
+        present[rows] = self.present
+
+        self.start, self.step, self.present = start, step, present
+
+    def __toTriples(self):
+        if self.start is not None:
+            keys: np.ndarray = self.start + np.flatnonzero(self.present) * self.step
+
+            for year in self.columns:
+                filled: np.ndarray = self.filled[year][self.present]
+                self.triples.append((keys[filled], np.full(np.count_nonzero(filled), year, dtype = np.int16), self.columns[year][self.present][filled]))
+
+            self.pendingRows = sum(len(triple[0]) for triple in self.triples)
+
+        self.start, self.step, self.present, self.columns, self.filled = None, 0, np.zeros(0, dtype = bool), {}, {}
+
+    def build(self) -> _TimeOfYearMatrix:
+        if self.triples:
+            self.__retryGrid()
+
+        if not self.triples and self.start is not None:
+            years: List[int] = sorted(self.columns)
+
+            values: np.ndarray = np.stack([self.columns[year] for year in years], axis = 2).reshape(len(self.present), -1)
+
+            return _TimeOfYearMatrix(values, [str(year) for year in years], self.start, self.step, present = self.present, variables = self.variables)
+
+        keys, years, values = self.triples[0] if self.triples else (np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int16), np.zeros((0, len(self.variables)), dtype = self.dtype))
+
+        uniqueKeys, keyRows = np.unique(keys, return_inverse = True)
+        uniqueYears, yearColumns = np.unique(years, return_inverse = True)
+
+        # First occurrence of every (time of year, year) cell
+        _, first = np.unique(keyRows * len(uniqueYears) + yearColumns, return_index = True)
 
-        self.__createDateColumns(df)
-        df = self.__rearrangeDFByYear(df)
+        matrix: np.ndarray = np.full((len(uniqueKeys), len(self.variables), len(uniqueYears)), np.nan, dtype = self.dtype)
+        matrix[keyRows[first], :, yearColumns[first]] = values[first]
 
-        df = self.__setIndexAndFilter29February(df, include29February)
-        df = self.__filterInNeededData(df, initialYear, initDatetime, hoursAhead)
-        return df
\ No newline at end of file
+        return _TimeOfYearMatrix(matrix.reshape(len(uniqueKeys), -1), [str(year) for year in uniqueYears], 0, 0, keys = uniqueKeys, variables = self.variables)
@@ -0,0 +1,209 @@
+import sys
+import time
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+class Instrumentation():
+    """Per-stage instrumentation of the public entry points (loaders, adjustments, resampling, sampling and pipelines).
+
+    Every instrumented call emits an event, a dictionary with:
+
+    - "stage": the name of the stage, e.g. "LocalDFLoader.getDataFromSource", and "parent": the stage it was called from, if any.
+    - "seconds": wall time.
+    - "rowsIn" and "rowsOut": rows of the input and output DataFrames (None if there is none), and "bytesOut": memory of the output.
+    - "httpRequests", "httpRetries" and "httpSeconds": HTTP requests made to ESIOS during the stage (see bibliotecaEsios.ESTADISTICAS, shared by every thread).
+    - "bytesAllocated": peak memory allocated during the stage, only if trackMemory(True) was called (tracemalloc slows the stages down).
+
+    The events are passed on to every registered callback. With no callback registered, the instrumentation costs a single check per call.
+    """
+
+    _callbacks: List[Callable[[Dict], None]] = []
+    _trackMemory: bool = False
+    _state: threading.local = threading.local()
+
+    @staticmethod
+    def isEnabled() -> bool:
+        return bool(Instrumentation._callbacks)
+
+    @staticmethod
+    def addCallback(callback: Callable[[Dict], None]) -> Callable[[Dict], None]:
+        """Registers a function to be called with every event.
+
+        :param callable callback: function receiving the event dictionary.
+        :returns callable: the same callback, to remove it later.
+        """
+        # Copy on write, so that the stages running in other threads keep iterating a consistent list
+        Instrumentation._callbacks = Instrumentation._callbacks + [callback]
+        return callback
+
+    @staticmethod
+    def removeCallback(callback: Callable[[Dict], None]):
+        Instrumentation._callbacks = [registered for registered in Instrumentation._callbacks if registered is not callback]
+
+    @staticmethod
+    def enableLogging(logger = None, level: int = None) -> Callable[[Dict], None]:
+        """Logs every event as a JSON message, with the event itself in the 'stageEvent' attribute of the log record.
+
+        :param logging.Logger logger: the logger to use. Defaults to the "synthDataGen" logger.
+        :param int level: the level of the messages. Defaults to logging.INFO.
+        :returns callable: the registered callback, to remove it later.
+        """
+        import json
+        import logging
+
+        logger = logger or logging.getLogger("synthDataGen")
+        level = logging.INFO if level is None else level
+
+        def logEvent(event: Dict):
+            logger.log(level, json.dumps(event, default = str), extra = {"stageEvent": event})
+
+        return Instrumentation.addCallback(logEvent)
+
+    @staticmethod
+    def trackMemory(enable: bool = True):
+        """Whether the events report the peak memory allocated by every stage, by means of tracemalloc.
+
+        :param bool enable: True to track the memory.
+        """
+        Instrumentation._trackMemory = enable
+
+    @staticmethod
+    def disable():
+        """Removes every callback and stops tracking the memory."""
+        Instrumentation._callbacks = []
+        Instrumentation._trackMemory = False
+
+    @staticmethod
+    @contextmanager
+    def capture(trackMemory: bool = False) -> Iterator[List[Dict]]:
+        """Collects the events emitted inside the 'with' block into a list.
+
+        :param bool trackMemory: whether to track the memory of the stages meanwhile.
+        :returns list[dict]:
+        """
+        events: List[Dict] = []
+        previousTrackMemory: bool = Instrumentation._trackMemory
+        Instrumentation._trackMemory = trackMemory or previousTrackMemory
+        Instrumentation.addCallback(events.append)
+
+        try:
+            yield events
+        finally:
+            Instrumentation.removeCallback(events.append)
+            Instrumentation._trackMemory = previousTrackMemory
+
+    @staticmethod
+    def _getRows(value) -> int:
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+            return len(value)
+
+        if isinstance(value, list) and value and all(isinstance(element, pd.DataFrame) for element in value):
+            return sum(len(element) for element in value)
+
+        return None
+
+    @staticmethod
+    def _getBytes(value) -> int:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return int(value.memory_usage(index = True, deep = False).sum())
+
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+
+        if isinstance(value, list) and value and all(isinstance(element, pd.DataFrame) for element in value):
+            return sum(Instrumentation._getBytes(element) for element in value)
+
+        return None
+
+    @staticmethod
+    def _getHttpStats() -> Dict:
+        # Read only if ESIOS has been used, so that instrumenting never imports it
+        bibliotecaEsios = sys.modules.get("synthDataGen.common.bibliotecaEsios")
+
+        return bibliotecaEsios.ESTADISTICAS.resumen if bibliotecaEsios is not None else {"peticiones": 0, "reintentos": 0, "segundos": 0.0}
+
+    @staticmethod
+    def _run(stage: str, function: Callable, args: tuple, kwargs: Dict):
+        stack: List[Dict] = Instrumentation._state.__dict__.setdefault("stack", [])
+        parent: Dict = stack[-1] if stack else None
+
+        frame: Dict = {"stage": stage, "childPeak": 0}
+        trackMemory: bool = Instrumentation._trackMemory
+        startedTracing: bool = False
+
+        if trackMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                startedTracing = True
+            elif parent is not None:
+                # The peak is reset for this stage, so the one reached so far by the parent is kept aside
+                parent["childPeak"] = max(parent["childPeak"], tracemalloc.get_traced_memory()[1])
+
+            frame["startMemory"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        httpBefore: Dict = Instrumentation._getHttpStats()
+        stack.append(frame)
+        start: float = time.perf_counter()
+
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds: float = time.perf_counter() - start
+            stack.pop()
+
+            bytesAllocated: int = None
+            if trackMemory and tracemalloc.is_tracing():
+                peak: int = max(tracemalloc.get_traced_memory()[1], frame["childPeak"])
+                bytesAllocated = peak - frame["startMemory"]
+
+                if parent is not None:
+                    parent["childPeak"] = max(parent["childPeak"], peak)
+                if startedTracing:
+                    tracemalloc.stop()
+
+        httpAfter: Dict = Instrumentation._getHttpStats()
+        dataFrameIn = next((value for value in (*args, *kwargs.values()) if isinstance(value, (pd.DataFrame, pd.Series))), None)
+
+        event: Dict = {"stage": stage,
+                       "parent": parent["stage"] if parent is not None else None,
+                       "seconds": seconds,
+                       "rowsIn": Instrumentation._getRows(dataFrameIn),
+                       "rowsOut": Instrumentation._getRows(result),
+                       "bytesOut": Instrumentation._getBytes(result),
+                       "bytesAllocated": bytesAllocated,
+                       "httpRequests": httpAfter["peticiones"] - httpBefore["peticiones"],
+                       "httpRetries": httpAfter["reintentos"] - httpBefore["reintentos"],
+                       "httpSeconds": httpAfter["segundos"] - httpBefore["segundos"]}
+
+        for callback in Instrumentation._callbacks:
+            callback(event)
+
+        return result
+
+def instrumented(stage: str = None) -> Callable:
+    """Decorator emitting an Instrumentation event for every call of the decorated function, when some callback is registered.
+    In classes, it goes below @staticmethod.
+
+    :param str stage: the name of the stage. Defaults to the qualified name of the function, e.g. "ChangeResolution.upsample".
+    :returns callable:
+    """
+    def decorator(function: Callable) -> Callable:
+        name: str = stage or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not Instrumentation._callbacks:
+                return function(*args, **kwargs)
+
+            return Instrumentation._run(name, function, args, kwargs)
+
+        return wrapper
+
+    return decorator
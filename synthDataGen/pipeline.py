@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from synthDataGen.controller import LoaderInterface
+from synthDataGen.adjustments import FactorTable, ChangeResolution
+from synthDataGen.utils import Sampling
+from synthDataGen.instrumentation import instrumented
+
+class Pipeline():
+    """Records the load -> adjust -> resample -> sample workflow and runs it as a single optimised plan once its output is requested:
+
+    - The window is pushed down into the loader, so only its rows are loaded. Windows recorded after a change of resolution are applied as row filters instead.
+    - Consecutive factor steps (adjustByYear(...), applyFactors(...)) are merged into one FactorTable.apply(...), so the DataFrame is multiplied only once.
+    - The intermediate DataFrames are never exposed, so none of them is kept once the next step has been computed.
+    - When the output is a CSV file and the last step is sample(...), the samples are written block by block (see Sampling.samplesToCSV(...)).
+
+    :param LoaderInterface loader: the loader (ESIOSLoader, LocalDFLoader, etc.) the data is got from.
+    :param int initialYear: first year considered for the request.
+    :param bool include29February: indicates whether or not to include the February 29 in the loaded DataFrame.
+    """
+
+    _rowChangingSteps: List[str] = ["upsample", "downsample"]
+
+    def __init__(self, loader: LoaderInterface, initialYear: int, include29February: bool = False):
+        self._loader: LoaderInterface = loader
+        self._initialYear: int = initialYear
+        self._include29February: bool = include29February
+        self._steps: List[Tuple[str, Dict]] = []
+
+    def _addStep(self, name: str, **params) -> "Pipeline":
+        if self._steps and self._steps[-1][0] == "sample":
+            raise ValueError("No step can be added after 'sample': the samples are the output of the pipeline.")
+
+        self._steps.append((name, params))
+        return self
+
+    def window(self, initDatetime: datetime, hoursAhead: int) -> "Pipeline":
+        """Keeps only the rows from 'initDatetime' to 'hoursAhead' hours later (both included), as in Loader.getDataFromSource(...).
+
+        :param datetime initDatetime: the initial (MM-DD-hh-mm) of the window.
+        :param int hoursAhead: hours from 'initDatetime' on that we want to consider.
+        :returns Pipeline:
+        """
+        return self._addStep("window", initDatetime = initDatetime, hoursAhead = hoursAhead)
+
+    def adjustByYear(self, adjustmentsDict: Dict[int, float]) -> "Pipeline":
+        """Same as FactorByYear.run(...): a dictionary of percentages of adjustment by year.
+
+        :param dict adjustmentsDict: dictionary of percentages of adjustment by year.
+        :returns Pipeline:
+        """
+        if not all(isinstance(element, int) for element in adjustmentsDict.keys()):
+            raise ValueError("Not valid 'adjustmentsDict'. All values in it MUST be integers.")
+
+        return self._addStep("factors", yearFactors = FactorTable.fromPercentages(adjustmentsDict))
+
+    def applyFactors(self, yearFactors: Dict[int, float] = None, monthFactors: Dict[int, float] = None, hourFactors: Dict[int, float] = None) -> "Pipeline":
+        """Same as FactorTable.apply(...): tables of factors by year, by month and by hour of the day.
+
+        :param dict yearFactors: dictionary of factors by year.
+        :param dict monthFactors: dictionary of factors by month (1 to 12).
+        :param dict hourFactors: dictionary of factors by hour of the day (0 to 23).
+        :returns Pipeline:
+        """
+        return self._addStep("factors", yearFactors = yearFactors, monthFactors = monthFactors, hourFactors = hourFactors)
+
+    def upsample(self, frequency: str = None, method: str = None, **kwargs) -> "Pipeline":
+        """Same as ChangeResolution.upsample(...).
+
+        :param str frequency: the new frequency of the data.
+        :param str method: the interpolation technique.
+        :param *optional* ``kwargs``: keyword arguments to pass on to ChangeResolution.upsample(...).
+        :returns Pipeline:
+        """
+        return self._addStep("upsample", frequency = frequency, method = method, **kwargs)
+
+    def downsample(self, frequency: str = None, aggregationFunc = None) -> "Pipeline":
+        """Same as ChangeResolution.downsample(...).
+
+        :param str frequency: the new frequency of the data.
+        :param aggregationFunc: the aggregation function, as in ChangeResolution.downsample(...).
+        :returns Pipeline:
+        """
+        return self._addStep("downsample", frequency = frequency, aggregationFunc = aggregationFunc)
+
+    def sample(self, numberOfSamples: int = None, probDistribution: str = None, seed: int = None, workers: int = 1, blockSize: int = None) -> "Pipeline":
+        """Same as Sampling.getSamples(...). It must be the last step of the pipeline.
+
+        :param int numberOfSamples: the number of samples that will be returned (number of rows).
+        :param str probDistribution: a string defining the probability distribution to be used. For instance "truncnorm".
+        :param int seed: the seed from which every random stream is derived.
+        :param int workers: the number of processes among which the blocks of samples are split.
+        :param int blockSize: the number of samples drawn from every random stream.
+        :returns Pipeline:
+        """
+        Sampling._checkProbDistribution(probDistribution)
+
+        return self._addStep("sample", numberOfSamples = numberOfSamples, probDistribution = probDistribution, seed = seed, workers = workers, blockSize = blockSize)
+
+    @staticmethod
+    def _mergeFactors(first: Dict[int, float], second: Dict[int, float]) -> Dict[int, float]:
+        if not first or not second:
+            return first or second
+
+        return {key: first.get(key, 1.0) * second.get(key, 1.0) for key in dict.fromkeys([*first, *second])}
+
+    def _getPlan(self) -> Tuple[Dict, List[Tuple[str, Dict]]]:
+        """Returns the parameters of the loader call and the list of steps to run on its output."""
+        loadWindow: Dict = None
+        plan: List[Tuple[str, Dict]] = []
+
+        for name, params in self._steps:
+            if name == "window":
+                # Factors do not depend on which rows are kept, so the window moves before them, and into the loader if nothing changed the rows yet
+                position: int = len(plan)
+                while position > 0 and plan[position - 1][0] == "factors":
+                    position -= 1
+
+                if position == 0 and loadWindow is None:
+                    loadWindow = params
+                else:
+                    plan.insert(position, ("filter", params))
+            elif name == "factors" and plan and plan[-1][0] == "factors":
+                merged: Dict = {key: Pipeline._mergeFactors(plan[-1][1].get(key), params.get(key)) for key in ["yearFactors", "monthFactors", "hourFactors"]}
+                plan[-1] = ("factors", merged)
+            else:
+                if name in self._rowChangingSteps and loadWindow is None:
+                    raise ValueError("A window(...) step is needed before '" + name + "', to know which rows should be loaded.")
+                plan.append((name, dict(params)))
+
+        if loadWindow is None:
+            raise ValueError("A window(...) step is needed, to know which rows should be loaded.")
+
+        loadParams: Dict = {"initialYear": self._initialYear, **loadWindow, "include29February": self._include29February}
+
+        return (loadParams, [(name, params) for name, params in plan if name != "factors" or any(params.values())])
+
+    def explain(self) -> List[str]:
+        """Returns the optimised plan that collect() and toCSV(...) run, one string per step.
+
+        :returns list[str]:
+        """
+        loadParams, plan = self._getPlan()
+
+        return [type(self._loader).__name__ + ".getDataFromSource(" + ", ".join(key + "=" + str(value) for key, value in loadParams.items()) + ")"] + \
+            [name + "(" + ", ".join(key + "=" + str(value) for key, value in params.items() if value is not None) + ")" for name, params in plan]
+
+    def _run(self, plan: List[Tuple[str, Dict]], df: pd.DataFrame) -> pd.DataFrame:
+        for name, params in plan:
+            if name == "filter":
+                df = df.loc[params["initDatetime"]:params["initDatetime"] + timedelta(hours = params["hoursAhead"])]
+            elif name == "factors":
+                df = FactorTable.apply(df, **params)
+            elif name == "upsample":
+                df = ChangeResolution.upsample(df, **params)
+            elif name == "downsample":
+                df = ChangeResolution.downsample(df, **params)
+            elif name == "sample":
+                df = Sampling.getSamples(df, **params)
+
+        return df
+
+    @instrumented()
+    def collect(self) -> pd.DataFrame:
+        """Runs the pipeline and returns its output: the samples if the last step is sample(...), or the adjusted DataFrame otherwise.
+
+        :returns pandas.DataFrame:
+        """
+        loadParams, plan = self._getPlan()
+
+        return self._run(plan, self._loader.getDataFromSource(**loadParams))
+
+    @instrumented()
+    def toCSV(self, fileName: str, **kwargs) -> str:
+        """Runs the pipeline and writes its output to a CSV file. If the last step is sample(...), the samples are streamed to the file block by block.
+
+        :param str fileName: the path of the CSV file to be written. It is overwritten if it already exists.
+        :param *optional* ``kwargs``: keyword arguments to pass on to pandas.DataFrame.to_csv.
+        :returns str: the name of the written file.
+        """
+        loadParams, plan = self._getPlan()
+        df: pd.DataFrame = self._loader.getDataFromSource(**loadParams)
+
+        if plan and plan[-1][0] == "sample":
+            return Sampling.samplesToCSV(self._run(plan[:-1], df), fileName, **plan[-1][1], **kwargs)
+
+        self._run(plan, df).to_csv(fileName, **kwargs)
+        return fileName
@@ -1,13 +1,29 @@
+import os
 import random
 
-from typing import Dict, List, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
 
+import numpy as np
 import pandas as pd
-from scipy.stats import truncnorm
+
+from synthDataGen.instrumentation import instrumented
 
 class Sampling:
 
     _availProbDistibutions: List = ["'truncnorm'"]
+    _samplesPerBlock: int = 4096
+
+    @staticmethod
+    def _getRowsByYear(df: pd.DataFrame) -> pd.DataFrame:
+        """With several variables, i.e. (variable, year) columns, returns one row per (variable, datetime) and one column per year."""
+        if not isinstance(df.columns, pd.MultiIndex):
+            return df
+
+        variables: pd.Index = df.columns.unique(level = 0)
+
+        return pd.concat([df[variable] for variable in variables], keys = variables, names = [df.columns.names[0], df.index.name])
 
     @staticmethod
     def _getMeanAndStdForAxis(df: pd.DataFrame, axis: int) -> Tuple[List, List]:
@@ -17,37 +33,174 @@ class Sampling:
         return (means, stds)
     
     @staticmethod
-    def _getSamples_truncnorm(df: pd.DataFrame, numberOfSamples: int, means: List[float], stds: List[float]) -> pd.DataFrame:
-        resultingDataFrame: pd.DataFrame = pd.DataFrame()
+    def _getTruncnormParams(means: List[float], stds: List[float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        mus: np.ndarray = np.asarray(means, dtype = float)
+        sigmas: np.ndarray = np.asarray(stds, dtype = float)
 
-        for index, mu, sigma in zip(df.index, means, stds):
-            lowerBound = 0
-            upperBound = mu + 2*sigma
+        lowerBounds: np.ndarray = np.zeros_like(mus)
+        upperBounds: np.ndarray = mus + 2*sigmas
 
-            pdf = truncnorm((lowerBound - mu) / sigma,
-                            (upperBound - mu) / sigma,
-                            loc = mu, scale = sigma)
+        # Rows without dispersion collapse to their mean. A unit scale is used for them to avoid dividing by zero and they are overwritten afterwards
+        degenerated: np.ndarray = sigmas == 0
+        scales: np.ndarray = np.where(degenerated, 1, sigmas)
 
-            samples = pdf.rvs(numberOfSamples)
-            resultingDataFrame[index] = samples
-        
-        return resultingDataFrame
+        return ((lowerBounds - mus) / scales, (upperBounds - mus) / scales, mus, scales, degenerated)
+
+    @staticmethod
+    def _drawTruncnorm(out: np.ndarray, params: Tuple, seedSequence: np.random.SeedSequence) -> np.ndarray:
+        # scipy is only loaded once samples are actually drawn
+        from scipy.special import ndtr, ndtri
+
+        a, b, mus, scales, degenerated = params
+
+        # Inverse-CDF sampling over the whole matrix at once. Intervals lying on the right tail are mirrored to the left one to keep precision
+        mirrored: np.ndarray = a >= 0
+        sign: np.ndarray = np.where(mirrored, -1.0, 1.0)
+
+        cdfLower: np.ndarray = ndtr(sign * a)
+        cdfUpper: np.ndarray = ndtr(sign * b)
+
+        np.random.default_rng(seedSequence).random(out = out)
+        out *= cdfUpper - cdfLower
+        out += cdfLower
+        ndtri(out, out = out)
+        out *= sign * scales
+        out += mus
+        out[:, a > b] = np.nan
+        out[:, degenerated] = mus[degenerated]
+
+        return out
+
+    @staticmethod
+    def _drawTruncnormBlock(numberOfSamples: int, params: Tuple, seedSequence: np.random.SeedSequence) -> np.ndarray:
+        return Sampling._drawTruncnorm(np.empty((numberOfSamples, len(params[2]))), params, seedSequence)
+
+    @staticmethod
+    def _getBlocks(numberOfSamples: int, seed: int, blockSize: int = None) -> List[Tuple[int, int, np.random.SeedSequence]]:
+        # Every block of samples owns a child stream of the user seed, so the result does not depend on how the blocks are distributed
+        blockSize = blockSize or Sampling._samplesPerBlock
+
+        starts: range = range(0, numberOfSamples, blockSize)
+        seedSequences: List = np.random.SeedSequence(seed).spawn(len(starts))
+
+        return [(start, min(start + blockSize, numberOfSamples), seedSequence) for start, seedSequence in zip(starts, seedSequences)]
+
+    @staticmethod
+    def _iterBlocks_truncnorm(blocks: List, params: Tuple, workers: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+        if workers == 1:
+            for start, end, seedSequence in blocks:
+                yield (start, end, Sampling._drawTruncnormBlock(end - start, params, seedSequence))
+            return
+
+        # Only a bounded number of blocks is in flight, so memory does not grow with the number of samples
+        maxPendingBlocks: int = 2 * (workers or os.cpu_count() or 1)
+        pending: deque = deque()
+
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            for start, end, seedSequence in blocks:
+                pending.append((start, end, executor.submit(Sampling._drawTruncnormBlock, end - start, params, seedSequence)))
+
+                if len(pending) >= maxPendingBlocks:
+                    start, end, future = pending.popleft()
+                    yield (start, end, future.result())
+
+            while pending:
+                start, end, future = pending.popleft()
+                yield (start, end, future.result())
+
+    @staticmethod
+    def _getSamples_truncnorm(df: pd.DataFrame, numberOfSamples: int, means: List[float], stds: List[float], seed: int = None, workers: int = 1, blockSize: int = None) -> pd.DataFrame:
+        params: Tuple = Sampling._getTruncnormParams(means, stds)
+        blocks: List = Sampling._getBlocks(numberOfSamples, seed, blockSize)
+
+        samples: np.ndarray = np.empty((numberOfSamples, len(df.index)))
+
+        if workers == 1:
+            for start, end, seedSequence in blocks:
+                Sampling._drawTruncnorm(samples[start:end], params, seedSequence)
+        else:
+            for start, end, block in Sampling._iterBlocks_truncnorm(blocks, params, workers):
+                samples[start:end] = block
+
+        return pd.DataFrame(samples, columns = df.index)
+
+    @staticmethod
+    def _iterSamples_truncnorm(df: pd.DataFrame, numberOfSamples: int, means: List[float], stds: List[float], seed: int = None, workers: int = 1, blockSize: int = None) -> Iterator[pd.DataFrame]:
+        params: Tuple = Sampling._getTruncnormParams(means, stds)
+        blocks: List = Sampling._getBlocks(numberOfSamples, seed, blockSize)
+
+        for start, end, block in Sampling._iterBlocks_truncnorm(blocks, params, workers):
+            yield pd.DataFrame(block, index = pd.RangeIndex(start, end), columns = df.index)
 
     @staticmethod
-    def getSamples(df: pd.DataFrame, numberOfSamples: int = None, probDistribution: str = None) -> pd.DataFrame:
+    def _checkProbDistribution(probDistribution: str):
+        if probDistribution not in ["truncnorm"]:
+            raise ValueError("Probability distribution '" + str(probDistribution) +"' not available for sampling. Please choose one of the following: " + ', '.join(Sampling._availProbDistibutions))
+
+    @staticmethod
+    @instrumented()
+    def getSamples(df: pd.DataFrame, numberOfSamples: int = None, probDistribution: str = None, seed: int = None, workers: int = 1, blockSize: int = None) -> pd.DataFrame:
         """Gets a number of samples for every column in the provided DataFrame. A truncated normal probability distribution is used to do so.
+        With several variables, i.e. (variable, year) columns, every (variable, datetime) pair is sampled and becomes a column of the result.
+        The samples are drawn in fixed-size blocks, each one from an independent stream derived from 'seed', so the same seed gives the same samples whatever the number of workers is.
 
         :param pandas.DataFrame df: the input DataFrame to be considered.
         :param int numberOfSamples: the number of samples that will be returned (number of rows).
         :param str probDistribution: a string defining the probability distribution to be used. For instance "truncnorm".
+        :param int seed: the seed from which every random stream is derived. If not provided, fresh entropy from the OS is used.
+        :param int workers: the number of processes among which the blocks of samples are split. 'None' uses every available core.
+        :param int blockSize: the number of samples drawn from every random stream. Defaults to Sampling._samplesPerBlock.
         :returns pandas.DataFrame:
         """
 
-        if probDistribution == "truncnorm":
-            means, stds = Sampling._getMeanAndStdForAxis(df, 1)
-            return Sampling._getSamples_truncnorm(df, numberOfSamples, means, stds)
-        else:
-            raise ValueError("Probability distribution '" + probDistribution +"' not available for sampling. Please choose one of the following: " + ', '.join(Sampling._availProbDistibutions))
+        Sampling._checkProbDistribution(probDistribution)
+
+        df = Sampling._getRowsByYear(df)
+        means, stds = Sampling._getMeanAndStdForAxis(df, 1)
+        return Sampling._getSamples_truncnorm(df, numberOfSamples, means, stds, seed, workers, blockSize)
+
+    @staticmethod
+    def iterSamples(df: pd.DataFrame, numberOfSamples: int = None, probDistribution: str = None, seed: int = None, workers: int = 1, blockSize: int = None) -> Iterator[pd.DataFrame]:
+        """Same as getSamples(...), but yielding the samples in blocks of 'blockSize' rows as they are generated, so that peak memory does not depend on 'numberOfSamples'.
+        Concatenating the yielded blocks gives the same DataFrame as getSamples(...) with the same seed and block size.
+
+        :param pandas.DataFrame df: the input DataFrame to be considered.
+        :param int numberOfSamples: the total number of samples to be generated (number of rows).
+        :param str probDistribution: a string defining the probability distribution to be used. For instance "truncnorm".
+        :param int seed: the seed from which every random stream is derived. If not provided, fresh entropy from the OS is used.
+        :param int workers: the number of processes among which the blocks of samples are split. 'None' uses every available core.
+        :param int blockSize: the number of samples of every yielded block. Defaults to Sampling._samplesPerBlock.
+        :returns Iterator[pandas.DataFrame]:
+        """
+
+        Sampling._checkProbDistribution(probDistribution)
+
+        df = Sampling._getRowsByYear(df)
+        means, stds = Sampling._getMeanAndStdForAxis(df, 1)
+        return Sampling._iterSamples_truncnorm(df, numberOfSamples, means, stds, seed, workers, blockSize)
+
+    @staticmethod
+    @instrumented()
+    def samplesToCSV(df: pd.DataFrame, fileName: str, numberOfSamples: int = None, probDistribution: str = None, seed: int = None, workers: int = 1, blockSize: int = None, **kwargs) -> str:
+        """Generates the samples block by block (see iterSamples(...)) and appends every block to a CSV file as soon as it is ready.
+
+        :param pandas.DataFrame df: the input DataFrame to be considered.
+        :param str fileName: the path of the CSV file to be written. It is overwritten if it already exists.
+        :param int numberOfSamples: the total number of samples to be generated (number of rows).
+        :param str probDistribution: a string defining the probability distribution to be used. For instance "truncnorm".
+        :param int seed: the seed from which every random stream is derived. If not provided, fresh entropy from the OS is used.
+        :param int workers: the number of processes among which the blocks of samples are split. 'None' uses every available core.
+        :param int blockSize: the number of samples kept in memory at once. Defaults to Sampling._samplesPerBlock.
+        :param *optional* ``kwargs``: keyword arguments to pass on to pandas.DataFrame.to_csv.
+        :returns str: the name of the written file.
+        """
+
+        firstBlock: bool = True
+        for block in Sampling.iterSamples(df, numberOfSamples, probDistribution, seed, workers, blockSize):
+            block.to_csv(fileName, mode = "w" if firstBlock else "a", header = firstBlock, **kwargs)
+            firstBlock = False
+
+        return fileName
         
 
 class ProbDistributions:
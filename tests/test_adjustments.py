@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthDataGen.adjustments import FactorByYear, FactorTable, ChangeResolution
+
+@pytest.fixture
+def yearsDF() -> pd.DataFrame:
+    index = pd.date_range("2023-01-30", periods = 24 * 60, freq = "H", name = "datetime")
+    values: np.ndarray = np.random.default_rng(1).gamma(2.0, 3.0, (len(index), 5))
+
+    return pd.DataFrame(values, index = index, columns = [str(year) for year in range(2018, 2023)])
+
+def adjustByYearLoop(df: pd.DataFrame, adjustmentsDict: dict) -> pd.DataFrame:
+    """FactorByYear.run(...) as it used to be: a multiplication per adjusted column."""
+    df = df.copy()
+    for column in df.columns:
+        year: int = int(column[-1] if isinstance(column, tuple) else column)
+        if year in adjustmentsDict:
+            df[column] = df[column] * (1 + adjustmentsDict[year] / 100)
+
+    return df
+
+def test_factorByYearMatchesTheColumnLoop(yearsDF):
+    adjustmentsDict = {2019: 10, 2020: -32.0, 2022: 347.89, 2030: 5}
+    expected: pd.DataFrame = adjustByYearLoop(yearsDF, adjustmentsDict)
+
+    pd.testing.assert_frame_equal(FactorByYear.run(yearsDF.copy(), adjustmentsDict), expected, rtol = 1e-15)
+    pd.testing.assert_frame_equal(FactorTable.apply(yearsDF, yearFactors = FactorTable.fromPercentages(adjustmentsDict)), expected, rtol = 1e-15)
+
+def test_factorByYearWithSeveralVariables(yearsDF):
+    df: pd.DataFrame = pd.concat({"windspeed": yearsDF, "temp": yearsDF * 2}, axis = 1, names = ["variable", "year"])
+    adjustmentsDict = {2018: 5, 2021: -10}
+
+    pd.testing.assert_frame_equal(FactorByYear.run(df.copy(), adjustmentsDict), adjustByYearLoop(df, adjustmentsDict), rtol = 1e-15)
+
+def test_factorTableMatchesARowByRowProduct(yearsDF):
+    yearFactors = {2019: 1.1, 2022: 0.9}
+    monthFactors = {1: 1.2, 3: 0.7}
+    hourFactors = {0: 1.5, 12: 1.05, 23: 0.5}
+
+    expected: pd.DataFrame = yearsDF.copy()
+    for position, timestamp in enumerate(yearsDF.index):
+        rowFactor: float = monthFactors.get(timestamp.month, 1) * hourFactors.get(timestamp.hour, 1)
+        for column in yearsDF.columns:
+            expected.iloc[position, expected.columns.get_loc(column)] *= rowFactor * yearFactors.get(int(column), 1)
+
+    applied: pd.DataFrame = FactorTable.apply(yearsDF, yearFactors, monthFactors, hourFactors)
+    pd.testing.assert_frame_equal(applied, expected, rtol = 1e-14)
+
+    # The parsed labels are reused by later calls on the same Index objects
+    pd.testing.assert_frame_equal(FactorTable.apply(yearsDF, yearFactors, monthFactors, hourFactors), applied)
+
+def test_factorTableInplace(yearsDF):
+    original: pd.DataFrame = yearsDF.copy()
+
+    copied: pd.DataFrame = FactorTable.apply(yearsDF, yearFactors = {2020: 2.0})
+    pd.testing.assert_frame_equal(yearsDF, original)
+
+    assert FactorTable.apply(yearsDF, yearFactors = {2020: 2.0}, inplace = True) is yearsDF
+    pd.testing.assert_frame_equal(yearsDF, copied)
+
+def test_rowFactorsNeedADatetimeIndex(yearsDF):
+    with pytest.raises(ValueError):
+        FactorTable.apply(yearsDF.reset_index(drop = True), monthFactors = {1: 1.1})
+
+def test_notContiguousYearsRaise(yearsDF):
+    with pytest.raises(ValueError):
+        FactorByYear.run(yearsDF.drop(columns = "2020"), {2019: 10})
+
+@pytest.mark.parametrize("method, order", [("polynomial", 1), ("polynomial", 2), ("polynomial", 3), ("spline", 2), ("spline", 3)])
+@pytest.mark.parametrize("frequency", ["15T", "20T", "1H"])
+def test_directUpsamplingMatchesThePandasEngine(yearsDF, method, order, frequency):
+    df: pd.DataFrame = yearsDF.iloc[:24 * 4]
+
+    direct: pd.DataFrame = ChangeResolution.upsample(df, frequency, method, order = order)
+    pandas: pd.DataFrame = ChangeResolution.upsample(df, frequency, method, engine = "pandas", order = order)
+
+    pd.testing.assert_frame_equal(direct, pandas, check_freq = False, rtol = 1e-9, atol = 1e-9)
+    pd.testing.assert_frame_equal(direct.loc[df.index], df, check_freq = False)
+
+def test_directUpsamplingInBlocks(yearsDF):
+    from synthDataGen.common.bibliotecaGeneral import resampleaDataFrameDirecto
+
+    df: pd.DataFrame = yearsDF.iloc[:24 * 4]
+    for method in ["polynomial", "spline"]:
+        pd.testing.assert_frame_equal(resampleaDataFrameDirecto(df, "5T", method, 3, tamagnoBloque = 7),
+                                      resampleaDataFrameDirecto(df, "5T", method, 3), check_freq = False, rtol = 1e-12)
+
+def test_upsamplingToACoarserFrequencyRaises(yearsDF):
+    with pytest.raises(ValueError):
+        ChangeResolution.upsample(yearsDF, "2H", "polynomial", order = 2)
+
+def downsampleManyWithPandas(df: pd.DataFrame, frequency: str, aggregations: list) -> pd.DataFrame:
+    resampler = df.resample(frequency)
+    frames = {"q" + str(aggregation) if isinstance(aggregation, float) else aggregation: resampler.quantile(aggregation) if isinstance(aggregation, float) else resampler.agg(aggregation)
+              for aggregation in aggregations}
+
+    return pd.concat(frames, axis = 1).swaplevel(0, -1, axis = 1)[pd.MultiIndex.from_product([df.columns, frames.keys()])].astype(float)
+
+aggregations = ["count", "sum", "mean", "min", "max", "std", "var", "median", 0.1, 0.95]
+
+@pytest.fixture
+def quarterHourlyDF() -> pd.DataFrame:
+    """Starting mid-day and with missing values, so that the first and last bins are partial."""
+    index = pd.date_range("2023-03-01 07:45", periods = 4 * 24 * 20 + 5, freq = "15T", name = "datetime")
+    values: np.ndarray = np.random.default_rng(2).normal(10, 3, (len(index), 3))
+    values[np.random.default_rng(3).random(values.shape) < 0.05] = np.nan
+    values[100:200, 1] = np.nan
+
+    return pd.DataFrame(values, index = index, columns = ["2021", "2022", "2023"])
+
+def test_downsampleManyMatchesResampleAgg(quarterHourlyDF):
+    frequencies = ["2H", "1H", "1D", "6H", "7D", "45T"]
+    results = ChangeResolution.downsampleMany(quarterHourlyDF, frequencies, aggregations)
+
+    assert list(results.keys()) == frequencies
+    for frequency in frequencies:
+        pd.testing.assert_frame_equal(results[frequency], downsampleManyWithPandas(quarterHourlyDF, frequency, aggregations),
+                                      check_freq = False, check_names = False, rtol = 1e-9, atol = 1e-9)
+
+def test_downsampleManyOnIrregularData(quarterHourlyDF):
+    irregular: pd.DataFrame = quarterHourlyDF.drop(quarterHourlyDF.index[[3, 50, 51, 700]])
+    results = ChangeResolution.downsampleMany(irregular, ["1H", "1D"], aggregations)
+
+    for frequency in ["1H", "1D"]:
+        pd.testing.assert_frame_equal(results[frequency], downsampleManyWithPandas(irregular, frequency, aggregations),
+                                      check_freq = False, check_names = False, rtol = 1e-9, atol = 1e-9)
+
+def test_downsampleManyWithSeveralVariables(quarterHourlyDF):
+    df: pd.DataFrame = pd.concat({"windspeed": quarterHourlyDF, "temp": quarterHourlyDF * 2}, axis = 1, names = ["variable", "year"])
+    result: pd.DataFrame = ChangeResolution.downsampleMany(df, ["1D"], ["mean", 0.5])["1D"]
+
+    assert list(result.columns[:2]) == [("windspeed", "2021", "mean"), ("windspeed", "2021", "q0.5")]
+    np.testing.assert_allclose(result[("temp", "2022", "mean")], 2 * result[("windspeed", "2022", "mean")])
+
+def test_downsampleMatchesResampleAgg(quarterHourlyDF):
+    pd.testing.assert_frame_equal(ChangeResolution.downsample(quarterHourlyDF, "2H", "mean"), quarterHourlyDF.resample("2H").mean())
+
+def test_downsampleManyWithUnknownAggregationRaises(quarterHourlyDF):
+    with pytest.raises(ValueError):
+        ChangeResolution.downsampleMany(quarterHourlyDF, ["1H"], ["mode"])
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthDataGen.common import bibliotecaEsios
+from synthDataGen.common.almacenEsios import AlmacenEsios
+from synthDataGen.common.cacheEsios import CacheEsios
+from synthDataGen.common.stubEsios import ServidorEsiosSimulado
+
+@pytest.fixture
+def servidor():
+    with ServidorEsiosSimulado(token = "token") as servidor:
+        yield servidor
+
+def test_creationDoesNotDownloadTheCatalog(servidor):
+    bajada = bibliotecaEsios.BajadaDatosESIOS("token", servidor.end_point)
+    assert servidor.estadisticas["peticiones"] == 0
+
+    assert len(bajada.data_frame_catalogo_items) > 0
+    assert servidor.estadisticas["peticiones"] == 1
+
+def test_validaTokenMakesASingleSmallRequest(servidor):
+    bibliotecaEsios.BajadaDatosESIOS("token", servidor.end_point, valida_token = True)
+    assert servidor.estadisticas["peticiones"] == 1 and servidor.estadisticas["valores"] <= 1
+
+    with pytest.raises(RuntimeError):
+        bibliotecaEsios.BajadaDatosESIOS("otro", servidor.end_point, valida_token = True)
+
+def test_decodificaValoresMapsMissingAndNullFields():
+    indicador = {"id": 600, "name": "Precio", "short_name": "PVPC",
+                 "values": [{"value": 1.5, "datetime": "2020-01-01T01:00:00.000+01:00", "datetime_utc": "2020-01-01T00:00:00Z",
+                             "tz_time": "2020-01-01T00:00:00.000Z", "geo_id": None, "geo_name": None},
+                            {"value": None, "datetime_utc": "2020-01-01T01:00:00.000Z"}]}
+    df = bibliotecaEsios.decodifica_valores(indicador)
+
+    assert list(df.columns) == bibliotecaEsios.COLUMNAS_DECODIFICADAS
+    assert df["geo_id"].tolist() == [-1, -1] and df["geo_id"].dtype == np.int64
+    assert df["value"].iloc[0] == 1.5 and np.isnan(df["value"].iloc[1])
+    assert df["datetime_utc"].tolist() == [pd.Timestamp("2020-01-01 00:00"), pd.Timestamp("2020-01-01 01:00")]
+    assert df["name"].tolist() == ["Precio", "Precio"] and df["short_name"].tolist() == ["PVPC", "PVPC"]
+
+    assert list(bibliotecaEsios.decodifica_valores({"id": 600}).dtypes) == list(df.dtypes)
+
+def test_dataframeKeepsTheColumnsOfTheResponse(servidor, tmp_path):
+    fecha_inicio, fecha_fin = datetime(2022, 12, 31, 20), datetime(2023, 1, 2, 3)
+    inicio, fin = bibliotecaEsios.fechas_peninsulares(fecha_inicio, fecha_fin)
+    respuesta = bibliotecaEsios.peticion_json(f"{servidor.end_point}/10211?start_date={inicio}&end_date={fin}&time_trunc=hour",
+                                              {"x-api-key": "token"})
+
+    # Lo que devolvía la versión con json_normalize, sin la columna auxiliar datetime_utc_norm
+    esperado = pd.json_normalize(data = respuesta["indicator"], record_path = ["values"], meta = ["id", "name", "short_name"])
+    esperado["datetime_utc"] = pd.to_datetime(esperado["datetime_utc"]).dt.tz_localize(None)
+    esperado.index = pd.DatetimeIndex(esperado["datetime_utc"], name = "datetime_utc")
+    esperado = esperado[(esperado.index >= fecha_inicio) & (esperado.index <= fecha_fin)]
+
+    for cache in [None, CacheEsios(str(tmp_path / "cache")), CacheEsios(str(tmp_path / "cache"))]:
+        bajada = bibliotecaEsios.BajadaDatosESIOS("token", servidor.end_point, cache = cache)
+        df = bajada.dataframe_lista_de_indicadores_de_esios_por_fechas([10211], fecha_inicio, fecha_fin, True, time_trunc = "hour")
+        pd.testing.assert_frame_equal(df, esperado[bibliotecaEsios.COLUMNAS_DECODIFICADAS], check_dtype = False)
+
+def test_nullGeoIdInTheResponse(servidor, monkeypatch):
+    decodifica = bibliotecaEsios.decodifica_valores
+
+    def sin_geo_id(indicador_json):
+        for registro in indicador_json["values"]:
+            registro["geo_id"] = None
+        return decodifica(indicador_json)
+
+    monkeypatch.setattr(bibliotecaEsios, "decodifica_valores", sin_geo_id)
+    bajada = bibliotecaEsios.BajadaDatosESIOS("token", servidor.end_point)
+    df = bajada.dataframe_lista_de_indicadores_de_esios_por_fechas([10211], datetime(2023, 1, 1), datetime(2023, 1, 1, 5), True, time_trunc = "hour")
+
+    assert len(df) == 6 and (df["geo_id"] == -1).all()
+
+def test_rowsFromTheAlmacenKeepTheSameColumns(servidor, tmp_path):
+    almacen = AlmacenEsios(str(tmp_path / "almacen"))
+    bajada = bibliotecaEsios.BajadaDatosESIOS("token", servidor.end_point, almacen = almacen)
+    almacen.sincroniza(bajada, 10211, "hour", desde = datetime(2023, 1, 1), hasta = datetime(2023, 1, 1, 23))
+
+    df = bajada.dataframe_lista_de_indicadores_de_esios_por_fechas([10211], datetime(2023, 1, 1, 12), datetime(2023, 1, 2, 12), True, time_trunc = "hour")
+
+    assert list(df.columns) == bibliotecaEsios.COLUMNAS_DECODIFICADAS
+    assert len(df) == 25 and df.index.is_monotonic_increasing
+    assert df.loc[:"2023-01-01 23:00", "name"].isna().all() and df.loc["2023-01-02":, "name"].notna().all()
+    assert df["value"].notna().all() and df["id"].eq(10211).all()
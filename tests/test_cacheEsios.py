@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime
+
+from synthDataGen.common.cacheEsios import CacheEsios
+
+def test_guardaAndLeeRoundTripEveryColumnType(tmp_path):
+    cache = CacheEsios(str(tmp_path))
+    df = pd.DataFrame({"value": [1.5, np.nan, 3.0],
+                       "datetime_utc": pd.to_datetime(["2020-01-01 00:00", "2020-01-01 01:00", "2020-01-01 02:00"]),
+                       "geo_id": np.array([3, -1, 8], dtype = np.int64),
+                       "name": ["Demanda", None, "Demanda"],
+                       "geo_name": ["España", "Portugal", np.nan],
+                       "description": ["a", "b", "c"]})
+
+    clave: str = cache.clave(1, datetime(2020, 1, 1), datetime(2020, 1, 2), "hour")
+    cache.guarda(clave, df)
+    leido: pd.DataFrame = cache.lee(clave, datetime(2020, 1, 2))
+
+    pd.testing.assert_frame_equal(leido, df)
+    assert leido.loc[1, "name"] is None
+    assert isinstance(leido.loc[2, "geo_name"], float) and np.isnan(leido.loc[2, "geo_name"])
+
+def test_recentEntriesExpireAndOfflineModeServesThem(tmp_path):
+    df = pd.DataFrame({"value": [1.0]})
+    clave: str = "reciente"
+    CacheEsios(str(tmp_path)).guarda(clave, df)
+
+    assert CacheEsios(str(tmp_path), ttl_horas = 0).lee(clave, datetime.now()) is None
+    pd.testing.assert_frame_equal(CacheEsios(str(tmp_path), ttl_horas = 0, fuera_de_linea = True).lee(clave, datetime.now()), df)
+
+    with pytest.raises(RuntimeError):
+        CacheEsios(str(tmp_path), fuera_de_linea = True).lee("inexistente")
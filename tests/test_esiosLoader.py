@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthDataGen.controller import ESIOSLoader
+from synthDataGen.common.stubEsios import ServidorEsiosSimulado
+
+@pytest.fixture(scope = "module")
+def servidor():
+    with ServidorEsiosSimulado(zonas = {600: [(3, "España"), (1, "Portugal")]}) as servidor:
+        yield servidor
+
+def writeParams(tmp_path, servidor, **params) -> str:
+    esiosParams = {"keysFileDir": "settings/", "keysFileName": "ficheroDeClaves.json", "indicador": 10211, "time_trunc": "hour",
+                   "endPoint": servidor.end_point, "maxWorkers": 1, "cacheDir": None, "fetchStrategy": "perYear", **params}
+
+    fileName = tmp_path / "params.json"
+    fileName.write_text(json.dumps({"ESIOS_params": esiosParams}))
+    return str(fileName)
+
+@pytest.mark.parametrize("workers", [1, None])
+def test_strategiesGiveTheSameFrameOffTheTimeTruncGrid(tmp_path, servidor, workers):
+    frames = {}
+    for strategy in ["perYear", "coalesced", "auto"]:
+        loader = ESIOSLoader(writeParams(tmp_path, servidor, time_trunc = "five_minutes", fetchStrategy = strategy, maxWorkers = workers))
+        frames[strategy] = loader.getDataFromSource(datetime.now().year - 2, datetime(datetime.now().year, 3, 10, 10, 2), 1000, False)
+
+    assert len(frames["perYear"]) == 12000
+    pd.testing.assert_frame_equal(frames["perYear"], frames["coalesced"])
+    pd.testing.assert_frame_equal(frames["perYear"], frames["auto"])
+
+def test_severalIndicatorsWithSeveralGeoIds(tmp_path, servidor):
+    window = (datetime.now().year - 2, datetime(datetime.now().year, 3, 1), 24)
+
+    with pytest.raises(Exception, match = "geoId"):
+        ESIOSLoader(writeParams(tmp_path, servidor, indicador = [10211, 600])).getDataFromSource(*window, False)
+
+    df: pd.DataFrame = ESIOSLoader(writeParams(tmp_path, servidor, indicador = [10211, 600], geoId = 3)).getDataFromSource(*window, False)
+    assert df.shape == (25, 4) and not df.isna().any().any()
+
+    portugal: pd.DataFrame = ESIOSLoader(writeParams(tmp_path, servidor, indicador = 600, geoId = 1)).getDataFromSource(*window, False)
+    spain: pd.DataFrame = ESIOSLoader(writeParams(tmp_path, servidor, indicador = 600, geoId = 3)).getDataFromSource(*window, False)
+    np.testing.assert_allclose((portugal - spain).to_numpy(), 1)
@@ -0,0 +1,158 @@
+import os
+import json
+import functools
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthDataGen.controller import LocalDFLoader
+
+def writeCSV(fileName, dates: pd.DatetimeIndex, datetimeFormat: str = "%Y-%m-%dT%H:%M:%S", seed: int = 0) -> str:
+    values: np.ndarray = np.random.default_rng(seed).gamma(2.0, 3.0, (len(dates), 2))
+    pd.DataFrame({"datetime": dates.strftime(datetimeFormat), "windspeed": values[:, 0], "temp": values[:, 1]}).to_csv(fileName)
+    return str(fileName)
+
+def writeParams(paramsDir, csvFile: str, **params) -> str:
+    localDFParams = {"dataFrameDir": os.path.dirname(csvFile), "dataframeFileName": os.path.basename(csvFile), "columnToAnalyze": "windspeed",
+                     "skipFirstColumn": True, "datetimeColumnName": "datetime", "datetimeFormat": "%Y-%m-%dT%H:%M:%S", **params}
+
+    fileName: str = os.path.join(str(paramsDir), "params.json")
+    with open(fileName, "w") as jsonFile:
+        json.dump({"localDF_params": localDFParams}, jsonFile)
+    return fileName
+
+@functools.lru_cache
+def getLoader(csvFile: str, datetimeFormat: str = "%Y-%m-%dT%H:%M:%S", chunkSize: int = 200000) -> LocalDFLoader:
+    """One loader per file and parameters, so that every file is read only once."""
+    paramsDir: str = os.path.join(os.path.dirname(csvFile), "params" + str(chunkSize))
+    os.makedirs(paramsDir, exist_ok = True)
+
+    return LocalDFLoader(writeParams(paramsDir, csvFile, datetimeFormat = datetimeFormat, chunkSize = chunkSize))
+
+@pytest.fixture(scope = "module")
+def hourlyCSV(tmp_path_factory) -> str:
+    return writeCSV(tmp_path_factory.mktemp("hourly") / "data.csv", pd.date_range("2015-01-01", "2023-12-31 23:00", freq = "H"))
+
+@pytest.fixture(scope = "module")
+def timezoneAwareCSV(tmp_path_factory) -> str:
+    dates: pd.DatetimeIndex = pd.date_range("2015-01-01", "2023-12-31 23:00", freq = "H", tz = "UTC").tz_convert("Europe/Madrid")
+    return writeCSV(tmp_path_factory.mktemp("timezoneAware") / "data.csv", dates, "%Y-%m-%dT%H:%M:%S%z")
+
+@pytest.fixture(scope = "module")
+def irregularCSV(tmp_path_factory) -> str:
+    """Quarter-hourly data with a fifth of the rows missing and some datetimes repeated further on in the file, with other values."""
+    rng = np.random.default_rng(4)
+    dates: pd.DatetimeIndex = pd.date_range("2017-01-01", "2023-12-31 23:45", freq = "15T")
+    dates = dates[rng.random(len(dates)) > 0.2]
+    duplicated: pd.DatetimeIndex = dates[rng.random(len(dates)) < 0.05]
+    dates = dates.append(duplicated)[np.argsort(np.concatenate([np.arange(len(dates)), rng.integers(0, len(dates), len(duplicated))]), kind = "stable")]
+
+    return writeCSV(tmp_path_factory.mktemp("irregular") / "data.csv", dates, seed = 5)
+
+@functools.lru_cache
+def oldEnginePivot(csvFile: str, datetimeFormat: str) -> pd.DataFrame:
+    df: pd.DataFrame = pd.read_csv(csvFile, index_col = 0)
+
+    # Wall-clock times, also when the offset changes along the file
+    dates: pd.Series = pd.to_datetime(df["datetime"].str[:19], format = "%Y-%m-%dT%H:%M:%S") if "%z" in datetimeFormat else \
+                       pd.to_datetime(df["datetime"], format = datetimeFormat)
+
+    series = pd.Series(df["windspeed"].to_numpy(), index = dates)
+    series = series[~series.index.duplicated(keep = "first")]
+
+    return pd.Series(series.to_numpy(), index = [series.index.strftime("%m-%d %H:%M:%S"), series.index.year]).unstack()
+
+def oldEngineWindow(csvFile: str, datetimeFormat: str, initialYear: int, initDatetime: datetime, hoursAhead: int, include29February: bool) -> pd.DataFrame:
+    """The pandas engine LocalDFLoader used to have (drop duplicated datetimes, pivot the "%m-%d %H:%M:%S" rows by year and filter the
+    hours ahead), extended with the current semantics: rows labelled in the year of initDatetime, every year column continuing in the
+    following year once the window crosses the end of the year, and February 29th only in leap years."""
+    pivoted: pd.DataFrame = oldEnginePivot(csvFile, datetimeFormat)
+    years: List[int] = [year for year in pivoted.columns if year >= initialYear]
+
+    labels: List[pd.Timestamp] = []
+    hour: pd.Timestamp = pd.Timestamp(initDatetime)
+    while len(labels) <= hoursAhead:
+        if not (hour.month == 2 and hour.day == 29 and not include29February):
+            labels.append(hour)
+        hour += pd.Timedelta(hours = 1)
+
+    rows: List[List[float]] = []
+    index: List[pd.Timestamp] = []
+    for label in labels:
+        key: str = label.strftime("%m-%d %H:%M:%S")
+        if key not in pivoted.index:
+            continue
+
+        crossed: int = label.year - initDatetime.year
+        rows.append([pivoted.at[key, year + crossed] if year + crossed in pivoted.columns else np.nan for year in years])
+        index.append(label)
+
+    return pd.DataFrame(rows, index = pd.DatetimeIndex(index, name = "datetime"), columns = [str(year) for year in years])
+
+def assertSameWindow(loaded: pd.DataFrame, expected: pd.DataFrame):
+    assert loaded.index.is_unique and loaded.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(loaded, expected, check_freq = False, check_names = False)
+
+windows = [pytest.param(2016, datetime(2023, 3, 1, 5), 48, False, id = "plain"),
+           pytest.param(2016, datetime(2022, 12, 29, 12), 24 * 6, False, id = "wrap"),
+           pytest.param(2016, datetime(2023, 6, 1), 24 * 400, False, id = "longWrap"),
+           pytest.param(2016, datetime(2024, 2, 27, 20), 24 * 3, True, id = "february29Leap"),
+           pytest.param(2016, datetime(2024, 2, 27, 20), 24 * 3, False, id = "february29LeapExcluded"),
+           pytest.param(2016, datetime(2023, 2, 27, 20), 24 * 3, True, id = "february29NonLeap"),
+           pytest.param(2016, datetime(2023, 2, 28, 20), 10, True, id = "february29NonLeapShort"),
+           pytest.param(2015, datetime(2023, 12, 30), 24 * 70, True, id = "wrapIntoLeapYear")]
+
+@pytest.mark.parametrize("initialYear, initDatetime, hoursAhead, include29February", windows)
+def test_windowsMatchTheOldEngine(hourlyCSV, initialYear, initDatetime, hoursAhead, include29February):
+    loaded: pd.DataFrame = getLoader(hourlyCSV).getDataFromSource(initialYear, initDatetime, hoursAhead, include29February)
+
+    assertSameWindow(loaded, oldEngineWindow(hourlyCSV, "%Y-%m-%dT%H:%M:%S", initialYear, initDatetime, hoursAhead, include29February))
+    assert len(loaded) == hoursAhead + 1
+
+def test_getDataForWindowsMatchesSingleWindows(hourlyCSV):
+    requested = [(window.values[1], window.values[2]) for window in windows if not window.values[3]]
+
+    for loaded, (initDatetime, hoursAhead) in zip(getLoader(hourlyCSV).getDataForWindows(2016, requested, False), requested):
+        pd.testing.assert_frame_equal(loaded, getLoader(hourlyCSV).getDataFromSource(2016, initDatetime, hoursAhead, False))
+
+def test_february29WindowCanBeUpsampled(hourlyCSV):
+    from synthDataGen.adjustments import ChangeResolution
+
+    df: pd.DataFrame = getLoader(hourlyCSV).getDataFromSource(2016, datetime(2023, 2, 28, 20), 10, True)
+    assert ChangeResolution.upsample(df, "15T", "polynomial", order = 1).shape == (41, len(df.columns))
+
+@pytest.mark.parametrize("initialYear, initDatetime, hoursAhead, include29February", [windows[0], windows[1], windows[3], windows[5]])
+def test_timezoneAwareCSV(timezoneAwareCSV, initialYear, initDatetime, hoursAhead, include29February):
+    datetimeFormat: str = "%Y-%m-%dT%H:%M:%S%z"
+    loaded: pd.DataFrame = getLoader(timezoneAwareCSV, datetimeFormat).getDataFromSource(initialYear, initDatetime, hoursAhead, include29February)
+
+    assertSameWindow(loaded, oldEngineWindow(timezoneAwareCSV, datetimeFormat, initialYear, initDatetime, hoursAhead, include29February))
+
+@pytest.mark.parametrize("chunkSize", [7000, 200000])
+@pytest.mark.parametrize("initialYear, initDatetime, hoursAhead, include29February", [windows[0], windows[2], windows[3], windows[5]])
+def test_irregularQuarterHourlyCSVWithDuplicates(irregularCSV, chunkSize, initialYear, initDatetime, hoursAhead, include29February):
+    loaded: pd.DataFrame = getLoader(irregularCSV, chunkSize = chunkSize).getDataFromSource(initialYear, initDatetime, hoursAhead, include29February)
+
+    assertSameWindow(loaded, oldEngineWindow(irregularCSV, "%Y-%m-%dT%H:%M:%S", initialYear, initDatetime, hoursAhead, include29February))
+
+def test_cacheIsOptInAndNeverWritesNextToTheSource(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    dataDir = tmp_path / "data"
+    dataDir.mkdir()
+    csvFile: str = writeCSV(dataDir / "data.csv", pd.date_range("2020-01-01", "2023-12-31 23:00", freq = "H"))
+    window = (2020, datetime(2023, 3, 1), 24, False)
+
+    uncached: pd.DataFrame = LocalDFLoader(writeParams(tmp_path, csvFile)).getDataFromSource(*window)
+    assert not (tmp_path / "home").exists()
+
+    loader = LocalDFLoader(writeParams(tmp_path, csvFile, useCache = True))
+    assert loader.cacheDir == os.path.join(str(tmp_path / "home"), ".cache", "synthDataGen", "localDF")
+
+    pd.testing.assert_frame_equal(loader.getDataFromSource(*window), uncached)
+    assert len(os.listdir(loader.cacheDir)) > 0
+    pd.testing.assert_frame_equal(LocalDFLoader(writeParams(tmp_path, csvFile, useCache = True)).getDataFromSource(*window), uncached)
+
+    assert os.listdir(dataDir) == ["data.csv"]
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from synthDataGen.utils import Sampling
+
+@pytest.fixture
+def yearsDF() -> pd.DataFrame:
+    index = pd.date_range("2023-03-01", periods = 48, freq = "H", name = "datetime")
+    values: np.ndarray = np.random.default_rng(7).gamma(2.0, 3.0, (len(index), 6))
+    values[5] = 4.0      # A row without dispersion
+
+    return pd.DataFrame(values, index = index, columns = [str(year) for year in range(2017, 2023)])
+
+def test_drawTruncnormMatchesScipyInverseCDF(yearsDF):
+    means, stds = Sampling._getMeanAndStdForAxis(yearsDF, 1)
+    params = Sampling._getTruncnormParams(means, stds)
+    a, b, mus, scales, degenerated = params
+
+    seedSequence = np.random.SeedSequence(3)
+    samples: np.ndarray = Sampling._drawTruncnormBlock(500, params, seedSequence)
+    uniforms: np.ndarray = np.random.default_rng(seedSequence).random((500, len(mus)))
+
+    expected: np.ndarray = stats.truncnorm.ppf(uniforms, a, b, loc = mus, scale = scales)
+    expected[:, degenerated] = mus[degenerated]
+
+    np.testing.assert_allclose(samples, expected, rtol = 1e-9, atol = 1e-9)
+
+def test_samplesFollowTruncnorm(yearsDF):
+    samples: pd.DataFrame = Sampling.getSamples(yearsDF, 20000, "truncnorm", seed = 11)
+    mean, std = yearsDF.iloc[0].mean(), yearsDF.iloc[0].std(ddof = 0)
+
+    column: np.ndarray = samples.iloc[:, 0].to_numpy()
+    assert column.min() >= 0 and column.max() <= mean + 2 * std
+    assert stats.kstest(column, stats.truncnorm((0 - mean) / std, 2, loc = mean, scale = std).cdf).pvalue > 0.001
+
+    assert (samples.iloc[:, 5] == 4.0).all()
+
+def test_sameSeedGivesSameSamplesWhateverTheWorkers(yearsDF):
+    serial: pd.DataFrame = Sampling.getSamples(yearsDF, 3000, "truncnorm", seed = 5, workers = 1, blockSize = 512)
+    parallel: pd.DataFrame = Sampling.getSamples(yearsDF, 3000, "truncnorm", seed = 5, workers = 2, blockSize = 512)
+
+    pd.testing.assert_frame_equal(serial, parallel, check_exact = True)
+    assert not serial.equals(Sampling.getSamples(yearsDF, 3000, "truncnorm", seed = 6, workers = 1, blockSize = 512))
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iterSamplesConcatenatesToGetSamples(yearsDF, workers):
+    samples: pd.DataFrame = Sampling.getSamples(yearsDF, 2500, "truncnorm", seed = 9, blockSize = 1000)
+    blocks = list(Sampling.iterSamples(yearsDF, 2500, "truncnorm", seed = 9, workers = workers, blockSize = 1000))
+
+    assert [len(block) for block in blocks] == [1000, 1000, 500]
+    pd.testing.assert_frame_equal(pd.concat(blocks), samples, check_exact = True, check_index_type = False)
+
+def test_samplesToCSVWritesTheSameSamples(yearsDF, tmp_path):
+    fileName: str = Sampling.samplesToCSV(yearsDF, str(tmp_path / "samples.csv"), 1500, "truncnorm", seed = 2, blockSize = 400)
+    samples: pd.DataFrame = Sampling.getSamples(yearsDF, 1500, "truncnorm", seed = 2, blockSize = 400)
+
+    written: pd.DataFrame = pd.read_csv(fileName, index_col = 0, float_precision = "round_trip")
+    np.testing.assert_array_equal(written.to_numpy(), samples.to_numpy())
+
+def test_severalVariablesAreSampledPerVariableAndDatetime(yearsDF):
+    df: pd.DataFrame = pd.concat({"windspeed": yearsDF, "temp": yearsDF * 2}, axis = 1, names = ["variable", "year"])
+    samples: pd.DataFrame = Sampling.getSamples(df, 100, "truncnorm", seed = 1)
+
+    assert samples.shape == (100, 2 * len(yearsDF))
+    assert list(samples.columns.get_level_values(0).unique()) == ["windspeed", "temp"]
+
+def test_unknownDistributionRaises(yearsDF):
+    with pytest.raises(ValueError):
+        Sampling.getSamples(yearsDF, 10, "normal")